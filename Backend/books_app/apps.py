@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
 
 
 class BooksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'books_app'
+
+    def ready(self):
+        # Импорт регистрирует обработчики сигналов
+        from books_app import signals, sqlite
+        # Импорт регистрирует обработчики фоновых задач (@jobs.register)
+        from books_app import tasks  # noqa: F401
+        post_migrate.connect(signals.create_search_index, sender=self)
+        connection_created.connect(sqlite.configure_connection)
@@ -0,0 +1,191 @@
+'''
+Асинхронные версии нагруженных на чтение view для запуска под ASGI (settings.ASYNC_VIEWS).
+Выборки делаются через асинхронный ORM Django; то, что требует транзакций
+(оценка, вставка комментария в MPTT-дерево), и отрисовка шаблонов с ленивыми обращениями
+к БД (request.user в шапке) выполняются через sync_to_async.
+Поведение и шаблоны совпадают с синхронными view из books_app.views.
+'''
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, HttpRequest, HttpResponse, JsonResponse
+from django.shortcuts import redirect, render
+from django.urls import reverse
+from django.views import View
+
+from books_app import comments, response_cache
+from books_app.auth import get_visitor
+from books_app.forms import CommentCreateForm, RatingForm
+from books_app.models import Book, BookRate
+from books_app.pagination import InvalidCursor, build_page, default_ordering, page_link, page_query, page_size_from
+from books_app.search import search_books
+
+arender = sync_to_async(render)
+# Посетитель запроса (request.visitor): из кеша или одним запросом, синхронно
+request_visitor = sync_to_async(get_visitor)
+
+
+@sync_to_async
+def user_id(request: HttpRequest):
+    '''
+    pk авторизованного пользователя или None (request.user загружается лениво и синхронно)
+    '''
+    return request.user.pk if request.user.is_authenticated else None
+
+
+async def render_page(request: HttpRequest, queryset, context: dict) -> HttpResponse:
+    '''
+    Страница списка книг с курсорной пагинацией (как KeysetListMixin)
+    '''
+    try:
+        rows, state = page_query(
+            queryset,
+            default_ordering(queryset),
+            request.GET.get('cursor'),
+            page_size_from(request.GET, settings.BOOKS_PAGE_SIZE),
+        )
+    except InvalidCursor:
+        raise Http404('Invalid cursor')
+    page = build_page([book async for book in rows], state)
+    return await arender(request, 'books_app/books_list.html', {
+        **context,
+        'object_list': page.object_list,
+        'page_obj': page,
+        'is_paginated': False,
+        'cursor_page': page,
+        'next_page_query': page_link(request.GET, page.next_cursor),
+        'previous_page_query': page_link(request.GET, page.previous_cursor),
+    })
+
+
+class AsyncBookListView(View):
+    '''
+    Список книг с keyset-пагинацией (асинхронная версия BookListView)
+    '''
+    replica_reads = True
+    query_budget = 4
+
+    async def get(self, request: HttpRequest) -> HttpResponse:
+        if await user_id(request) is not None:
+            return await self.build(request)
+        return await response_cache.acached_response(
+            request, 'BookListView', (response_cache.CATALOGUE,), lambda: self.build(request),
+        )
+
+    async def build(self, request: HttpRequest) -> HttpResponse:
+        return await render_page(request, Book.custom.all(), {'title': 'Главная страница'})
+
+
+class AsyncBookDetailsView(View):
+    '''
+    Детальная информация о книге (асинхронная версия BookDetailsView)
+    '''
+    replica_reads = True
+    query_budget = 4
+
+    async def get(self, request: HttpRequest, pk: int) -> HttpResponse:
+        if await user_id(request) is not None:
+            return await self.build(request, pk)
+        return await response_cache.acached_response(
+            request, 'BookDetailsView', (response_cache.book_token(pk),), lambda: self.build(request, pk),
+        )
+
+    async def build(self, request: HttpRequest, pk: int, form=CommentCreateForm, status: int = 200) -> HttpResponse:
+        try:
+            book = await Book.custom.detail().aget(pk=pk)
+        except Book.DoesNotExist:
+            raise Http404('Book not found')
+        return await arender(request, 'books_app/book_details.html', {
+            'book': book,
+            'object': book,
+            'form': form,
+        }, status=status)
+
+
+class AsyncSearchResultsView(View):
+    '''
+    Поиск книг по индексу (асинхронная версия SearchResultsView)
+    '''
+    replica_reads = True
+    query_budget = 4
+
+    async def get(self, request: HttpRequest) -> HttpResponse:
+        return await render_page(request, search_books(Book.custom.all(), request.GET.get('do', '')), {})
+
+
+class AsyncRatingCreateView(View):
+    '''
+    Выставление оценки (асинхронная версия RatingCreateView)
+    '''
+    query_budget = 9
+
+    async def post(self, request: HttpRequest) -> HttpResponse:
+        current_user = await user_id(request)
+        if current_user is None:
+            return redirect(f"{settings.LOGIN_URL}?next={request.path}")
+        form = RatingForm(request.POST)
+        if not form.is_valid():
+            return JsonResponse({'error': form.error_message}, status=400)
+        book_id, rate = form.cleaned_data['book_id'], form.cleaned_data['rate']
+        visitor = await request_visitor(request)
+        if visitor is None:
+            raise Http404('No visitor profile')
+        try:
+            status, rating_avg = await sync_to_async(BookRate.toggle)(visitor.pk, book_id, rate)
+        except Book.DoesNotExist:
+            raise Http404('No such book')
+        return JsonResponse({'status': status,
+                             'rating_sum': rating_avg,
+                             })
+
+
+class AsyncCommentCreateView(View):
+    '''
+    Добавление комментария (асинхронная версия CommentCreateView)
+    '''
+    query_budget = 8
+
+    async def post(self, request: HttpRequest, pk: int) -> HttpResponse:
+        ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+        current_user = await user_id(request)
+        if current_user is None:
+            return JsonResponse({'error': 'Необходимо авторизоваться для добавления комментариев'}, status=400)
+
+        form = CommentCreateForm(request.POST)
+        if not form.is_valid():
+            if ajax:
+                return JsonResponse({'error': form.errors}, status=400)
+            # Как CommentCreateView: страница книги с ошибками формы
+            return await AsyncBookDetailsView().build(request, pk, form=form, status=400)
+
+        comment = form.save(commit=False)
+        comment.book_id = pk
+        visitor = await request_visitor(request)
+        if visitor is None:
+            raise Http404('No visitor profile')
+        comment.visitor = visitor
+        comment.parent_id = form.cleaned_data.get('parent')
+        await sync_to_async(comment.save)()
+
+        if ajax:
+            return JsonResponse(await sync_to_async(comments.as_json)(comment), status=200)
+        return redirect(reverse('books_app:book_details', kwargs={'pk': pk}))
+
+
+class AsyncCommentWindowView(View):
+    '''
+    Фрагмент следующего окна веток комментариев (асинхронная версия CommentWindowView)
+    '''
+    replica_reads = True
+    query_budget = 3
+
+    async def get(self, request: HttpRequest, pk: int) -> HttpResponse:
+        return await response_cache.acached_response(
+            request, 'CommentWindowView', (response_cache.book_token(pk),), lambda: self.build(request, pk),
+        )
+
+    async def build(self, request: HttpRequest, pk: int) -> HttpResponse:
+        try:
+            after = int(request.GET.get('after', 0))
+        except ValueError:
+            after = 0
+        return HttpResponse(await sync_to_async(comments.render_window)(pk, after))
@@ -0,0 +1,98 @@
+'''
+Пользователь и посетитель запроса без обращений к БД на каждый запрос.
+CachedModelBackend отдает пользователя сессии из кеша (проверка хеша пароля в сессии остается на месте -
+ее делает django.contrib.auth.get_user), VisitorMiddleware добавляет request.visitor - посетителя
+текущего пользователя, который загружается один раз на запрос и тоже кешируется.
+Записи сбрасываются сигналами при сохранении и удалении User и Visitor (books_app.signals), в том числе
+при смене пароля и деактивации через save(); изменения через QuerySet.update() сигналов не дают -
+после них нужно вызвать invalidate_user.
+С кешем locmem у каждого процесса свой кеш и сброс виден только в нем: остальные воркеры и run_jobs увидят
+смену пароля или деактивацию через AUTH_CACHE_TIMEOUT секунд, поэтому для locmem он по умолчанию короткий
+(15 секунд), а при нескольких процессах нужен общий кеш (DJANGO_CACHE_BACKEND=file).
+'''
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject
+
+CACHE_TIMEOUT = getattr(settings, 'AUTH_CACHE_TIMEOUT', 300)
+# Поля посетителя, которые нужны в запросе (имя в шапке, pk для оценок и комментариев);
+# счетчики активности меняются без save() и не кешируются
+VISITOR_FIELDS = ('pk', 'user_id', 'name', 'surname')
+
+
+def _user_key(user_id) -> str:
+    return f'auth:user:{user_id}'
+
+
+def _visitor_key(user_id) -> str:
+    return f'auth:visitor:{user_id}'
+
+
+def invalidate_user(user_id) -> None:
+    cache.delete_many([_user_key(user_id), _visitor_key(user_id)])
+
+
+def invalidate_visitor(user_id) -> None:
+    cache.delete(_visitor_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    '''
+    ModelBackend, который загружает пользователя сессии из кеша.
+    В кеше лежат поля пользователя без хеша пароля и хеш сессии (get_session_auth_hash), по которому
+    django.contrib.auth.get_user проверяет сессию. Пароль у такого пользователя отложенное поле:
+    обращение к нему читает его из БД, а save() не затирает его.
+    '''
+    def get_user(self, user_id):
+        key = _user_key(user_id)
+        data = cache.get(key)
+        if data is not None:
+            return self._from_cache(data)
+        user = super().get_user(user_id)
+        if user is not None:
+            data = {field.attname: getattr(user, field.attname)
+                    for field in user._meta.concrete_fields if field.attname != 'password'}
+            cache.set(key, (data, user.get_session_auth_hash()), CACHE_TIMEOUT)
+        return user
+
+    @staticmethod
+    def _from_cache(data):
+        fields, session_hash = data
+        user = get_user_model().from_db(DEFAULT_DB_ALIAS, list(fields), list(fields.values()))
+        user.get_session_auth_hash = lambda: session_hash
+        return user
+
+
+def get_visitor(request):
+    '''
+    Посетитель пользователя запроса или None (анонимный пользователь, пользователь без Visitor)
+    '''
+    from books_app.models import Visitor
+
+    if not hasattr(request, '_cached_visitor'):
+        user = request.user
+        visitor = None
+        if user.is_authenticated:
+            key = _visitor_key(user.pk)
+            visitor = cache.get(key)
+            if visitor is None:
+                visitor = Visitor.objects.filter(user_id=user.pk).only(*VISITOR_FIELDS).first()
+                if visitor is not None:
+                    cache.set(key, visitor, CACHE_TIMEOUT)
+            if visitor is not None:
+                visitor.user = user
+        request._cached_visitor = visitor
+    return request._cached_visitor
+
+
+class VisitorMiddleware(MiddlewareMixin):
+    '''
+    request.visitor - ленивый посетитель текущего пользователя (после AuthenticationMiddleware).
+    Для анонимного пользователя ложен: проверять нужно "if not request.visitor", а не "is None".
+    '''
+    def process_request(self, request):
+        request.visitor = SimpleLazyObject(lambda: get_visitor(request))
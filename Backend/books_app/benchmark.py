@@ -0,0 +1,116 @@
+'''
+Набор сценариев нагрузки на страницы и API каталога и сравнение результатов двух прогонов.
+Пути сценариев выбираются из текущей базы (случайные книги, глубокие страницы списка, слова из названий),
+поэтому прогоны на одном наборе данных (books_app.dataset) и с одним seed повторяемы.
+'''
+import random
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.db.models import Max, Min
+
+from books_app import loadtest
+from books_app.models import Author, Book, Comment
+from books_app.pagination import cursor_after, default_ordering
+
+# Метрики для сравнения: имя -> True, если больше - лучше
+COMPARED_METRICS = {'rps': True, 'p50_ms': False, 'p95_ms': False}
+
+
+def _sample_ids(queryset, count: int, rnd: random.Random) -> list:
+    '''
+    Случайные pk без ORDER BY RANDOM(): равномерно по диапазону pk с отбором существующих
+    '''
+    bounds = queryset.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return []
+    candidates = {rnd.randint(bounds['low'], bounds['high']) for _ in range(count * 4)}
+    existing = sorted(queryset.filter(pk__in=candidates).values_list('pk', flat=True))
+    rnd.shuffle(existing)
+    return existing[:count]
+
+
+def scenarios(sample: int = 50, seed: int = 42) -> dict:
+    '''
+    Сценарии {имя: [пути]}: HTML-страницы (html.*) и API (api.*)
+    '''
+    rnd = random.Random(seed)
+    books = Book.custom.all()
+    book_ids = _sample_ids(books, sample, rnd)
+    if not book_ids:
+        raise ValueError('The database has no books, generate a dataset first')
+    commented = list(Comment.objects.filter(level=0).values_list('book_id', flat=True).distinct()[:sample * 4])
+    commented = rnd.sample(commented, min(sample, len(commented)))
+    words = [name.split()[0] for name in Book.custom.filter(pk__in=book_ids).values_list('name', flat=True) if name]
+    ordering = default_ordering(books)
+    cursors = [cursor_after(book, ordering) for book in Book.custom.filter(pk__in=book_ids[:10])]
+    author_ids = _sample_ids(Author.objects.all(), sample, rnd)
+
+    result = {
+        'html.books_list': ['/books/'] + [f'/books/?cursor={cursor}' for cursor in cursors],
+        'html.book_details': [f'/books/{pk}/' for pk in book_ids],
+        'html.book_images': [f'/books/{pk}/images/' for pk in book_ids],
+        'html.search': [f'/books/search/?{urlencode({"do": word})}' for word in words],
+        'api.books_list': ['/books/api/books/', '/books/api/books/?ordering=-year']
+                          + [f'/books/api/books/?cursor={cursor}' for cursor in cursors],
+        'api.books_search': [f'/books/api/books/?{urlencode({"search": word})}' for word in words],
+        'api.books_retrieve': [f'/books/api/books/{pk}/' for pk in book_ids],
+        'api.authors_list': ['/books/api/authors/'],
+        'api.authors_retrieve': [f'/books/api/authors/{pk}/' for pk in author_ids],
+    }
+    if commented:
+        result['html.comment_window'] = [f'/books/{pk}/comments/window/' for pk in commented]
+    return result
+
+
+def run_suite(session_factory, suite: dict, concurrency: int = 8, duration: float = 5.0,
+              warmup: float = 1.0, progress=None) -> dict:
+    '''
+    Прогон сценариев по очереди; перед замером каждый сценарий прогревается warmup секунд
+    '''
+    results = {}
+    for name, paths in suite.items():
+        if warmup:
+            loadtest.drive(session_factory, paths, concurrency, warmup)
+        results[name] = loadtest.drive(session_factory, paths, concurrency, duration)
+        if progress:
+            progress(name, results[name])
+    return results
+
+
+def environment() -> dict:
+    return {
+        'books': Book.custom.count(),
+        'comments': Comment.objects.count(),
+        'database': settings.DATABASES['default']['ENGINE'].rsplit('.', 1)[-1],
+        'replicas': len(settings.DATABASE_REPLICAS),
+        'cache': settings.CACHES['default']['BACKEND'].rsplit('.', 1)[-1],
+        'response_cache_timeout': settings.RESPONSE_CACHE_TIMEOUT,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.1) -> list:
+    '''
+    Сравнение двух прогонов (поле "results" файлов bench_suite). Возвращает строки
+    {scenario, metric, baseline, current, change, regression}; regression - ухудшение больше threshold
+    или появление ошибок.
+    '''
+    rows = []
+    for scenario, before in baseline.items():
+        after = current.get(scenario)
+        if after is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = before[metric], after[metric]
+            change = (new - old) / old if old else 0.0
+            worse = -change if higher_is_better else change
+            rows.append({
+                'scenario': scenario, 'metric': metric, 'baseline': old, 'current': new,
+                'change': round(change, 4), 'regression': worse > threshold,
+            })
+        if after['errors'] > before['errors']:
+            rows.append({
+                'scenario': scenario, 'metric': 'errors', 'baseline': before['errors'], 'current': after['errors'],
+                'change': None, 'regression': True,
+            })
+    return rows
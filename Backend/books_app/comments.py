@@ -0,0 +1,125 @@
+'''
+Отрисовка дерева комментариев книги.
+Дерево окна (несколько корневых веток, новые первыми) выбирается одним запросом, упорядоченным по (tree_id, lft),
+вместе с посетителями; готовый HTML кешируется по книге и сбрасывается сменой версии при новом комментарии.
+Ветки глубже COMMENTS_MAX_DEPTH не рисуются сразу, а подгружаются отдельным запросом.
+'''
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q, Subquery
+from django.template.loader import render_to_string
+
+from books_app.models import Comment
+
+ROOTS_PER_WINDOW = getattr(settings, 'COMMENTS_ROOTS_PER_WINDOW', 20)
+MAX_DEPTH = getattr(settings, 'COMMENTS_MAX_DEPTH', 4)
+CACHE_TIMEOUT = getattr(settings, 'COMMENTS_CACHE_TIMEOUT', 60 * 60)
+
+
+def _version_key(book_id) -> str:
+    return f'comments:version:{book_id}'
+
+
+def thread_version(book_id) -> int:
+    version = cache.get(_version_key(book_id))
+    if version is None:
+        version = 1
+        cache.add(_version_key(book_id), version, None)
+    return version
+
+
+def invalidate_thread(book_id) -> None:
+    '''
+    Сброс всех закешированных фрагментов ветки книги (старые ключи просто перестают читаться)
+    '''
+    try:
+        cache.incr(_version_key(book_id))
+    except ValueError:
+        cache.add(_version_key(book_id), 2, None)
+
+
+def window_nodes(book_id, after_root: int = 0, roots: int = ROOTS_PER_WINDOW) -> list:
+    '''
+    Комментарии окна из `roots` корневых веток после корневого комментария after_root, не глубже MAX_DEPTH
+    (один запрос). Корни идут новыми первыми по (published_at, pk) из индекса comment_book_roots_idx;
+    курсор - pk корня, по нему берется его место в этом порядке.
+    '''
+    root_trees = Comment.objects.filter(book_id=book_id, level=0)
+    if after_root:
+        published_at = Subquery(Comment.objects.filter(pk=after_root).values('published_at'))
+        root_trees = root_trees.filter(
+            Q(published_at__lt=published_at) | Q(published_at=published_at, pk__lt=after_root)
+        )
+    root_trees = root_trees.order_by('-published_at', '-pk').values('tree_id')[:roots]
+    nodes = list(
+        Comment.objects.filter(book_id=book_id, tree_id__in=root_trees, level__lt=MAX_DEPTH)
+        .select_related('visitor')
+        .order_by('tree_id', 'lft')
+    )
+    # Ветки в порядке корней; сортировка устойчива, внутри ветки остается порядок lft
+    positions = {node.tree_id: (node.published_at, node.pk) for node in nodes if node.level == 0}
+    nodes.sort(key=lambda node: positions[node.tree_id], reverse=True)
+    return nodes
+
+
+def subtree_nodes(comment: Comment) -> list:
+    '''
+    Потомки комментария еще на MAX_DEPTH уровней вниз (один запрос)
+    '''
+    return list(
+        Comment.objects.filter(
+            tree_id=comment.tree_id,
+            lft__gt=comment.lft,
+            rght__lt=comment.rght,
+            level__lte=comment.level + MAX_DEPTH,
+        )
+        .select_related('visitor')
+        .order_by('lft')
+    )
+
+
+def render_window(book_id, after_root: int = 0) -> str:
+    key = f'comments:window:{book_id}:{thread_version(book_id)}:{after_root}'
+    html = cache.get(key)
+    if html is None:
+        nodes = window_nodes(book_id, after_root, ROOTS_PER_WINDOW + 1)
+        roots = [node for node in nodes if node.level == 0]
+        has_more = len(roots) > ROOTS_PER_WINDOW
+        if has_more:
+            nodes = [node for node in nodes if node.tree_id != roots[-1].tree_id]
+        html = render_to_string('comments_thread.html', {
+            'book_id': book_id,
+            'nodes': nodes,
+            'max_level': MAX_DEPTH - 1,
+            'next_after': roots[-2].pk if has_more else None,
+        })
+        cache.set(key, html, CACHE_TIMEOUT)
+    return html
+
+
+def render_subtree(comment: Comment) -> str:
+    key = f'comments:subtree:{comment.book_id}:{thread_version(comment.book_id)}:{comment.pk}'
+    html = cache.get(key)
+    if html is None:
+        html = render_to_string('comments_thread.html', {
+            'book_id': comment.book_id,
+            'nodes': subtree_nodes(comment),
+            'max_level': comment.level + MAX_DEPTH,
+            'next_after': None,
+        })
+        cache.set(key, html, CACHE_TIMEOUT)
+    return html
+
+
+def as_json(comment: Comment) -> dict:
+    '''
+    Данные нового комментария для отрисовки на странице (comments.js)
+    '''
+    return {
+        'is_child': comment.is_child_node(),
+        'id': comment.id,
+        'visitor': comment.visitor.name,
+        'parent_id': comment.parent_id,
+        'published_at': comment.published_at.strftime('%Y-%b-%d %H:%M:%S'),
+        'comment': comment.comment,
+    }
@@ -0,0 +1,165 @@
+'''
+Генератор синтетического каталога для нагрузочных тестов и бенчмарков: авторы, книги, посетители,
+оценки и деревья комментариев заданной глубины. Данные детерминированы зерном (seed).
+Все вставки делаются bulk_create пачками; поля MPTT (tree_id, lft, rght, level) комментариев
+вычисляются заранее, поэтому глубокие деревья не требуют перестроения после вставки.
+Агрегаты рейтинга, счетчики посетителей и обсуждаемых книг, поисковый индекс и версии кеша ответов обновляются в конце.
+'''
+import random
+from dataclasses import dataclass
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Max
+
+from books_app import rankings, response_cache, search
+from books_app.models import Author, Book, BookRate, Comment, Visitor
+
+SYLLABLES = ['ка', 'ро', 'ми', 'на', 'ле', 'то', 'сва', 'гор', 'дан', 'вел', 'мир', 'зор', 'ти', 'бра', 'ост']
+
+
+def fake_word(rnd: random.Random) -> str:
+    return ''.join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 4)))
+
+
+def fake_text(rnd: random.Random, words: tuple) -> str:
+    return ' '.join(fake_word(rnd) for _ in range(rnd.randint(*words)))
+
+
+@dataclass
+class DatasetSize:
+    authors: int = 1_000
+    books: int = 20_000
+    visitors: int = 2_000
+    ratings_per_book: int = 5
+    comment_trees_per_book: int = 2
+    comment_depth: int = 6
+    comment_branching: int = 2
+    commented_books: float = 0.2
+
+
+SIZES = {
+    'small': DatasetSize(authors=50, books=1_000, visitors=200, comment_depth=4),
+    'medium': DatasetSize(),
+    'large': DatasetSize(authors=10_000, books=200_000, visitors=20_000, ratings_per_book=10),
+}
+
+
+class DatasetGenerator:
+    '''
+    generator = DatasetGenerator(SIZES['medium'], seed=42)
+    counts = generator.run()
+    '''
+    def __init__(self, size: DatasetSize, seed: int = 42, batch_size: int = 5000, progress=None):
+        self.size = size
+        self.rnd = random.Random(seed)
+        self.batch_size = batch_size
+        self.progress = progress or (lambda message: None)
+        self.counts = {}
+
+    def run(self) -> dict:
+        with transaction.atomic():
+            authors = self.create_authors()
+            books = self.create_books(authors)
+            visitors = self.create_visitors()
+            self.create_ratings(books, visitors)
+            self.create_comments(books, visitors)
+        Book.rebuild_ratings()
+        Visitor.rebuild_stats()
+        rankings.rebuild_discussions()
+        search.rebuild_index()
+        response_cache.invalidate_all()
+        return self.counts
+
+    def _bulk_create(self, model, objects: list, label: str) -> list:
+        manager = model.custom if model is Book else model.objects
+        created = manager.bulk_create(objects, batch_size=self.batch_size)
+        self.counts[label] = self.counts.get(label, 0) + len(created)
+        self.progress(f'{label}: {self.counts[label]}')
+        return created
+
+    def create_authors(self) -> list:
+        rnd = self.rnd
+        return self._bulk_create(Author, [
+            Author(name=fake_word(rnd).title(), surname=fake_word(rnd).title(),
+                   year_of_birth=rnd.randint(1700, 2000), description=fake_text(rnd, (5, 20)))
+            for _ in range(self.size.authors)
+        ], 'authors')
+
+    def create_books(self, authors: list) -> list:
+        rnd = self.rnd
+        books = []
+        for start in range(0, self.size.books, self.batch_size):
+            books += self._bulk_create(Book, [
+                Book(name=fake_text(rnd, (1, 4)).capitalize(), author=rnd.choice(authors),
+                     year=rnd.randint(1800, 2024), description=fake_text(rnd, (10, 40)))
+                for _ in range(min(self.batch_size, self.size.books - start))
+            ], 'books')
+        return books
+
+    def create_visitors(self) -> list:
+        rnd = self.rnd
+        prefix = f'bench-{rnd.getrandbits(32):08x}'
+        users = self._bulk_create(User, [
+            User(username=f'{prefix}-{number}', password='!')
+            for number in range(self.size.visitors)
+        ], 'users')
+        return self._bulk_create(Visitor, [
+            Visitor(user=user, name=fake_word(rnd).title(), surname=fake_word(rnd).title())
+            for user in users
+        ], 'visitors')
+
+    def create_ratings(self, books: list, visitors: list) -> None:
+        rnd = self.rnd
+        per_book = min(self.size.ratings_per_book, len(visitors))
+        batch = []
+        for book in books:
+            # Популярность книг неравномерна: часть книг получает больше оценок
+            count = min(len(visitors), int(per_book * rnd.paretovariate(2) / 2))
+            for visitor in rnd.sample(visitors, count):
+                batch.append(BookRate(book=book, visitor=visitor, rate=rnd.choices((1, 2, 3, 4, 5), (1, 1, 2, 4, 3))[0]))
+            if len(batch) >= self.batch_size:
+                self._bulk_create(BookRate, batch, 'ratings')
+                batch = []
+        if batch:
+            self._bulk_create(BookRate, batch, 'ratings')
+
+    def create_comments(self, books: list, visitors: list) -> None:
+        '''
+        Деревья комментариев: у каждого узла до comment_branching ответов, глубина до comment_depth.
+        Узлы вставляются по уровням, чтобы у детей были pk родителей.
+        '''
+        rnd = self.rnd
+        commented = rnd.sample(books, int(len(books) * self.size.commented_books))
+        tree_id = (Comment.objects.aggregate(last=Max('tree_id'))['last'] or 0)
+        levels = {}
+        for book in commented:
+            for _ in range(self.size.comment_trees_per_book):
+                tree_id += 1
+                self._build_tree(book, visitors, tree_id, levels)
+        parents = {}
+        for level in sorted(levels):
+            nodes = levels[level]
+            for node, parent_key in nodes:
+                node.parent_id = parents[parent_key].pk if parent_key else None
+            for start in range(0, len(nodes), self.batch_size):
+                chunk = [node for node, _ in nodes[start:start + self.batch_size]]
+                self._bulk_create(Comment, chunk, 'comments')
+            parents.update({(node.tree_id, node.lft): node for node, _ in nodes})
+
+    def _build_tree(self, book: Book, visitors: list, tree_id: int, levels: dict) -> None:
+        rnd = self.rnd
+        counter = [0]
+
+        def visit(level: int, parent_key):
+            counter[0] += 1
+            node = Comment(book=book, visitor=rnd.choice(visitors), comment=fake_text(rnd, (3, 30)),
+                           tree_id=tree_id, level=level, lft=counter[0])
+            levels.setdefault(level, []).append((node, parent_key))
+            if level + 1 < self.size.comment_depth:
+                for _ in range(rnd.randint(0 if level else 1, self.size.comment_branching)):
+                    visit(level + 1, (tree_id, node.lft))
+            counter[0] += 1
+            node.rght = counter[0]
+
+        visit(0, None)
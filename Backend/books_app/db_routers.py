@@ -0,0 +1,32 @@
+'''
+Маршрутизация запросов к БД между основной базой (default) и репликами (settings.DATABASE_REPLICAS).
+На реплики уходят только чтения из view, которые это разрешают (атрибуты replica_reads / replica_actions,
+см. books_app.middleware.ReplicaRoutingMiddleware); все остальное, включая чтения внутри транзакций,
+идет в default. После записи сессия на REPLICA_PIN_SECONDS закрепляется за default (read-your-writes).
+'''
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+replica_reads = ContextVar('replica_reads', default=False)
+primary_written = ContextVar('primary_written', default=False)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not settings.DATABASE_REPLICAS or not replica_reads.get() \
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        primary_written.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
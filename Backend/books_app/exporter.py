@@ -0,0 +1,98 @@
+'''
+Потоковая выгрузка каталога (книги, авторы, оценки, комментарии) в JSON Lines или CSV.
+Строки читаются через .values().iterator(chunk_size=...) и сразу отдаются генератором,
+поэтому расход памяти не зависит от размера таблиц. Сжатие gzip выполняется на лету.
+'''
+import csv
+import io
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from books_app.models import Author, Book, BookRate, Comment
+
+FORMATS = ('jsonl', 'csv')
+CHUNK_SIZE = 2000
+BUFFER_SIZE = 64 * 1024
+
+DATASETS = {
+    'books': lambda: Book.custom.order_by('pk').values(
+        'id', 'name', 'year', 'description', 'author_id', 'author__name', 'author__surname',
+        'rating_count', 'rating_sum', 'rating_avg',
+    ),
+    'authors': lambda: Author.objects.order_by('pk').values(
+        'id', 'name', 'surname', 'year_of_birth', 'description',
+    ),
+    'ratings': lambda: BookRate.objects.order_by('pk').values(
+        'id', 'book_id', 'visitor_id', 'rate', 'rated_at',
+    ),
+    # Комментарии в порядке обхода деревьев: каждая ветка выгружается целиком и подряд
+    'comments': lambda: Comment.objects.order_by('tree_id', 'lft').values(
+        'id', 'book_id', 'visitor_id', 'parent_id', 'tree_id', 'level', 'lft', 'rght', 'published_at', 'comment',
+    ),
+}
+
+
+def rows(dataset: str, chunk_size: int = CHUNK_SIZE):
+    return DATASETS[dataset]().iterator(chunk_size=chunk_size)
+
+
+def fieldnames(dataset: str) -> list:
+    queryset = DATASETS[dataset]()
+    return list(queryset.query.values_select) + list(queryset.query.annotation_select)
+
+
+def _buffered(pieces):
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= BUFFER_SIZE:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _jsonl(dataset: str):
+    encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    for row in rows(dataset):
+        yield encoder.encode(row) + '\n'
+
+
+def _csv(dataset: str):
+    line = io.StringIO()
+    writer = csv.DictWriter(line, fieldnames=fieldnames(dataset))
+    writer.writeheader()
+    for row in rows(dataset):
+        writer.writerow(row)
+        yield line.getvalue()
+        line.seek(0)
+        line.truncate()
+    yield line.getvalue()
+
+
+def _gzip(chunks, encoding: str = 'utf-8'):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode(encoding))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export(dataset: str, fmt: str = 'jsonl', compress: bool = False):
+    '''
+    Генератор кусков выгрузки: str без сжатия, bytes со сжатием gzip
+    '''
+    if dataset not in DATASETS:
+        raise ValueError(f'Unknown dataset {dataset!r}, expected one of {tuple(DATASETS)}')
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown format {fmt!r}, expected one of {FORMATS}')
+    chunks = _buffered(_jsonl(dataset) if fmt == 'jsonl' else _csv(dataset))
+    return _gzip(chunks) if compress else chunks
+
+
+def content_type(fmt: str) -> str:
+    return 'text/csv; charset=utf-8' if fmt == 'csv' else 'application/x-ndjson; charset=utf-8'
@@ -1,5 +1,6 @@
 from django import forms
-from books_app.models import Author, Visitor, Book, Comment
+from django.urls import reverse_lazy
+from books_app.models import Author, Visitor, Book, BookRate, Comment
 
 
 class MultipleFileInput(forms.ClearableFileInput):
@@ -22,6 +23,27 @@ class MultipleFileField(forms.FileField):
         return result
 
 
+class AuthorLookupWidget(forms.Widget):
+    '''
+    Поле выбора автора с подсказками (AuthorLookupView) вместо <select> со всеми авторами:
+    в форму уходит pk автора из скрытого поля, при отрисовке загружается только выбранный автор
+    '''
+    template_name = 'books_app/widgets/author_lookup.html'
+    lookup_url = reverse_lazy('books_app:author_lookup')
+
+    class Media:
+        js = ['custom/js/author_lookup.js']
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        author = None
+        if str(value or '').isdigit():
+            author = Author.objects.filter(pk=value).only('name', 'surname', 'year_of_birth').first()
+        context['widget']['label'] = author.lookup_label if author else ''
+        context['widget']['lookup_url'] = self.lookup_url
+        return context
+
+
 class BookWithFileForm(forms.Form):
     ''' Класс формы, для добавления книги с несколькими изображениями'''
     def __init__(self, *args, **kwargs):
@@ -36,7 +58,7 @@ class BookWithFileForm(forms.Form):
             })
 
     name = forms.CharField(label='Название книги', max_length=100)
-    author = forms.ModelChoiceField(queryset=Author.objects.all(), label='Автор')
+    author = forms.ModelChoiceField(queryset=Author.objects.all(), label='Автор', widget=AuthorLookupWidget)
     description = forms.CharField(
         label='Описание книги',
         widget=forms.Textarea(),
@@ -52,6 +74,7 @@ class BookUpdateForm(forms.ModelForm):
     class Meta:
         model = Book
         fields = ['name', 'author', 'year', 'description',]
+        widgets = {'author': AuthorLookupWidget}
 
     def __init__(self, *args, **kwargs):
         """
@@ -93,4 +116,14 @@ class CommentCreateForm(forms.ModelForm):
 
     class Meta:
         model = Comment
-        fields = ('comment',)
\ No newline at end of file
+        fields = ('comment',)
+
+
+class RatingForm(forms.Form):
+    """
+    Проверка оценки книги (RatingCreateView): номер книги и оценка из BookRate.rate.choices
+    """
+    book_id = forms.IntegerField(min_value=1)
+    rate = forms.TypedChoiceField(coerce=int, choices=BookRate._meta.get_field('rate').choices)
+
+    error_message = 'Ожидаются book_id и rate от 1 до 5'
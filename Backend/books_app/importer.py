@@ -0,0 +1,284 @@
+'''
+Массовый импорт каталога книг из CSV или JSON Lines.
+Записи читаются потоком, авторы ищутся в словаре (имя, фамилия) -> pk, загруженном один раз,
+книги и изображения вставляются bulk_create пачками, каждая пачка - в своей транзакции.
+
+Поля записи: name, year, description, author_name, author_surname, author_year_of_birth (необязательно)
+или author_id, images (необязательно, имена файлов через ";" в каталоге изображений). Принимается и выгрузка
+exporter "books": автор ищется по author_id, а если такого нет - по author__name и author__surname.
+
+Оценки (RatingsImporter) принимаются в виде выгрузки exporter "ratings": book_id, visitor_id, rate, rated_at.
+'''
+import csv
+import json
+import os
+import time
+from dataclasses import dataclass, field
+
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from books_app import response_cache, search, storage, tasks
+from books_app.models import Author, Book, BookRate, Images, Visitor
+
+FORMATS = ('csv', 'jsonl')
+DATASETS = ('books', 'ratings')
+
+
+class RecordError(ValueError):
+    pass
+
+
+def read_records(lines, fmt: str):
+    '''
+    Генератор словарей-записей из итератора строк
+    '''
+    if fmt == 'csv':
+        yield from csv.DictReader(lines)
+    elif fmt == 'jsonl':
+        for number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield {'_error': f'line {number}: invalid JSON'}
+    else:
+        raise RecordError(f'Unknown format {fmt!r}, expected one of {FORMATS}')
+
+
+def decode_lines(stream, encoding: str = 'utf-8'):
+    for line in stream:
+        yield line.decode(encoding) if isinstance(line, bytes) else line
+
+
+@dataclass
+class ImportStats:
+    books: int = 0
+    authors: int = 0
+    images: int = 0
+    ratings: int = 0
+    errors: list = field(default_factory=list)
+    started: float = field(default_factory=time.perf_counter)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def rate(self) -> float:
+        return self.books / self.elapsed if self.elapsed else 0
+
+    def as_dict(self, max_errors: int = 100) -> dict:
+        return {
+            'books': self.books,
+            'authors': self.authors,
+            'images': self.images,
+            'ratings': self.ratings,
+            'errors': self.errors[:max_errors],
+            'error_count': len(self.errors),
+            'seconds': round(self.elapsed, 3),
+            'books_per_second': round(self.rate, 1),
+        }
+
+
+class CatalogueImporter:
+    '''
+    Импорт потока записей пачками по batch_size книг
+    '''
+    def __init__(self, batch_size: int = 1000, images_dir: str = None, progress=None):
+        self.batch_size = batch_size
+        self.images_dir = images_dir
+        self.progress = progress
+        self.authors = {
+            (name.strip().lower(), surname.strip().lower()): pk
+            for pk, name, surname in Author.objects.values_list('pk', 'name', 'surname').iterator()
+        }
+        self.author_ids = set(self.authors.values())
+        self.stats = ImportStats()
+
+    def run(self, records) -> ImportStats:
+        batch = []
+        for number, record in enumerate(records, 1):
+            try:
+                batch.append(self.parse(record))
+            except (RecordError, KeyError, TypeError, ValueError) as error:
+                self.stats.errors.append(f'record {number}: {error}')
+                continue
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                batch = []
+        if batch:
+            self.flush(batch)
+        if self.stats.books or self.stats.authors:
+            response_cache.invalidate_all()
+        return self.stats
+
+    def parse(self, record: dict) -> dict:
+        if '_error' in record:
+            raise RecordError(record['_error'])
+        name = (record.get('name') or '').strip()
+        if not name:
+            raise RecordError('empty name')
+        year = int(record['year'])
+        if not 0 < year <= 2050:
+            raise RecordError(f'year out of range: {year}')
+        author_id = int(record.get('author_id') or 0)
+        author_name = (record.get('author_name') or record.get('author__name') or '').strip()
+        author_surname = (record.get('author_surname') or record.get('author__surname') or '').strip()
+        if author_id in self.author_ids:
+            author = author_id
+        elif author_name or author_surname:
+            author = (author_name, author_surname, int(record.get('author_year_of_birth') or 0))
+        elif author_id:
+            raise RecordError(f'unknown author_id {author_id}')
+        else:
+            raise RecordError('no author')
+        images = record.get('images') or []
+        if isinstance(images, str):
+            images = [image.strip() for image in images.split(';') if image.strip()]
+        return {
+            'name': name[:100],
+            'year': year,
+            'description': record.get('description') or '',
+            'author': author,
+            'images': images,
+        }
+
+    def resolve_authors(self, batch: list) -> None:
+        '''
+        Замена (имя, фамилия, год) на pk автора; недостающие авторы создаются одним bulk_create
+        '''
+        missing = {}
+        for row in batch:
+            if isinstance(row['author'], tuple):
+                name, surname, year = row['author']
+                key = (name.lower(), surname.lower())
+                if key not in self.authors and key not in missing:
+                    missing[key] = Author(name=name[:50], surname=surname[:50], year_of_birth=year)
+        if missing:
+            created = Author.objects.bulk_create(missing.values())
+            for key, author in zip(missing, created):
+                self.authors[key] = author.pk
+                self.author_ids.add(author.pk)
+            self.stats.authors += len(created)
+        for row in batch:
+            if isinstance(row['author'], tuple):
+                name, surname, _ = row['author']
+                row['author'] = self.authors[(name.lower(), surname.lower())]
+
+    def flush(self, batch: list) -> None:
+        with transaction.atomic():
+            self.resolve_authors(batch)
+            books = Book.custom.bulk_create([
+                Book(name=row['name'], year=row['year'], description=row['description'], author_id=row['author'])
+                for row in batch
+            ])
+            images = []
+            for book, row in zip(books, batch):
+                images.extend(self.attach_images(book, row['images']))
+            if images:
+                for image in Images.objects.bulk_create(images):
+                    tasks.schedule_thumbnails(image.pk)
+            self.index(books)
+        self.stats.books += len(books)
+        self.stats.images += len(images)
+        if self.progress:
+            self.progress(self.stats)
+
+    def attach_images(self, book: Book, filenames: list) -> list:
+        if not (self.images_dir and filenames):
+            return []
+        images = []
+        for filename in filenames:
+            path = os.path.join(self.images_dir, os.path.basename(filename))
+            if not os.path.isfile(path):
+                self.stats.errors.append(f'book {book.name!r}: image {filename!r} not found')
+                continue
+            image = Images(book=book)
+            with open(path, 'rb') as source:
+                image.image.save(os.path.basename(path), File(source), save=False)
+            image.content_hash = storage.content_hash(image.image.name)
+            images.append(image)
+        return images
+
+    def index(self, books: list) -> None:
+        authors = {
+            author.pk: author
+            for author in Author.objects.filter(pk__in={book.author_id for book in books})
+        }
+        for book in books:
+            book.author = authors[book.author_id]
+        search.index_books(books)
+
+
+class RatingsImporter:
+    '''
+    Импорт оценок пачками по batch_size. Оценка определяется парой (book_id, visitor_id): повторный импорт
+    заменяет оценку и ее время. Записи с неизвестными книгой или посетителем пропускаются с ошибкой.
+    Агрегаты рейтинга книг и счетчики посетителей пересчитываются один раз в конце импорта.
+    '''
+    def __init__(self, batch_size: int = 1000, progress=None):
+        self.batch_size = batch_size
+        self.progress = progress
+        self.stats = ImportStats()
+
+    def run(self, records) -> ImportStats:
+        batch = {}
+        for number, record in enumerate(records, 1):
+            try:
+                rate = self.parse(record)
+            except (RecordError, KeyError, TypeError, ValueError) as error:
+                self.stats.errors.append(f'record {number}: {error}')
+                continue
+            # Повтор пары в одной пачке: действует последняя запись (ON CONFLICT не обновляет строку дважды)
+            batch[rate.book_id, rate.visitor_id] = (number, rate)
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                batch = {}
+        if batch:
+            self.flush(batch)
+        if self.stats.ratings:
+            Book.rebuild_ratings()
+            Visitor.rebuild_stats()
+            response_cache.invalidate_all()
+        return self.stats
+
+    def parse(self, record: dict) -> BookRate:
+        if '_error' in record:
+            raise RecordError(record['_error'])
+        rate = int(record['rate'])
+        if not 1 <= rate <= 5:
+            raise RecordError(f'rate out of range: {rate}')
+        rated_at = record.get('rated_at')
+        if rated_at:
+            rated_at = parse_datetime(rated_at) if isinstance(rated_at, str) else None
+            if rated_at is None:
+                raise RecordError(f'invalid rated_at: {record["rated_at"]!r}')
+            if timezone.is_naive(rated_at):
+                rated_at = timezone.make_aware(rated_at)
+        else:
+            rated_at = timezone.now()
+        return BookRate(book_id=int(record['book_id']), visitor_id=int(record['visitor_id']), rate=rate,
+                        rated_at=rated_at)
+
+    def flush(self, batch: dict) -> None:
+        books = set(Book.custom.filter(pk__in={book for book, _ in batch}).values_list('pk', flat=True))
+        visitors = set(Visitor.objects.filter(pk__in={visitor for _, visitor in batch}).values_list('pk', flat=True))
+        rates = []
+        for (book_id, visitor_id), (number, rate) in batch.items():
+            if book_id not in books:
+                self.stats.errors.append(f'record {number}: unknown book_id {book_id}')
+            elif visitor_id not in visitors:
+                self.stats.errors.append(f'record {number}: unknown visitor_id {visitor_id}')
+            else:
+                rates.append(rate)
+        with transaction.atomic():
+            BookRate.objects.bulk_create(rates, update_conflicts=True, unique_fields=['book', 'visitor'],
+                                         update_fields=['rate', 'rated_at'])
+        self.stats.ratings += len(rates)
+        if self.progress:
+            self.progress(self.stats)
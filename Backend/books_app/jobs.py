@@ -0,0 +1,163 @@
+'''
+Фоновая очередь задач на базе таблицы Job, без внешнего брокера.
+Задача ставится в очередь вместе с транзакцией, в которой она создана, и выполняется
+воркером (manage.py run_jobs). При ошибке задача повторяется с экспоненциальной задержкой.
+В режиме JOBS_EAGER (тесты, локальная разработка) задачи выполняются сразу после коммита.
+
+Регистрация обработчика:
+
+    @jobs.register('thumbnails.build')
+    def build(image_id): ...
+
+    jobs.enqueue('thumbnails.build', {'image_id': 1})
+'''
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Min
+from django.utils import timezone
+
+from books_app.models import Job
+
+logger = logging.getLogger(__name__)
+
+EAGER = getattr(settings, 'JOBS_EAGER', False)
+RETRY_BASE_SECONDS = getattr(settings, 'JOBS_RETRY_BASE_SECONDS', 5)
+METRICS_WINDOW = timedelta(hours=1)
+
+_registry = {}
+
+
+def register(name: str):
+    def decorator(func):
+        _registry[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name: str, payload: dict = None, max_attempts: int = 3, delay: float = 0) -> Job:
+    '''
+    Постановка задачи в очередь; payload передается обработчику как именованные аргументы
+    '''
+    if name not in _registry:
+        raise KeyError(f'Unknown job {name!r}')
+    job = Job.objects.create(
+        name=name,
+        payload=payload or {},
+        max_attempts=max_attempts,
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+    if EAGER:
+        transaction.on_commit(lambda: run_job(job.pk))
+    return job
+
+
+def claim_next(names=None):
+    '''
+    Захват следующей готовой задачи. Захват - условный UPDATE по статусу, поэтому
+    несколько воркеров не возьмут одну задачу (работает и на SQLite, без SELECT FOR UPDATE).
+    '''
+    queued = Job.objects.filter(status=Job.QUEUED, run_after__lte=timezone.now())
+    if names:
+        queued = queued.filter(name__in=names)
+    for job_id in queued.order_by('run_after', 'pk').values_list('pk', flat=True)[:10]:
+        claimed = Job.objects.filter(pk=job_id, status=Job.QUEUED).update(
+            status=Job.RUNNING, started_at=timezone.now(), attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return Job.objects.get(pk=job_id)
+    return None
+
+
+def run_job(job_id) -> bool:
+    '''
+    Выполнение задачи (захват + обработчик + фиксация результата). Возвращает True при успехе.
+    '''
+    claimed = Job.objects.filter(pk=job_id, status=Job.QUEUED).update(
+        status=Job.RUNNING, started_at=timezone.now(), attempts=F('attempts') + 1,
+    )
+    if not claimed:
+        return False
+    return execute(Job.objects.get(pk=job_id))
+
+
+def execute(job: Job) -> bool:
+    try:
+        _registry[job.name](**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        logger.exception('Job %s failed (attempt %s of %s)', job, job.attempts, job.max_attempts)
+        if job.attempts >= job.max_attempts:
+            Job.objects.filter(pk=job.pk).update(status=Job.FAILED, finished_at=timezone.now(), last_error=error)
+        else:
+            retry_at = timezone.now() + timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (job.attempts - 1))
+            Job.objects.filter(pk=job.pk).update(status=Job.QUEUED, run_after=retry_at, last_error=error)
+        return False
+    Job.objects.filter(pk=job.pk).update(status=Job.DONE, finished_at=timezone.now())
+    return True
+
+
+def run_pending(names=None, limit: int = None) -> int:
+    '''
+    Выполнение всех готовых задач (или не больше limit). Возвращает количество выполненных.
+    '''
+    done = 0
+    while limit is None or done < limit:
+        job = claim_next(names)
+        if job is None:
+            break
+        execute(job)
+        done += 1
+    return done
+
+
+def requeue_stale(older_than: timedelta = timedelta(minutes=30)) -> int:
+    '''
+    Возврат в очередь задач, "зависших" в статусе running (например, воркер был убит)
+    '''
+    return Job.objects.filter(status=Job.RUNNING, started_at__lt=timezone.now() - older_than) \
+        .update(status=Job.QUEUED)
+
+
+def purge_finished(older_than: timedelta = timedelta(days=7)) -> int:
+    deleted, _ = Job.objects.filter(status=Job.DONE, finished_at__lt=timezone.now() - older_than).delete()
+    return deleted
+
+
+def _empty_metrics() -> dict:
+    return {'depth': 0, 'running': 0, 'failed': 0, 'oldest_wait': 0.0,
+            'avg_latency': None, 'avg_runtime': None, 'done_last_hour': 0}
+
+
+def metrics() -> dict:
+    '''
+    Глубина очереди и задержки по типам задач:
+    depth - задачи в очереди, oldest_wait - ожидание самой старой готовой задачи (сек),
+    avg_latency / avg_runtime - от постановки до завершения и время выполнения за последний час (сек).
+    '''
+    now = timezone.now()
+    result = {name: _empty_metrics() for name in _registry}
+
+    for row in Job.objects.values('name', 'status').annotate(count=Count('pk')):
+        key = {Job.QUEUED: 'depth', Job.RUNNING: 'running', Job.FAILED: 'failed'}.get(row['status'])
+        if key:
+            result.setdefault(row['name'], _empty_metrics())[key] = row['count']
+
+    waiting = Job.objects.filter(status=Job.QUEUED, run_after__lte=now).values('name').annotate(oldest=Min('created_at'))
+    for row in waiting:
+        result.setdefault(row['name'], _empty_metrics())['oldest_wait'] = (now - row['oldest']).total_seconds()
+
+    finished = Job.objects.filter(status=Job.DONE, finished_at__gte=now - METRICS_WINDOW).values('name').annotate(
+        count=Count('pk'),
+        latency=Avg(ExpressionWrapper(F('finished_at') - F('created_at'), output_field=DurationField())),
+        runtime=Avg(ExpressionWrapper(F('finished_at') - F('started_at'), output_field=DurationField())),
+    )
+    for row in finished:
+        stats = result.setdefault(row['name'], _empty_metrics())
+        stats['done_last_hour'] = row['count']
+        stats['avg_latency'] = row['latency'].total_seconds() if row['latency'] is not None else None
+        stats['avg_runtime'] = row['runtime'].total_seconds() if row['runtime'] is not None else None
+    return result
@@ -0,0 +1,144 @@
+'''
+Простой генератор нагрузки для бенчмарков: N потоков по кругу запрашивают список путей
+(по HTTP через keep-alive соединения или тестовым клиентом Django в процессе),
+собираются задержки, RPS и перцентили.
+'''
+import http.client
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def percentile(values: list, p: float) -> float:
+    '''
+    Перцентиль p (0..100) по отсортированному списку, с линейной интерполяцией
+    '''
+    if not values:
+        return 0.0
+    position = (len(values) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def summarize(latencies: list, errors: int, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'max_ms': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+    }
+
+
+class HttpSession:
+    '''
+    Keep-alive соединение одного потока нагрузки
+    '''
+    def __init__(self, base_url: str, headers: dict = None):
+        parts = urlsplit(base_url)
+        self.address = (parts.hostname, parts.port or 80)
+        self.headers = headers or {}
+        self.connection = http.client.HTTPConnection(*self.address, timeout=30)
+
+    def get(self, path: str) -> int:
+        try:
+            self.connection.request('GET', path, headers=self.headers)
+            response = self.connection.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = http.client.HTTPConnection(*self.address, timeout=30)
+            raise
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+class InProcessSession:
+    '''
+    Запросы через тестовый клиент Django в текущем процессе (без сети и сервера);
+    user - войти под этим пользователем
+    '''
+    def __init__(self, user=None):
+        from django.test import Client
+
+        self.client = Client(HTTP_HOST='127.0.0.1')
+        if user is not None:
+            self.client.force_login(user)
+
+    def get(self, path: str) -> int:
+        return self.client.get(path).status_code
+
+    def close(self) -> None:
+        from django.db import connections
+
+        connections.close_all()
+
+
+def drive(session_factory, paths: list, concurrency: int = 16, duration: float = 10.0) -> dict:
+    '''
+    Нагрузка в течение duration секунд: у каждого из concurrency потоков своя сессия session_factory(),
+    пути запрашиваются по кругу. Ответы со статусом >= 400 и исключения считаются ошибками.
+    '''
+    deadline = time.perf_counter() + duration
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker(offset: int):
+        session = session_factory()
+        local, local_errors = [], 0
+        index = offset
+        while time.perf_counter() < deadline:
+            path = paths[index % len(paths)]
+            index += 1
+            started = time.perf_counter()
+            try:
+                status = session.get(path)
+            except Exception:
+                local_errors += 1
+                continue
+            if status >= 400:
+                local_errors += 1
+                continue
+            local.append(time.perf_counter() - started)
+        session.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors[0], time.perf_counter() - started)
+
+
+def run_load(base_url: str, paths: list, concurrency: int = 16, duration: float = 10.0, headers: dict = None) -> dict:
+    '''
+    Нагрузка по HTTP на запущенный сервер base_url
+    '''
+    return drive(lambda: HttpSession(base_url, headers), paths, concurrency, duration)
+
+
+def wait_until_ready(base_url: str, path: str = '/', timeout: float = 30.0) -> bool:
+    parts = urlsplit(base_url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=2)
+            connection.request('GET', path)
+            connection.getresponse().read()
+            connection.close()
+            return True
+        except (OSError, http.client.HTTPException):
+            time.sleep(0.2)
+    return False
@@ -0,0 +1,65 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from books_app import search
+from books_app.dataset import fake_word
+from books_app.models import Author, Book
+
+
+class Command(BaseCommand):
+    '''
+    Сравнение поиска через индекс с прежней цепочкой Q(...icontains) на синтетических данных.
+    Данные создаются внутри транзакции, которая в конце откатывается.
+    '''
+    help = 'Benchmark indexed search against the icontains OR-chain on synthetic catalogues'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--queries', type=int, default=20, help='Number of random queries per size')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+        for size in sorted(options['sizes']):
+            with transaction.atomic():
+                self.fill(rnd, size)
+                search.rebuild_index()
+                queries = [fake_word(rnd) for _ in range(options['queries'])]
+                indexed = self.measure(lambda q: search.search_books(Book.custom.all(), q), queries)
+                legacy = self.measure(lambda q: Book.custom.filter(search.icontains_filter(q)), queries)
+                self.stdout.write(
+                    f'{size:>9} books: index {indexed * 1000:8.2f} ms/query, '
+                    f'icontains {legacy * 1000:8.2f} ms/query, x{legacy / indexed if indexed else 0:.1f}'
+                )
+                transaction.set_rollback(True)
+        search.rebuild_index()
+
+    def fill(self, rnd: random.Random, size: int, batch_size: int = 5000) -> None:
+        authors = Author.objects.bulk_create([
+            Author(name=fake_word(rnd).title(), surname=fake_word(rnd).title(), year_of_birth=rnd.randint(1700, 2000))
+            for _ in range(max(size // 20, 1))
+        ])
+        for start in range(0, size, batch_size):
+            Book.custom.bulk_create([
+                Book(
+                    name=' '.join(fake_word(rnd) for _ in range(rnd.randint(1, 4))).capitalize(),
+                    author=rnd.choice(authors),
+                    year=rnd.randint(1800, 2024),
+                    description=' '.join(fake_word(rnd) for _ in range(rnd.randint(10, 40))),
+                )
+                for _ in range(min(batch_size, size - start))
+            ])
+
+    @staticmethod
+    def measure(build_queryset, queries) -> float:
+        '''
+        Среднее время на запрос так, как его выполняют страницы с пагинацией: COUNT и первая страница
+        '''
+        started = time.perf_counter()
+        for query in queries:
+            queryset = build_queryset(query)
+            queryset.count()
+            list(queryset[:20])
+        return (time.perf_counter() - started) / len(queries)
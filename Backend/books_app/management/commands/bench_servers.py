@@ -0,0 +1,73 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from books_app.loadtest import run_load, wait_until_ready
+from books_app.models import Book
+
+MODES = {
+    'wsgi': ['mysite.wsgi:application', '--worker-class', 'sync'],
+    'asgi': ['mysite.asgi:application', '--worker-class', 'uvicorn.workers.UvicornWorker'],
+}
+
+
+class Command(BaseCommand):
+    '''
+    Сравнение WSGI (sync-воркеры gunicorn) и ASGI (uvicorn-воркеры) под одинаковой нагрузкой:
+    сервер запускается отдельным процессом на текущей базе данных, затем нагружается по HTTP.
+    '''
+    help = 'Benchmark requests/s and p99 latency of the WSGI and ASGI deployment modes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', nargs='+', choices=tuple(MODES), default=list(MODES))
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--threads', type=int, default=1, help='gunicorn --threads for WSGI mode')
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--duration', type=float, default=10)
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--paths', nargs='+', help='Paths to request, a mix of hot read pages by default')
+        parser.add_argument('--no-cache', action='store_true', help='Disable the response cache in the servers')
+        parser.add_argument('--json', help='Write results to this file')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or self.default_paths()
+        base_url = f"http://127.0.0.1:{options['port']}"
+        results = {}
+        for mode in options['modes']:
+            env = dict(os.environ, DJANGO_ASYNC_VIEWS='1' if mode == 'asgi' else '0')
+            if options['no_cache']:
+                env['DJANGO_RESPONSE_CACHE_TIMEOUT'] = '0'
+            command = [
+                sys.executable, '-m', 'gunicorn', *MODES[mode],
+                '--bind', f"127.0.0.1:{options['port']}",
+                '--workers', str(options['workers']),
+                '--log-level', 'warning',
+            ]
+            if mode == 'wsgi':
+                command += ['--threads', str(options['threads'])]
+            server = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env)
+            try:
+                if not wait_until_ready(base_url, paths[0]):
+                    raise CommandError(f'{mode} server did not start')
+                run_load(base_url, paths, options['concurrency'], min(2.0, options['duration']))
+                results[mode] = run_load(base_url, paths, options['concurrency'], options['duration'])
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+            self.stdout.write(f"{mode}: " + ', '.join(f'{key}={value}' for key, value in results[mode].items()))
+
+        if options['json']:
+            with open(options['json'], 'w') as output:
+                json.dump({'paths': paths, 'options': {key: options[key] for key in (
+                    'workers', 'threads', 'concurrency', 'duration', 'no_cache')}, 'results': results}, output, indent=2)
+
+    @staticmethod
+    def default_paths() -> list:
+        book_id = Book.custom.order_by('pk').values_list('pk', flat=True).first()
+        paths = ['/books/', '/books/search/?do=a', '/books/api/books/']
+        if book_id:
+            paths += [f'/books/{book_id}/', f'/books/{book_id}/comments/window/']
+        return paths
@@ -0,0 +1,130 @@
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from books_app.loadtest import summarize
+from books_app.models import Book
+from books_app.sqlite import apply_pragmas
+
+
+class Command(BaseCommand):
+    '''
+    Конкурентная нагрузка чтение/запись на копии базы для профилей SQLite из settings.SQLITE_PROFILES.
+    Читатели выполняют запрос первой страницы каталога (тот же SQL, что строит ORM),
+    писатели - обновление агрегатов рейтинга книги (UPDATE по pk) в отдельных транзакциях.
+    В профиле с WAL читатели работают через соединения только для чтения, как реплика replica1 (ReplicaRouter).
+    '''
+    help = 'Benchmark concurrent reads and rating writes on a copy of the database for each SQLite profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', nargs='+', default=list(settings.SQLITE_PROFILES))
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--duration', type=float, default=5)
+        parser.add_argument('--timeout', type=float, default=5, help='Busy timeout of each connection, seconds')
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('The default database is not SQLite')
+        unknown = set(options['profiles']) - set(settings.SQLITE_PROFILES)
+        if unknown:
+            raise CommandError(f'Unknown profiles: {", ".join(sorted(unknown))}')
+        book_ids = list(Book.custom.values_list('pk', flat=True)[:1000])
+        if not book_ids:
+            raise CommandError('The database has no books, import a catalogue first')
+        read_sql, read_params = Book.custom.all().order_by('-pk')[:settings.BOOKS_PAGE_SIZE].query.sql_with_params()
+        source = Path(settings.DATABASES['default']['NAME'])
+        connections['default'].close()
+
+        for profile in options['profiles']:
+            with tempfile.TemporaryDirectory() as directory:
+                path = Path(directory) / source.name
+                shutil.copyfile(source, path)
+                pragmas = settings.SQLITE_PROFILES[profile]
+                setup = sqlite3.connect(path)
+                setup.execute(f"PRAGMA journal_mode = {pragmas.get('journal_mode', 'DELETE')}")
+                setup.close()
+                reads, writes = self.run(path, pragmas, (read_sql, read_params), book_ids, options)
+            self.stdout.write(f'{profile}:')
+            for kind, result in (('read', reads), ('write', writes)):
+                self.stdout.write(
+                    f"  {kind:>5}: {result['rps']:>8} ops/s, p50 {result['p50_ms']} ms, "
+                    f"p99 {result['p99_ms']} ms, errors {result['errors']}"
+                )
+
+    def run(self, path: Path, pragmas: dict, read_query, book_ids, options):
+        deadline = time.perf_counter() + options['duration']
+        results = {'read': ([], [0]), 'write': ([], [0])}
+        lock = threading.Lock()
+        read_only = pragmas.get('journal_mode', '').upper() == 'WAL'
+
+        def connect(for_read: bool):
+            if for_read and read_only:
+                connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True, timeout=options['timeout'],
+                                             isolation_level=None, check_same_thread=False)
+            else:
+                connection = sqlite3.connect(path, timeout=options['timeout'], isolation_level=None,
+                                             check_same_thread=False)
+            apply_pragmas(connection.cursor(), pragmas, for_read and read_only)
+            return connection
+
+        def reader():
+            connection = connect(True)
+            latencies, errors = [], 0
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    connection.execute(*read_query).fetchall()
+                except sqlite3.OperationalError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+            connection.close()
+            collect('read', latencies, errors)
+
+        def writer(seed: int):
+            rnd = random.Random(seed)
+            connection = connect(False)
+            latencies, errors = [], 0
+            while time.perf_counter() < deadline:
+                rate = rnd.randint(1, 5)
+                started = time.perf_counter()
+                try:
+                    connection.execute('BEGIN IMMEDIATE')
+                    connection.execute(
+                        'UPDATE books_app_book SET rating_count = rating_count + 1, '
+                        'rating_sum = rating_sum + ?, '
+                        'rating_avg = CAST(rating_sum + ? AS REAL) / (rating_count + 1) WHERE id = ?',
+                        (rate, rate, rnd.choice(book_ids)),
+                    )
+                    connection.execute('COMMIT')
+                except sqlite3.OperationalError:
+                    if connection.in_transaction:
+                        connection.execute('ROLLBACK')
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+            connection.close()
+            collect('write', latencies, errors)
+
+        def collect(kind: str, latencies: list, errors: int):
+            with lock:
+                results[kind][0].extend(latencies)
+                results[kind][1][0] += errors
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=reader) for _ in range(options['readers'])]
+        threads += [threading.Thread(target=writer, args=(i,)) for i in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        return [summarize(latencies, errors[0], elapsed) for latencies, errors in results.values()]
@@ -0,0 +1,94 @@
+import json
+import platform
+from datetime import datetime, timezone
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from books_app import benchmark, loadtest
+
+
+class Command(BaseCommand):
+    '''
+    Нагрузочный прогон сценариев каталога (books_app.benchmark) в процессе или по HTTP (--url)
+    с записью RPS и перцентилей задержки в JSON и сравнением с предыдущим прогоном.
+    Сравнение двух готовых файлов без прогона: --diff BASELINE CURRENT.
+    При регрессии команда завершается с ошибкой.
+    '''
+    help = 'Run the catalogue load scenarios and compare throughput/latency with a baseline run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Base URL of a running server; in-process test client if omitted')
+        parser.add_argument('--scenarios', nargs='+', help='Scenario names or prefixes (html, api.books_list, ...)')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=5, help='Seconds per scenario')
+        parser.add_argument('--warmup', type=float, default=1, help='Warm-up seconds per scenario')
+        parser.add_argument('--sample', type=int, default=50, help='Books per scenario')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--user', help='Log in as this user (in-process only)')
+        parser.add_argument('--output', help='Write results to this JSON file')
+        parser.add_argument('--compare', metavar='BASELINE', help='Compare this run with a saved run')
+        parser.add_argument('--diff', nargs=2, metavar=('BASELINE', 'CURRENT'), help='Compare two saved runs')
+        parser.add_argument('--threshold', type=float, default=0.1, help='Allowed relative degradation')
+
+    def handle(self, *args, **options):
+        if options['diff']:
+            baseline, current = (self.load(path) for path in options['diff'])
+            return self.report(baseline, current, options['threshold'])
+
+        try:
+            suite = benchmark.scenarios(options['sample'], options['seed'])
+        except ValueError as error:
+            raise CommandError(error)
+        if options['scenarios']:
+            suite = {name: paths for name, paths in suite.items()
+                     if any(name == wanted or name.startswith(f'{wanted}.') for wanted in options['scenarios'])}
+            if not suite:
+                raise CommandError('No scenarios match')
+
+        if options['url']:
+            session_factory = lambda: loadtest.HttpSession(options['url'])
+        else:
+            user = User.objects.get(username=options['user']) if options['user'] else None
+            session_factory = lambda: loadtest.InProcessSession(user)
+
+        results = benchmark.run_suite(
+            session_factory, suite, options['concurrency'], options['duration'], options['warmup'],
+            progress=lambda name, result: self.stdout.write(
+                f"{name:<22} {result['rps']:>9} rps  p50 {result['p50_ms']:>8} ms  "
+                f"p95 {result['p95_ms']:>8} ms  p99 {result['p99_ms']:>8} ms  errors {result['errors']}"
+            ),
+        )
+        run = {
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'mode': 'http' if options['url'] else 'in-process',
+            'target': options['url'],
+            'options': {key: options[key] for key in ('concurrency', 'duration', 'warmup', 'sample', 'seed', 'user')},
+            'environment': {**benchmark.environment(), 'python': platform.python_version(),
+                            'django': django.get_version()},
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(run, output, indent=2)
+        if options['compare']:
+            self.report(self.load(options['compare']), run, options['threshold'])
+
+    @staticmethod
+    def load(path: str) -> dict:
+        try:
+            with open(path) as source:
+                return json.load(source)
+        except (OSError, ValueError) as error:
+            raise CommandError(f'Cannot read {path}: {error}')
+
+    def report(self, baseline: dict, current: dict, threshold: float) -> None:
+        rows = benchmark.compare(baseline['results'], current['results'], threshold)
+        for row in rows:
+            change = f"{row['change']:+.1%}" if row['change'] is not None else ''
+            line = f"{row['scenario']:<22} {row['metric']:<7} {row['baseline']:>10} -> {row['current']:>10} {change:>8}"
+            self.stdout.write(self.style.ERROR(f'{line}  REGRESSION') if row['regression'] else line)
+        regressions = [row for row in rows if row['regression']]
+        if regressions:
+            raise CommandError(f'{len(regressions)} regression(s) above {threshold:.0%}')
+        self.stdout.write(self.style.SUCCESS('No regressions'))
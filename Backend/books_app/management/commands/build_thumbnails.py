@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from books_app import thumbnails
+from books_app.models import Images
+
+
+class Command(BaseCommand):
+    '''
+    Построение уменьшенных копий для уже загруженных изображений (синхронно)
+    '''
+    help = 'Build WebP/JPEG renditions for Images rows that do not have them yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Re-check every image, not only unprocessed ones')
+
+    def handle(self, *args, **options):
+        images = Images.objects.exclude(image='').exclude(image=None)
+        if not options['all']:
+            images = images.filter(image_width=None)
+        count = failed = 0
+        for image_id in list(images.values_list('pk', flat=True)):
+            try:
+                thumbnails.process(image_id)
+                count += 1
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'Image {image_id}: {error}')
+        self.stdout.write(self.style.SUCCESS(f'Processed {count} images, failed {failed}'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from books_app import response_cache
+
+
+class Command(BaseCommand):
+    '''
+    Счетчики попаданий и промахов кеша ответов
+    '''
+    help = 'Show (and optionally reset) response cache hit/miss counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true')
+
+    def handle(self, *args, **options):
+        stats = response_cache.stats()
+        total = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / total * 100 if total else 0
+        self.stdout.write(f"hits={stats['hits']} misses={stats['misses']} hit_ratio={ratio:.1f}%")
+        if options['reset']:
+            response_cache.reset_stats()
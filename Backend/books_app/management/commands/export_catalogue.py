@@ -0,0 +1,33 @@
+import sys
+
+from django.core.management.base import BaseCommand
+from books_app import exporter
+
+
+class Command(BaseCommand):
+    '''
+    Потоковая выгрузка таблицы каталога в файл или stdout
+    '''
+    help = 'Stream books, authors, ratings or comments as JSON Lines or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=tuple(exporter.DATASETS))
+        parser.add_argument('--format', choices=exporter.FORMATS, default='jsonl')
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--output', '-o', help='Output file, stdout by default')
+
+    def handle(self, *args, **options):
+        chunks = exporter.export(options['dataset'], options['format'], options['gzip'])
+        if options['output']:
+            if options['gzip']:
+                output = open(options['output'], 'wb')
+            else:
+                output = open(options['output'], 'w', encoding='utf-8', newline='')
+            with output:
+                for chunk in chunks:
+                    output.write(chunk)
+        else:
+            output = sys.stdout.buffer if options['gzip'] else sys.stdout
+            for chunk in chunks:
+                output.write(chunk)
+            output.flush()
@@ -0,0 +1,27 @@
+from dataclasses import fields, replace
+
+from django.core.management.base import BaseCommand
+from books_app.dataset import SIZES, DatasetGenerator
+
+
+class Command(BaseCommand):
+    '''
+    Генерация синтетического каталога (авторы, книги, посетители, оценки, деревья комментариев)
+    для нагрузочных тестов. Размеры задаются пресетом --size и уточняются отдельными параметрами.
+    '''
+    help = 'Generate a synthetic library dataset with ratings and deep comment trees'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', choices=tuple(SIZES), default='small')
+        for field in fields(SIZES['small']):
+            parser.add_argument(f"--{field.name.replace('_', '-')}", dest=field.name, type=field.type)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        overrides = {field.name: options[field.name] for field in fields(SIZES['small'])
+                     if options[field.name] is not None}
+        size = replace(SIZES[options['size']], **overrides)
+        progress = (lambda message: self.stdout.write(message)) if options['verbosity'] > 1 else None
+        counts = DatasetGenerator(size, options['seed'], options['batch_size'], progress).run()
+        self.stdout.write(', '.join(f'{label}={count}' for label, count in counts.items()))
@@ -0,0 +1,57 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from books_app.importer import (
+    DATASETS, FORMATS, CatalogueImporter, RatingsImporter, RecordError, decode_lines, read_records,
+)
+
+
+class Command(BaseCommand):
+    '''
+    Массовый импорт книг или оценок (выгрузка export_catalogue ratings) из CSV или JSON Lines (файл или "-" для stdin)
+    '''
+    help = 'Bulk import books or ratings from a CSV or JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to the file, "-" to read stdin')
+        parser.add_argument('--format', choices=FORMATS, help='Guessed from the file extension by default')
+        parser.add_argument('--dataset', choices=DATASETS, default='books')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--images-dir', help='Directory with cover images referenced by the "images" field')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        if options['dataset'] == 'ratings':
+            importer = RatingsImporter(batch_size=options['batch_size'], progress=self.report_ratings)
+        else:
+            importer = CatalogueImporter(
+                batch_size=options['batch_size'],
+                images_dir=options['images_dir'],
+                progress=self.report,
+            )
+        stream = sys.stdin if path == '-' else open(path, encoding='utf-8', newline='')
+        try:
+            stats = importer.run(read_records(decode_lines(stream), fmt))
+        except RecordError as error:
+            raise CommandError(error)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        for error in stats.errors[:20]:
+            self.stderr.write(error)
+        if options['dataset'] == 'ratings':
+            self.stdout.write(self.style.SUCCESS(
+                f'Imported {stats.ratings} ratings in {stats.elapsed:.1f}s, {len(stats.errors)} errors'
+            ))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {stats.books} books, {stats.authors} new authors, {stats.images} images '
+            f'in {stats.elapsed:.1f}s ({stats.rate:.0f} books/s), {len(stats.errors)} errors'
+        ))
+
+    def report(self, stats):
+        self.stdout.write(f'{stats.books} books, {stats.rate:.0f} books/s')
+
+    def report_ratings(self, stats):
+        self.stdout.write(f'{stats.ratings} ratings')
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from books_app import jobs
+
+
+class Command(BaseCommand):
+    '''
+    Метрики фоновой очереди по типам задач
+    '''
+    help = 'Show job queue depth and latency per job type'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--purge', action='store_true', help='Delete finished jobs older than a week')
+
+    def handle(self, *args, **options):
+        fmt = lambda value: '-' if value is None else f'{value:.3f}'
+        self.stdout.write('job                   depth running failed oldest_wait_s avg_latency_s avg_runtime_s done_1h')
+        for name, stats in sorted(jobs.metrics().items()):
+            self.stdout.write(
+                f"{name:<21} {stats['depth']:>5} {stats['running']:>7} {stats['failed']:>6} "
+                f"{stats['oldest_wait']:>13.1f} {fmt(stats['avg_latency']):>13} {fmt(stats['avg_runtime']):>13} "
+                f"{stats['done_last_hour']:>7}"
+            )
+        if options['purge']:
+            self.stdout.write(f'Purged {jobs.purge_finished()} finished jobs')
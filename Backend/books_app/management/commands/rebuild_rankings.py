@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from books_app import rankings, response_cache
+from books_app.models import Book
+
+
+class Command(BaseCommand):
+    '''
+    Пересчет рейтингов: байесовские оценки книг (вместе с агрегатами оценок) и счетчики обсуждаемых книг
+    за последние RANKING_DISCUSSED_DAYS дней. Нужен после смены настроек RANKING_* или массовой загрузки данных.
+    '''
+    help = 'Rebuild Book.rating_score and the recently discussed counters (CommentDay, Book.comments_recent)'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            changed = Book.rebuild_ratings()
+        if changed:
+            response_cache.invalidate_all()
+        days = rankings.rebuild_discussions()
+        self.stdout.write(self.style.SUCCESS(f'Rankings rebuilt, books rescored: {changed}, comment days: {days}'))
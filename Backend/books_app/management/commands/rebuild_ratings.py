@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from books_app import response_cache
+from books_app.models import Book
+
+
+class Command(BaseCommand):
+    '''
+    Пересчет хранимых агрегатов рейтинга книг (количество, сумма, среднее) по таблице BookRate
+    '''
+    help = 'Rebuild Book.rating_count / rating_sum / rating_avg from BookRate rows'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            changed = Book.rebuild_ratings()
+        if changed:
+            response_cache.invalidate_all()
+        self.stdout.write(self.style.SUCCESS(f'Rating aggregates rebuilt, books changed: {changed}'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from books_app import search
+
+
+class Command(BaseCommand):
+    '''
+    Полное перестроение поискового индекса книг
+    '''
+    help = 'Rebuild the full-text search index for books'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not search.is_fts_available():
+            self.stdout.write('Full-text index is not used on this database backend, nothing to rebuild')
+            return
+        with transaction.atomic():
+            total = search.rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Search index rebuilt, books indexed: {total}'))
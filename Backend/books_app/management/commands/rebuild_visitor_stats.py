@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from books_app.models import Visitor
+
+
+class Command(BaseCommand):
+    '''
+    Пересчет счетчиков активности посетителей (оценки, гистограмма оценок, комментарии)
+    '''
+    help = 'Rebuild Visitor.ratings_count / comments_count / rates_N from BookRate and Comment rows'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            changed = Visitor.rebuild_stats()
+        self.stdout.write(self.style.SUCCESS(f'Visitor stats rebuilt, visitors changed: {changed}'))
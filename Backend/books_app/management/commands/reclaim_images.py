@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from books_app import response_cache, storage
+from books_app.models import Images
+
+
+class Command(BaseCommand):
+    '''
+    Освобождение места под изображения: старые файлы переносятся в хранилище по хешу содержимого
+    (дубликаты сливаются), файлы и уменьшенные копии без записей Images удаляются
+    '''
+    help = 'Move legacy image files to content-addressed storage, merge duplicates and delete orphaned files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be changed')
+        parser.add_argument('--grace-minutes', type=int, default=storage.ORPHAN_GRACE_SECONDS // 60,
+                            help='Keep unreferenced files modified within this many minutes (uploads in progress)')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        legacy = storage.deduplicate_legacy(dry_run)
+        if not dry_run and legacy['moved'] + legacy['merged']:
+            # У перенесенных изображений новые адреса
+            response_cache.invalidate_all()
+        orphans = storage.remove_orphans(options['grace_minutes'] * 60, dry_run)
+        shared = Images.objects.exclude(image='').values('image').annotate(refs=Count('pk')).filter(refs__gt=1).count()
+        prefix = 'Would free' if dry_run else 'Freed'
+        self.stdout.write(
+            f"Legacy files moved: {legacy['moved']}, merged into existing: {legacy['merged']}, "
+            f"missing: {legacy['missing']}; orphaned images: {orphans['images']}, "
+            f"thumbnails: {orphans['thumbnails']}; files shared by several images: {shared}"
+        )
+        freed = legacy['freed_bytes'] + orphans['freed_bytes']
+        self.stdout.write(self.style.SUCCESS(f'{prefix} {freed / 1024 / 1024:.1f} MB'))
@@ -0,0 +1,38 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from books_app import jobs, tasks
+
+
+class Command(BaseCommand):
+    '''
+    Воркер фоновой очереди: выполняет готовые задачи, пока не получит SIGTERM/SIGINT
+    '''
+    help = 'Run the background job worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run pending jobs and exit')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Poll interval when the queue is empty')
+        parser.add_argument('--name', action='append', dest='names', help='Only run jobs of this type')
+
+    def handle(self, *args, **options):
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        requeued = jobs.requeue_stale()
+        if requeued:
+            self.stdout.write(f'Requeued {requeued} stale jobs')
+        if not options['names'] or 'rankings.expire' in options['names']:
+            tasks.schedule_rankings_expiry()
+        while self.running:
+            done = jobs.run_pending(options['names'], limit=100)
+            if options['once'] and not done:
+                break
+            if not done:
+                close_old_connections()
+                time.sleep(options['sleep'])
+
+    def stop(self, *args):
+        self.running = False
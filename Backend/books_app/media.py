@@ -0,0 +1,135 @@
+'''
+Отдача загруженных файлов (MEDIA_ROOT: изображения книг и их уменьшенные копии) в продакшене.
+Поддерживаются условные запросы (ETag / If-None-Match, Last-Modified / If-Modified-Since),
+запросы части файла (Range, If-Range) и долгий срок кеширования (MEDIA_MAX_AGE).
+Если перед приложением стоит веб-сервер, передачу файла можно отдать ему (settings.MEDIA_ACCEL):
+"x-accel" - nginx, заголовок X-Accel-Redirect с внутренним адресом MEDIA_ACCEL_PREFIX + путь;
+"x-sendfile" - Apache (mod_xsendfile) / lighttpd, заголовок X-Sendfile с путем к файлу.
+Тогда воркер приложения только проверяет файл и заголовки и сразу освобождается.
+'''
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpRequest, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views import View
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def parse_range(header: str, size: int):
+    '''
+    Диапазон (start, end) включительно из заголовка Range. None - заголовка нет, он не разобран
+    или в нем несколько диапазонов (тогда отдается весь файл); ValueError - диапазон вне файла (416)
+    '''
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-N - последние N байт
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def read_range(path: str, start: int, length: int):
+    with open(path, 'rb') as stream:
+        stream.seek(start)
+        while length > 0:
+            chunk = stream.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def if_range_matches(request: HttpRequest, etag: str, mtime: int) -> bool:
+    '''
+    Диапазон применяется, если If-Range нет или он совпадает с текущей версией файла
+    '''
+    value = request.headers.get('If-Range')
+    if not value:
+        return True
+    if value.startswith(('"', 'W/')):
+        return value == etag
+    return parse_http_date_safe(value) == mtime
+
+
+class MediaView(View):
+    '''
+    Файл из MEDIA_ROOT по пути path
+    '''
+    def get(self, request: HttpRequest, path: str) -> HttpResponse:
+        try:
+            full_path = safe_join(settings.MEDIA_ROOT, path)
+        except SuspiciousFileOperation:
+            raise Http404('Not found')
+        try:
+            stat = os.stat(full_path)
+        except OSError:
+            raise Http404('Not found')
+        if not os.path.isfile(full_path):
+            raise Http404('Not found')
+
+        size, mtime = stat.st_size, int(stat.st_mtime)
+        etag = f'"{mtime:x}-{size:x}"'
+        content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+        response = get_conditional_response(request, etag=etag, last_modified=mtime)
+        if response is None:
+            response = self.file_response(request, path, full_path, size, content_type, etag, mtime)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(mtime)
+        response['Cache-Control'] = f'public, max-age={settings.MEDIA_MAX_AGE}'
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    def file_response(self, request, path, full_path, size, content_type, etag, mtime) -> HttpResponse:
+        if settings.MEDIA_ACCEL:
+            # Range и передачу файла обрабатывает веб-сервер
+            response = HttpResponse(content_type=content_type)
+            if settings.MEDIA_ACCEL == 'x-accel':
+                response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + path
+            else:
+                response['X-Sendfile'] = full_path
+            return response
+
+        byte_range = None
+        if if_range_matches(request, etag, mtime):
+            try:
+                byte_range = parse_range(request.headers.get('Range', ''), size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+
+        head = request.method == 'HEAD'
+        if byte_range is None:
+            # Весь файл: FileResponse отдает его через wsgi.file_wrapper (sendfile у gunicorn)
+            response = HttpResponse(content_type=content_type) if head \
+                else FileResponse(open(full_path, 'rb'), content_type=content_type)
+            response.headers.pop('Content-Disposition', None)
+            response['Content-Length'] = size
+            return response
+
+        start, end = byte_range
+        length = end - start + 1
+        response = HttpResponse(content_type=content_type, status=206) if head \
+            else StreamingHttpResponse(read_range(full_path, start, length), content_type=content_type, status=206)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = length
+        return response
@@ -0,0 +1,203 @@
+'''
+Метрики запросов по именам URL: число SQL-запросов, время SQL, время отрисовки шаблонов и полное время ответа.
+Замеры одного запроса собирает RequestMetricsMiddleware (books_app.middleware): SQL - через
+execute_wrapper всех соединений, шаблоны - через бэкенд InstrumentedTemplates (settings.TEMPLATES).
+Итоги копятся счетчиками в кеше (как статистика кеша ответов; без гарантии точности, см. record)
+и отдаются текстом в формате Prometheus.
+'''
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template.backends.django import DjangoTemplates
+from django.urls import URLPattern, URLResolver, get_resolver
+
+CACHE_ALIAS = getattr(settings, 'METRICS_CACHE_ALIAS', 'default')
+UNRESOLVED = '<unresolved>'
+
+# Счетчики: имя в кеше -> (имя метрики, описание, множитель для перевода в единицы метрики)
+COUNTERS = {
+    'requests': ('books_requests_total', 'Requests served', 1),
+    'errors': ('books_request_errors_total', 'Responses with status >= 500', 1),
+    'queries': ('books_request_queries_total', 'SQL queries issued', 1),
+    'sql_us': ('books_request_sql_seconds_total', 'Time spent in SQL', 1e-6),
+    'template_us': ('books_request_template_seconds_total', 'Time spent rendering templates', 1e-6),
+    'total_us': ('books_request_seconds_total', 'Total request latency', 1e-6),
+    'over_budget': ('books_request_over_budget_total', 'Requests that exceeded the view query budget', 1),
+}
+
+# Управление транзакциями не считается запросами (в тестах atomic выполняется через SAVEPOINT)
+TRANSACTION_STATEMENTS = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')
+
+current = ContextVar('request_metrics', default=None)
+
+
+def is_transaction_control(sql: str) -> bool:
+    return sql.lstrip().upper().startswith(TRANSACTION_STATEMENTS)
+
+
+class RequestMetrics:
+    '''
+    Замеры одного запроса; экземпляр служит и execute_wrapper для соединений БД
+    '''
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if not is_transaction_control(sql):
+                self.queries += 1
+            self.sql_time += time.perf_counter() - started
+
+    def as_dict(self, view: str, status: int) -> dict:
+        return {
+            'view': view,
+            'status': status,
+            'queries': self.queries,
+            'sql_ms': round(self.sql_time * 1000, 2),
+            'template_ms': round(self.template_time * 1000, 2),
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 2),
+        }
+
+
+class TimedTemplate:
+    '''
+    Обертка шаблона: время внешней отрисовки добавляется к замерам текущего запроса
+    (вложенные render_to_string внутри отрисовки не учитываются повторно)
+    '''
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        metrics = current.get()
+        if metrics is None:
+            return self.template.render(context, request)
+        metrics.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            metrics.template_depth -= 1
+            if not metrics.template_depth:
+                metrics.template_time += time.perf_counter() - started
+
+
+class InstrumentedTemplates(DjangoTemplates):
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+def query_budget(view_func, method: str = 'GET'):
+    '''
+    Допустимое число SQL-запросов view (вместе с запросами сессии и пользователя): атрибут query_budget
+    класса view; у ViewSet - число или словарь по действиям ({'list': 3}). None - без ограничения.
+    '''
+    view_class = getattr(view_func, 'view_class', None) or getattr(view_func, 'cls', None)
+    budget = getattr(view_class, 'query_budget', None)
+    if isinstance(budget, dict):
+        return budget.get(getattr(view_func, 'actions', {}).get(method.lower()))
+    return budget
+
+
+def _key(view: str, field: str) -> str:
+    return f'metrics:{view}:{field}'
+
+
+def record(view: str, status: int, metrics: RequestMetrics, over_budget: bool = False) -> dict:
+    '''
+    Добавляет замеры запроса к счетчикам view: по одному cache.incr на ненулевое поле, без общей транзакции.
+    Счетчики приблизительные: между полями одного запроса может попасть чужой запрос или сброс, а бэкенды
+    кеша без атомарного incr (база данных, файлы) и вытеснение ключей из кеша теряют приращения.
+    Для точного учета нужен бэкенд с атомарным incr (Redis, Memcached) и отдельный CACHE_ALIAS без вытеснения.
+    '''
+    sample = metrics.as_dict(view, status)
+    values = {
+        'requests': 1,
+        'errors': int(status >= 500),
+        'queries': metrics.queries,
+        'sql_us': int(metrics.sql_time * 1e6),
+        'template_us': int(metrics.template_time * 1e6),
+        'total_us': int(sample['total_ms'] * 1000),
+        'over_budget': int(over_budget),
+    }
+    cache = caches[CACHE_ALIAS]
+    for field, value in values.items():
+        if not value:
+            continue
+        key = _key(view, field)
+        try:
+            cache.incr(key, value)
+        except ValueError:
+            cache.add(key, value, None) or cache.incr(key, value)
+    return sample
+
+
+@lru_cache(maxsize=1)
+def view_names() -> tuple:
+    '''
+    Имена всех URL проекта с учетом пространств имен ("books_app:books_list")
+    '''
+    names = []
+
+    def walk(patterns, namespace):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                walk(pattern.url_patterns, f'{namespace}{pattern.namespace}:' if pattern.namespace else namespace)
+            elif isinstance(pattern, URLPattern) and pattern.name:
+                names.append(f'{namespace}{pattern.name}')
+
+    walk(get_resolver().url_patterns, '')
+    return tuple(dict.fromkeys(names)) + (UNRESOLVED,)
+
+
+def totals() -> dict:
+    '''
+    Накопленные счетчики по view: {view: {поле: значение}} (view без запросов пропускаются)
+    '''
+    keys = {_key(view, field): (view, field) for view in view_names() for field in COUNTERS}
+    result = {}
+    for key, value in caches[CACHE_ALIAS].get_many(list(keys)).items():
+        view, field = keys[key]
+        result.setdefault(view, dict.fromkeys(COUNTERS, 0))[field] = value
+    return result
+
+
+def reset() -> None:
+    caches[CACHE_ALIAS].delete_many([_key(view, field) for view in view_names() for field in COUNTERS])
+
+
+def render_text(extra: dict = None) -> str:
+    '''
+    Счетчики в текстовом формате Prometheus; extra - дополнительные метрики {имя: (описание, значение)}
+    '''
+    data = totals()
+    lines = []
+    for field, (name, description, scale) in COUNTERS.items():
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} counter')
+        for view in sorted(data):
+            value = data[view][field] if scale == 1 else f'{data[view][field] * scale:.6f}'
+            lines.append(f'{name}{{view="{view}"}} {value}')
+    for name, (description, value) in (extra or {}).items():
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} gauge')
+        if isinstance(value, dict):
+            lines.extend(f'{name}{{{label}}} {item}' for label, item in value.items())
+        else:
+            lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
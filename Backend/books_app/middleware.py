@@ -0,0 +1,109 @@
+import json
+import logging
+import os
+
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.deprecation import MiddlewareMixin
+
+from books_app import metrics
+from books_app.staticfiles import StaticFilesIndex
+from books_app.db_routers import primary_written, replica_reads
+
+logger = logging.getLogger('books_app.requests')
+
+PIN_COOKIE = 'db_primary'
+
+
+def allows_replica_reads(request, view_func) -> bool:
+    '''
+    Разрешены ли view чтения с реплики: обычные view - атрибутом replica_reads,
+    ViewSet DRF - перечнем действий replica_actions
+    '''
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    actions = getattr(view_func, 'actions', None)
+    if actions is not None:
+        return actions.get(request.method.lower()) in getattr(view_func.cls, 'replica_actions', ())
+    return getattr(getattr(view_func, 'view_class', None), 'replica_reads', False)
+
+
+class ReplicaRoutingMiddleware(MiddlewareMixin):
+    '''
+    Включает чтение с реплик для разрешенных view. Запрос, записавший в основную базу,
+    ставит cookie, и следующие REPLICA_PIN_SECONDS секунд чтения этой сессии идут в default.
+    '''
+    def process_request(self, request):
+        replica_reads.set(False)
+        primary_written.set(False)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if PIN_COOKIE not in request.COOKIES and allows_replica_reads(request, view_func):
+            replica_reads.set(True)
+
+    def process_response(self, request, response):
+        if primary_written.get():
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax')
+        replica_reads.set(False)
+        primary_written.set(False)
+        return response
+
+
+class RequestMetricsMiddleware(MiddlewareMixin):
+    '''
+    Замеры запроса (SQL-запросы и их время, отрисовка шаблонов, полное время) по имени URL:
+    счетчики для /metrics (books_app.metrics) и строка JSON в лог books_app.requests.
+    Превышение бюджета запросов view (атрибут query_budget) пишется в лог с уровнем WARNING.
+    Должен стоять первым в MIDDLEWARE, чтобы учитывать время остальных middleware.
+    '''
+    def process_request(self, request):
+        request._metrics = metrics.RequestMetrics()
+        metrics.current.set(request._metrics)
+        request._query_budget = None
+        for connection in connections.all():
+            connection.execute_wrappers.append(request._metrics)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_budget = metrics.query_budget(view_func, request.method)
+
+    def process_response(self, request, response):
+        recorder = getattr(request, '_metrics', None)
+        if recorder is None:
+            return response
+        for connection in connections.all():
+            if recorder in connection.execute_wrappers:
+                connection.execute_wrappers.remove(recorder)
+        metrics.current.set(None)
+
+        match = request.resolver_match
+        view = match.view_name if match else metrics.UNRESOLVED
+        budget = request._query_budget
+        over_budget = budget is not None and recorder.queries > budget
+        sample = metrics.record(view, response.status_code, recorder, over_budget)
+        sample.update(method=request.method, path=request.path)
+        if over_budget:
+            logger.warning('Query budget exceeded (%s > %s): %s', recorder.queries, budget, json.dumps(sample))
+        else:
+            logger.info(json.dumps(sample))
+        return response
+
+
+class StaticFilesMiddleware(MiddlewareMixin):
+    '''
+    Отдача собранной статики из STATIC_ROOT самим приложением (settings.STATIC_PIPELINE, см. books_app.staticfiles).
+    Стоит первым в MIDDLEWARE: запросы статики не доходят до сессий, метрик и маршрутизации URL.
+    '''
+    def __init__(self, get_response):
+        if not settings.STATIC_PIPELINE or not settings.STATIC_ROOT or not os.path.isdir(settings.STATIC_ROOT):
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        self.prefix = urlsplit(settings.STATIC_URL).path
+        self.index = StaticFilesIndex(settings.STATIC_ROOT)
+
+    def process_request(self, request):
+        if request.method not in ('GET', 'HEAD') or not request.path_info.startswith(self.prefix):
+            return None
+        return self.index.response(request, request.path_info[len(self.prefix):])
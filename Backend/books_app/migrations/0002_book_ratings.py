@@ -0,0 +1,36 @@
+# Generated by Django 4.2.6 on 2026-10-18 07:11
+
+from django.db import migrations, models
+
+from books_app.models import recount_ratings
+
+
+def backfill_ratings(apps, schema_editor):
+    recount_ratings(apps.get_model('books_app', 'Book'), apps.get_model('books_app', 'BookRate'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='rating_avg',
+            field=models.FloatField(default=0, editable=False, verbose_name='Средняя оценка'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество оценок'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Сумма оценок'),
+        ),
+        # Агрегаты существующих оценок
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.6 on 2026-10-18 07:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books_app', '0002_book_ratings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='images',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, verbose_name='Хеш содержимого'),
+        ),
+        migrations.AddField(
+            model_name='images',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Ширина оригинала'),
+        ),
+    ]
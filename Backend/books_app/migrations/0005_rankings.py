@@ -0,0 +1,47 @@
+# Generated by Django 4.2.6 on 2026-10-18 07:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from books_app import rankings
+from books_app.models import recount_ratings
+
+
+def backfill_rankings(apps, schema_editor):
+    Book = apps.get_model('books_app', 'Book')
+    recount_ratings(Book, apps.get_model('books_app', 'BookRate'))
+    rankings.rebuild_discussions(Book, apps.get_model('books_app', 'Comment'), apps.get_model('books_app', 'CommentDay'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books_app', '0004_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='comments_recent',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Комментариев за последние дни'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_score',
+            field=models.FloatField(db_index=True, default=0, editable=False, verbose_name='Байесовская оценка'),
+        ),
+        migrations.CreateModel(
+            name='CommentDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(db_index=True)),
+                ('comments', models.PositiveIntegerField(default=0)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comment_days', to='books_app.book')),
+            ],
+            options={
+                'unique_together': {('book', 'day')},
+            },
+        ),
+        # Байесовские оценки по существующим оценкам и окно обсуждаемых книг по существующим комментариям
+        migrations.RunPython(backfill_rankings, migrations.RunPython.noop),
+    ]
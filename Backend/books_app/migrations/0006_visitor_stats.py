@@ -0,0 +1,71 @@
+# Generated by Django 4.2.6 on 2026-10-18 07:11
+
+from django.db import migrations, models
+import django.utils.timezone
+
+from books_app.models import recount_visitor_stats
+
+
+def backfill_visitor_stats(apps, schema_editor):
+    recount_visitor_stats(apps.get_model('books_app', 'Visitor'), apps.get_model('books_app', 'BookRate'),
+                          apps.get_model('books_app', 'Comment'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books_app', '0005_rankings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookrate',
+            name='rated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Время оценки'),
+        ),
+        migrations.AddField(
+            model_name='visitor',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество комментариев'),
+        ),
+        migrations.AddField(
+            model_name='visitor',
+            name='rates_1',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок "1"'),
+        ),
+        migrations.AddField(
+            model_name='visitor',
+            name='rates_2',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок "2"'),
+        ),
+        migrations.AddField(
+            model_name='visitor',
+            name='rates_3',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок "3"'),
+        ),
+        migrations.AddField(
+            model_name='visitor',
+            name='rates_4',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок "4"'),
+        ),
+        migrations.AddField(
+            model_name='visitor',
+            name='rates_5',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок "5"'),
+        ),
+        migrations.AddField(
+            model_name='visitor',
+            name='ratings_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество оценок'),
+        ),
+        migrations.AddIndex(
+            model_name='bookrate',
+            index=models.Index(fields=['visitor', 'rated_at'], name='bookrate_visitor_rated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['visitor', 'published_at'], name='comment_visitor_published_idx'),
+        ),
+        # Счетчики по существующим оценкам и комментариям
+        migrations.RunPython(backfill_visitor_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.6 on 2026-10-18 07:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books_app', '0006_visitor_stats'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='author',
+            options={'ordering': ['surname', 'name']},
+        ),
+        migrations.AlterModelOptions(
+            name='book',
+            options={'ordering': ['name']},
+        ),
+        migrations.AddIndex(
+            model_name='author',
+            index=models.Index(fields=['surname', 'name'], name='author_surname_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='author',
+            index=models.Index(fields=['name'], name='author_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='author',
+            index=models.Index(fields=['year_of_birth'], name='author_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['name'], name='book_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['year'], name='book_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['book', 'tree_id', 'lft'], name='comment_book_tree_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['published_at'], name='comment_published_idx'),
+        ),
+    ]
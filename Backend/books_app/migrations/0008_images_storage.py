@@ -0,0 +1,29 @@
+# Generated by Django 4.2.6 on 2026-10-18 07:11
+
+import books_app.models
+import books_app.storage
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books_app', '0007_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='images',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=books_app.storage.ContentAddressedStorage(), upload_to=books_app.models.get_image_filename, validators=[django.core.validators.FileExtensionValidator(allowed_extensions=('png', 'jpg', 'webp', 'jpeg', 'gif'))], verbose_name='Изовражение'),
+        ),
+        migrations.AddIndex(
+            model_name='images',
+            index=models.Index(fields=['image'], name='images_image_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='images',
+            index=models.Index(fields=['content_hash'], name='images_content_hash_idx'),
+        ),
+    ]
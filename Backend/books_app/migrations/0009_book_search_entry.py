@@ -0,0 +1,24 @@
+# Generated by Django 4.2.6 on 2026-10-18 07:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books_app', '0008_images_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookSearchEntry',
+            fields=[
+                ('book', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='books_app.book')),
+            ],
+            options={
+                'db_table': 'books_app_book_fts',
+                'managed': False,
+            },
+        ),
+    ]
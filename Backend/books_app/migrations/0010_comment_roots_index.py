@@ -0,0 +1,17 @@
+# Generated by Django 4.2.6 on 2026-10-18 07:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books_app', '0009_book_search_entry'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['level', 'book', 'published_at'], name='comment_book_roots_idx'),
+        ),
+    ]
@@ -1,15 +1,29 @@
+import sys
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.validators import FileExtensionValidator
-from django.db import models
-from django.template.defaultfilters import slugify
+from django.db import connections, models, transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import Greatest
 from django.urls import reverse
+from django.utils import timezone
 from mptt.models import MPTTModel, TreeForeignKey
+from books_app import response_cache, storage, thumbnails
 
 
 class Author(models.Model):
     '''Модель автора книги'''
-    class META:
-        ordering = ["surname"]
+    class Meta:
+        ordering = ["surname", "name"]
+        indexes = [
+            # Сортировка по умолчанию и ?ordering=surname, фильтр ?surname=
+            models.Index(fields=['surname', 'name'], name='author_surname_name_idx'),
+            models.Index(fields=['name'], name='author_name_idx'),
+            models.Index(fields=['year_of_birth'], name='author_year_idx'),
+        ]
 
     name = models.CharField(max_length=50)
     surname = models.CharField(max_length=50)
@@ -20,11 +34,73 @@ class Author(models.Model):
         full_name = "%s %s" % (self.name, self.surname)
         return full_name.strip()
 
+    @property
+    def lookup_label(self) -> str:
+        '''Подпись автора в подсказках: однофамильцев различает год рождения'''
+        return f'{self} ({self.year_of_birth})'
+
+    @staticmethod
+    def _prefix(field: str, prefix: str) -> Q:
+        '''
+        Условие "начинается с" диапазоном [prefix, следующий префикс): в отличие от LIKE идет по индексу.
+        Для префикса, у которого нет следующего (последний символ U+10FFFF), - обычный startswith
+        '''
+        last = ord(prefix[-1]) + 1
+        if 0xD800 <= last <= 0xDFFF:
+            # Суррогаты не бывают в строках UTF-8, следующий символ после U+D7FF - U+E000
+            last = 0xE000
+        if last > sys.maxunicode:
+            return Q(**{f'{field}__startswith': prefix})
+        return Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix[:-1] + chr(last)})
+
+    @classmethod
+    def prefix_lookup(cls, text: str, limit: int = 10) -> list:
+        '''
+        Авторы для подсказки ввода: фамилия или имя начинаются с введенного текста, для двух слов -
+        имя и фамилия в любом порядке. LIKE в SQLite не различает регистр только для латиницы и не использует
+        индекс, поэтому ищутся несколько написаний введенного (как есть, с заглавной буквы, с заглавной
+        и строчными, прописными) диапазонами по индексам (surname, name) и (name), не больше двух запросов.
+        Имена с заглавной буквой внутри слова (McCarthy) находятся, только если она введена заглавной.
+        '''
+        words = text.split()[:2]
+        if not words:
+            return []
+        spellings = list(dict.fromkeys(
+            tuple(spell(word) for word in words)
+            for spell in (str, lambda word: word[:1].upper() + word[1:], str.capitalize, str.upper)
+        ))
+        if len(words) == 1:
+            queries = [
+                cls.objects.filter(reduce(or_, (cls._prefix('surname', word) for word, in spellings)))
+                .order_by('surname', 'name'),
+                cls.objects.filter(reduce(or_, (cls._prefix('name', word) for word, in spellings))).order_by('name'),
+            ]
+        else:
+            queries = [
+                cls.objects.filter(reduce(or_, (cls._prefix('name', first) & cls._prefix('surname', second)
+                                                for first, second in spellings))).order_by('surname', 'name'),
+                cls.objects.filter(reduce(or_, (cls._prefix('surname', first) & cls._prefix('name', second)
+                                                for first, second in spellings))).order_by('surname', 'name'),
+            ]
+        found = {}
+        for queryset in queries:
+            for author in queryset.only('pk', 'name', 'surname', 'year_of_birth')[:limit]:
+                found[author.pk] = author
+        return sorted(found.values(), key=lambda author: (author.surname, author.name, author.pk))[:limit]
+
+
+RATING_FIELDS = ['rating_count', 'rating_sum', 'rating_avg', 'rating_score']
+
 
 class Book(models.Model):
     '''Модель книги'''
-    class META:
+    class Meta:
         ordering = ["name"]
+        indexes = [
+            # Список и API: сортировка по умолчанию, ?ordering=name|year, фильтры ?name= и ?year=
+            models.Index(fields=['name'], name='book_name_idx'),
+            models.Index(fields=['year'], name='book_year_idx'),
+        ]
 
     class BookManager(models.Manager):
         '''
@@ -34,20 +110,25 @@ class Book(models.Model):
             '''
             Список статей (SQL запрос для страницы списка книг)
             '''
-            return self.get_queryset().select_related('author').prefetch_related('ratings')
+            return self.get_queryset().select_related('author')
 
         def detail(self):
             """
-            Детализация книги (SQL запрос с фильтрацией для страницы с книгой)
+            Детализация книги (SQL запрос с фильтрацией для страницы с книгой).
+            Дерево комментариев выбирается отдельно, см. books_app.comments
             """
-            return self.get_queryset() \
-                .select_related('author') \
-                .prefetch_related('comments', 'comments__visitor', 'ratings')
+            return self.get_queryset().select_related('author')
 
     name = models.CharField(max_length=100, verbose_name='Название книги')
     author = models.ForeignKey(Author, on_delete=models.CASCADE, verbose_name='Автор')
     year = models.PositiveSmallIntegerField(verbose_name='Год издания')
     description = models.TextField(null=False, blank=True, verbose_name='Краткое описание')
+    rating_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество оценок')
+    rating_sum = models.PositiveIntegerField(default=0, editable=False, verbose_name='Сумма оценок')
+    rating_avg = models.FloatField(default=0, editable=False, verbose_name='Средняя оценка')
+    rating_score = models.FloatField(default=0, editable=False, db_index=True, verbose_name='Байесовская оценка')
+    comments_recent = models.PositiveIntegerField(default=0, editable=False, db_index=True,
+                                                  verbose_name='Комментариев за последние дни')
 
     custom = BookManager()
 
@@ -61,17 +142,104 @@ class Book(models.Model):
     def get_success_url(self):
         return reverse(
             'books_app:book_details',
-            kwargs={'pk': self.object.pk}
+            kwargs={'pk': self.pk}
         )
 
     def get_sum_rating(self) -> float:
         '''
-        Функция, для получения средней велечины рейтинга
+        Функция, для получения средней велечины рейтинга (хранится в самой книге)
+        '''
+        return self.rating_avg
+
+    @staticmethod
+    def bayesian_score(count: int, total: int) -> float:
+        '''
+        Оценка для рейтинга лучших книг: среднее, "притянутое" к RANKING_PRIOR_MEAN с весом RANKING_PRIOR_VOTES голосов,
+        чтобы пара пятерок не обгоняла сотню четверок. Книги меньше чем с RANKING_MIN_VOTES оценками получают 0.
+        '''
+        if count < settings.RANKING_MIN_VOTES:
+            return 0.0
+        return (settings.RANKING_PRIOR_MEAN * settings.RANKING_PRIOR_VOTES + total) / (settings.RANKING_PRIOR_VOTES + count)
+
+    @classmethod
+    def lock_ratings(cls, book_ids) -> list:
+        '''
+        Книги с агрегатами рейтинга, заблокированные до конца транзакции. Строки блокируются в порядке pk,
+        поэтому конкурентные пакеты оценок не ждут друг друга по кругу. В SQLite нет SELECT FOR UPDATE,
+        а транзакция, начатая чтением, при первой записи получает "database is locked" без ожидания
+        busy timeout, поэтому там сначала выполняется пустой UPDATE, захватывающий блокировку записи.
         '''
-        rate_count = len(self.ratings.all())
-        if rate_count != 0:
-            return sum([rating.rate for rating in self.ratings.all()]) / rate_count
-        return 0
+        queryset = cls.custom.filter(pk__in=book_ids).order_by('pk').only('pk', *RATING_FIELDS)
+        if not connections[queryset.db].features.has_select_for_update:
+            queryset.update(rating_count=F('rating_count'))
+            return list(queryset)
+        return list(queryset.select_for_update())
+
+    @classmethod
+    def rebuild_ratings(cls) -> int:
+        '''
+        Пересчет агрегатов рейтинга всех книг по таблице BookRate. Возвращает количество обновленных книг.
+        '''
+        return recount_ratings(cls, BookRate)
+
+    @classmethod
+    def refresh_ratings(cls, book_ids) -> None:
+        '''
+        Пересчет агрегатов рейтинга отдельных книг по их оценкам - для оценок, удаленных в обход
+        BookRate.apply_votes (админка, каскад при удалении посетителя или пользователя)
+        '''
+        totals = {
+            row['book']: (row['count'], row['total'])
+            for row in BookRate.objects.filter(book__in=book_ids).values('book')
+            .annotate(count=Count('pk'), total=Sum('rate')).order_by()
+        }
+        for book_id in book_ids:
+            count, total = totals.get(book_id, (0, 0))
+            cls.custom.filter(pk=book_id).update(
+                rating_count=count, rating_sum=total, rating_avg=total / count if count else 0,
+                rating_score=cls.bayesian_score(count, total),
+            )
+
+
+def recount_ratings(book_model, rate_model) -> int:
+    '''
+    Пересчет агрегатов рейтинга книг по оценкам (Book.rebuild_ratings). Модели передаются явно, чтобы
+    пересчет могли вызывать миграции с историческими моделями: пересчитываются поля, которые в них уже есть.
+    '''
+    existing = {field.name for field in book_model._meta.concrete_fields}
+    fields = [name for name in RATING_FIELDS if name in existing]
+    totals = {
+        row['book']: (row['count'], row['total'])
+        for row in rate_model.objects.values('book').annotate(count=Count('pk'), total=Sum('rate')).order_by()
+    }
+    changed = []
+    for book in book_model._default_manager.only('pk', *fields).iterator():
+        count, total = totals.get(book.pk, (0, 0))
+        values = {
+            'rating_count': count,
+            'rating_sum': total,
+            'rating_avg': total / count if count else 0,
+            'rating_score': Book.bayesian_score(count, total),
+        }
+        if any(getattr(book, name) != values[name] for name in fields):
+            for name in fields:
+                setattr(book, name, values[name])
+            changed.append(book)
+    book_model._default_manager.bulk_update(changed, fields, batch_size=500)
+    return len(changed)
+
+
+class BookSearchEntry(models.Model):
+    '''
+    Строка поискового индекса FTS5 (books_app.search): таблицу создает и заполняет search, а не миграции.
+    Модель нужна только для соединения книг с индексом в запросах (book__search_entry)
+    '''
+    book = models.OneToOneField(Book, primary_key=True, db_column='rowid', on_delete=models.DO_NOTHING,
+                                db_constraint=False, related_name='search_entry')
+
+    class Meta:
+        managed = False
+        db_table = 'books_app_book_fts'
 
 
 class Visitor(models.Model):
@@ -80,23 +248,205 @@ class Visitor(models.Model):
     name = models.CharField(max_length=100)
     surname = models.CharField(max_length=100)
     bio = models.TextField(max_length=500, blank=True)
+    # Счетчики активности (обновляются при оценках и комментариях, см. change_stats)
+    ratings_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество оценок')
+    comments_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество комментариев')
+    rates_1 = models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок "1"')
+    rates_2 = models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок "2"')
+    rates_3 = models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок "3"')
+    rates_4 = models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок "4"')
+    rates_5 = models.PositiveIntegerField(default=0, editable=False, verbose_name='Оценок "5"')
+
+    STATS_FIELDS = ['ratings_count', 'comments_count', 'rates_1', 'rates_2', 'rates_3', 'rates_4', 'rates_5']
 
     def get_success_url(self):
-        return reverse('books_app:visitor_details', kwargs={'pk': self.object.pk})
+        return reverse('books_app:visitor_details', kwargs={'pk': self.pk})
+
+    @property
+    def rating_histogram(self) -> list:
+        '''
+        Гистограмма оценок посетителя: [(оценка, количество, доля в процентах)] от 5 до 1
+        '''
+        return [
+            (rate, getattr(self, f'rates_{rate}'),
+             round(getattr(self, f'rates_{rate}') * 100 / self.ratings_count) if self.ratings_count else 0)
+            for rate in range(5, 0, -1)
+        ]
+
+    @classmethod
+    def change_stats(cls, visitor_id, **deltas) -> None:
+        '''
+        Атомарное изменение счетчиков посетителя одним UPDATE: change_stats(pk, ratings_count=1, rates_5=1).
+        Уменьшение не опускает счетчик ниже нуля (поле беззнаковое, CHECK в базе)
+        '''
+        deltas = {name: F(name) + delta if delta > 0 else Greatest(F(name) + delta, 0)
+                  for name, delta in deltas.items() if delta}
+        if deltas:
+            cls.objects.filter(pk=visitor_id).update(**deltas)
+
+    @classmethod
+    def change_stats_bulk(cls, deltas_by_visitor: dict, batch_size: int = 500) -> None:
+        '''
+        change_stats для многих посетителей ({visitor_id: {поле: изменение}}): один UPDATE с CASE по pk на пачку
+        '''
+        visitor_ids = [visitor_id for visitor_id, deltas in deltas_by_visitor.items() if any(deltas.values())]
+        for start in range(0, len(visitor_ids), batch_size):
+            batch = visitor_ids[start:start + batch_size]
+            names = {name for visitor_id in batch for name, delta in deltas_by_visitor[visitor_id].items() if delta}
+            cls.objects.filter(pk__in=batch).update(**{
+                name: Greatest(F(name) + Case(*[When(pk=visitor_id, then=Value(deltas_by_visitor[visitor_id][name]))
+                                                for visitor_id in batch if deltas_by_visitor[visitor_id].get(name)],
+                                              default=Value(0)), 0)
+                for name in names
+            })
+
+    @classmethod
+    def rebuild_stats(cls) -> int:
+        '''
+        Пересчет счетчиков всех посетителей по оценкам и комментариям. Возвращает количество обновленных.
+        '''
+        return recount_visitor_stats(cls, BookRate, Comment)
 
     def __str__(self) -> str:
         full_name = "%s %s" % (self.surname, self.name)
         return full_name.strip()
 
 
+def recount_visitor_stats(visitor_model, rate_model, comment_model) -> int:
+    '''
+    Пересчет счетчиков посетителей (Visitor.rebuild_stats); модели передаются явно для вызова из миграций
+    '''
+    rates = {}
+    for row in rate_model.objects.values('visitor', 'rate').annotate(count=Count('pk')).order_by():
+        rates.setdefault(row['visitor'], {})[row['rate']] = row['count']
+    comments = dict(comment_model.objects.values_list('visitor').annotate(count=Count('pk')).order_by())
+    changed = []
+    for visitor in visitor_model.objects.only('pk', *Visitor.STATS_FIELDS).iterator():
+        histogram = rates.get(visitor.pk, {})
+        values = [sum(histogram.values()), comments.get(visitor.pk, 0)]
+        values += [histogram.get(rate, 0) for rate in range(1, 6)]
+        if [getattr(visitor, name) for name in Visitor.STATS_FIELDS] != values:
+            for name, value in zip(Visitor.STATS_FIELDS, values):
+                setattr(visitor, name, value)
+            changed.append(visitor)
+    visitor_model.objects.bulk_update(changed, Visitor.STATS_FIELDS, batch_size=500)
+    return len(changed)
+
+
 class BookRate(models.Model):
     '''Модель рейтинка книг'''
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='ratings')
     visitor = models.ForeignKey(Visitor, on_delete=models.CASCADE, related_name='visitor_rate')
     rate = models.PositiveSmallIntegerField(choices=[(1, 'один'), (2, 'два'), (3, 'три'), (4, 'четыре'), (5, 'пять')])
+    rated_at = models.DateTimeField(default=timezone.now, verbose_name='Время оценки')
 
     class Meta:
         unique_together = ('book', 'visitor')
+        indexes = [
+            # Последние оценки посетителя (страница посетителя) - проход по индексу без сортировки
+            models.Index(fields=['visitor', 'rated_at'], name='bookrate_visitor_rated_idx'),
+        ]
+
+    @classmethod
+    def toggle(cls, visitor, book_id, rate: int) -> tuple:
+        '''
+        Выставление оценки: повторная такая же оценка удаляет голос, другая - заменяет его.
+        Агрегаты книги меняются в той же транзакции. Возвращает (статус, новое среднее).
+        '''
+        visitor_id = getattr(visitor, 'pk', visitor)
+        book_id = int(book_id)
+        statuses, aggregates = cls.apply_votes([(visitor_id, book_id, rate)])
+        if book_id not in aggregates:
+            raise Book.DoesNotExist(f'Book {book_id} does not exist')
+        return statuses[visitor_id, book_id], aggregates[book_id][1]
+
+    @classmethod
+    def apply_votes(cls, votes, mode: str = 'toggle') -> tuple:
+        '''
+        Пакет оценок [(visitor_id, book_id, rate), ...] в одной транзакции с постоянным числом запросов:
+        существующие голоса читаются одним запросом, изменения пишутся bulk_create / bulk_update / DELETE,
+        агрегаты всех затронутых книг - одним bulk_update, счетчики посетителя - одним UPDATE.
+        mode='toggle' - как toggle; mode='set' - оценка просто выставляется, rate=0 удаляет голос
+        (повторная отправка того же пакета ничего не меняет, удобно для импорта).
+        Несколько голосов за одну книгу применяются по порядку.
+        Возвращает ({(visitor_id, book_id): статус}, {book_id: (rating_count, rating_avg)});
+        статусы: created, updated, deleted, unchanged, not_found (книги нет).
+        '''
+        if mode not in ('toggle', 'set'):
+            raise ValueError(f'Unknown voting mode {mode!r}')
+        votes = [(int(visitor_id), int(book_id), int(rate)) for visitor_id, book_id, rate in votes]
+        allowed = {value for value, _ in cls._meta.get_field('rate').choices} | ({0} if mode == 'set' else set())
+        invalid = [rate for _, _, rate in votes if rate not in allowed]
+        if invalid:
+            raise ValueError(f'Invalid rate {invalid[0]}')
+        if not votes:
+            return {}, {}
+        with transaction.atomic():
+            books = {book.pk: book for book in Book.lock_ratings({book_id for _, book_id, _ in votes})}
+            existing = {
+                (rating.visitor_id, rating.book_id): rating
+                for rating in cls.objects.filter(
+                    book_id__in=books, visitor_id__in={visitor_id for visitor_id, _, _ in votes},
+                ).only('pk', 'visitor_id', 'book_id', 'rate')
+            }
+            before = {key: rating.rate for key, rating in existing.items()}
+            after = dict(before)
+            statuses, touched = {}, {}
+            for visitor_id, book_id, rate in votes:
+                key = (visitor_id, book_id)
+                if book_id not in books:
+                    statuses[key] = 'not_found'
+                    continue
+                remove = after.get(key) == rate if mode == 'toggle' else not rate
+                after[key] = None if remove else rate
+                touched[key] = True
+
+            created, updated, deleted, changed = [], [], [], set()
+            visitor_deltas = {}
+            now = timezone.now()
+            for key in touched:
+                old, new = before.get(key), after[key]
+                book = books[key[1]]
+                if old == new:
+                    statuses[key] = 'unchanged'
+                    continue
+                if old is None:
+                    statuses[key] = 'created'
+                    created.append(cls(visitor_id=key[0], book_id=key[1], rate=new, rated_at=now))
+                elif new is None:
+                    statuses[key] = 'deleted'
+                    deleted.append(existing[key].pk)
+                else:
+                    statuses[key] = 'updated'
+                    existing[key].rate, existing[key].rated_at = new, now
+                    updated.append(existing[key])
+                deltas = visitor_deltas.setdefault(key[0], {})
+                deltas['ratings_count'] = deltas.get('ratings_count', 0) + (new is not None) - (old is not None)
+                for rate, sign in ((old, -1), (new, 1)):
+                    if rate is not None:
+                        deltas[f'rates_{rate}'] = deltas.get(f'rates_{rate}', 0) + sign
+                book.rating_count += (new is not None) - (old is not None)
+                book.rating_sum += (new or 0) - (old or 0)
+                book.rating_avg = book.rating_sum / book.rating_count if book.rating_count else 0
+                book.rating_score = Book.bayesian_score(book.rating_count, book.rating_sum)
+                changed.add(book)
+
+            if created:
+                cls.objects.bulk_create(created, batch_size=500)
+            if updated:
+                cls.objects.bulk_update(updated, ['rate', 'rated_at'], batch_size=500)
+            if deleted:
+                # Без сборщика удаления: у оценок нет зависимых строк, а сигналы заменяет сброс кеша ниже
+                cls.objects.filter(pk__in=deleted)._raw_delete(cls.objects.db)
+            for visitor_id, deltas in visitor_deltas.items():
+                Visitor.change_stats(visitor_id, **deltas)
+            if changed:
+                Book.custom.bulk_update(changed, RATING_FIELDS, batch_size=500)
+                book_ids = [book.pk for book in changed]
+                transaction.on_commit(lambda: response_cache.invalidate_books(book_ids))
+
+        aggregates = {book.pk: (book.rating_count, book.rating_avg) for book in books.values()}
+        return statuses, aggregates
 
 
 class Comment(MPTTModel):
@@ -108,25 +458,104 @@ class Comment(MPTTModel):
     parent = TreeForeignKey('self', verbose_name='Родительский комментарий', null=True, blank=True,
                             related_name='children', on_delete=models.CASCADE)
 
-    class MTTMeta:
-        order_insertion_by = ('-published_at',)
+    class Meta:
+        indexes = [
+            # Последние комментарии посетителя (страница посетителя)
+            models.Index(fields=['visitor', 'published_at'], name='comment_visitor_published_idx'),
+            # Окно дерева комментариев книги (books_app.comments): ветки по порядку без сортировки
+            models.Index(fields=['book', 'tree_id', 'lft'], name='comment_book_tree_idx'),
+            # Корни веток книги (level=0), новые первыми (страницы окна)
+            models.Index(fields=['level', 'book', 'published_at'], name='comment_book_roots_idx'),
+            # Пересчет окна обсуждаемых книг (rankings.rebuild_discussions)
+            models.Index(fields=['published_at'], name='comment_published_idx'),
+        ]
 
     def __str__(self):
         return f'{self.visitor}:{self.comment}'
 
 
+class CommentDay(models.Model):
+    '''Число комментариев к книге за день (окно рейтинга обсуждаемых книг, см. books_app.rankings)'''
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='comment_days')
+    day = models.DateField(db_index=True)
+    comments = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('book', 'day')
+
+
 def get_image_filename(instance, filename):
-    title = instance.book.name
-    slug = slugify(title)
-    return "book_images/%s-%s" % (slug, filename)
+    '''
+    Имя для upload_to; окончательное имя по хешу содержимого выбирает хранилище (books_app.storage),
+    от исходного имени остается только расширение
+    '''
+    return f'{storage.DIRECTORY}/{filename}'
 
 class Images(models.Model):
     '''Модель изображений книг'''
     book = models.ForeignKey(Book, on_delete=models.CASCADE, default=None)
     image = models.ImageField(
         upload_to=get_image_filename,
+        storage=storage.image_storage,
         blank=True,
         null=True,
         verbose_name='Изовражение',
         validators=[FileExtensionValidator(allowed_extensions=('png', 'jpg', 'webp', 'jpeg', 'gif'))]
-    )
\ No newline at end of file
+    )
+    content_hash = models.CharField(max_length=64, blank=True, editable=False, verbose_name='Хеш содержимого')
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name='Ширина оригинала')
+
+    class Meta:
+        indexes = [
+            # Число ссылок на файл и на копии (удаление файлов без ссылок, reclaim_images)
+            models.Index(fields=['image'], name='images_image_idx'),
+            models.Index(fields=['content_hash'], name='images_content_hash_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.image and not self.image._committed:
+            # Файл записывается до сохранения строки, чтобы хеш содержимого попал в ту же запись;
+            # ширина сбрасывается - копии для нового файла строит фоновая задача
+            self.image.save(self.image.name, self.image.file, save=False)
+            self.content_hash = storage.content_hash(self.image.name)
+            self.image_width = None
+        super().save(*args, **kwargs)
+
+    @property
+    def webp_srcset(self) -> str:
+        '''
+        srcset уменьшенных копий (пустой, пока копии не построены)
+        '''
+        return thumbnails.srcset(self.content_hash, self.image_width, 'webp') if self.content_hash else ''
+
+    @property
+    def jpeg_srcset(self) -> str:
+        return thumbnails.srcset(self.content_hash, self.image_width, 'jpeg') if self.content_hash else ''
+
+class Job(models.Model):
+    '''Модель задачи фоновой очереди (см. books_app.jobs)'''
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [(QUEUED, 'в очереди'), (RUNNING, 'выполняется'), (DONE, 'выполнена'), (FAILED, 'ошибка')]
+
+    name = models.CharField(max_length=100, verbose_name='Тип задачи')
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+            models.Index(fields=['name', 'status'], name='job_name_status_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.name}#{self.pk} ({self.status})'
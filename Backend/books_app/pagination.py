@@ -0,0 +1,343 @@
+'''
+Keyset (cursor) пагинация для HTML-списков и API.
+Вместо OFFSET и COUNT(*) страница выбирается условием "строки после/до граничной записи"
+по стабильной сортировке (поля сортировки + pk), поэтому глубокие страницы не замедляются.
+Курсор - непрозрачная base64-строка с значениями полей граничной записи.
+'''
+import base64
+import datetime
+import json
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import Http404
+from django.utils.http import urlencode
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+PAGE_SIZE = getattr(settings, 'BOOKS_PAGE_SIZE', 3)
+MAX_PAGE_SIZE = getattr(settings, 'BOOKS_MAX_PAGE_SIZE', 100)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    '''
+    Время - с микросекундами (DjangoJSONEncoder округляет до миллисекунд, и граничная запись
+    с таким временем не нашлась бы по условию "после")
+    '''
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values: list, reverse: bool = False, offset: int = None) -> str:
+    payload = {'v': values, 'r': int(reverse)} if offset is None else {'o': offset}
+    data = json.dumps(payload, cls=CursorEncoder, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def _ordering_field(model, path: str):
+    '''
+    Поле модели по пути сортировки (author__surname); None - не поле модели (например, аннотация)
+    '''
+    opts, field = model._meta, None
+    for name in path.split('__'):
+        if field is not None:
+            if not field.is_relation:
+                return None
+            opts = field.related_model._meta
+        try:
+            field = opts.pk if name == 'pk' else opts.get_field(name)
+        except FieldDoesNotExist:
+            return None
+    return field
+
+
+def _coerce(model, name: str, value):
+    field = _ordering_field(model, name.lstrip('-'))
+    if field is None:
+        return value
+    if value is None:
+        if not field.null:
+            raise ValueError(f'{name} is not nullable')
+        return None
+    return field.to_python(value)
+
+
+def decode_cursor(cursor: str, model=None, ordering: list = None) -> dict:
+    '''
+    Содержимое курсора. С моделью и сортировкой (с pk в конце, см. stable_ordering) значения граничной записи
+    приводятся к типам полей сортировки: подделанный курсор или курсор от другой сортировки
+    дает InvalidCursor (404), а не ошибку в запросе
+    '''
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(data)
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
+    if not isinstance(payload, dict):
+        raise InvalidCursor(cursor)
+    if 'o' in payload:
+        if not isinstance(payload['o'], int) or payload['o'] < 0:
+            raise InvalidCursor(cursor)
+        return payload
+    values = payload.get('v')
+    if not isinstance(values, list):
+        raise InvalidCursor(cursor)
+    if model is not None:
+        if len(values) != len(ordering):
+            raise InvalidCursor(cursor)
+        try:
+            payload['v'] = [_coerce(model, name, value) for name, value in zip(ordering, values)]
+        except (ValidationError, ValueError, TypeError):
+            raise InvalidCursor(cursor)
+    return payload
+
+
+def stable_ordering(ordering) -> list:
+    '''
+    Сортировка с обязательным pk в конце, чтобы порядок строк был однозначным.
+    Добавленный pk идет в направлении последнего поля: индекс по полю (в SQLite он неявно содержит rowid)
+    тогда отдает строки уже в нужном порядке, в том числе при обратном проходе для "-year".
+    '''
+    fields = [name for name in ordering if name.lstrip('-') not in ('pk', 'id')]
+    default = '-pk' if fields and fields[-1].startswith('-') else 'pk'
+    return fields + [next((name for name in ordering if name.lstrip('-') in ('pk', 'id')), default)]
+
+
+def _value(obj, path: str):
+    if isinstance(obj, dict):
+        # строки queryset.values() (быстрое чтение в API)
+        return obj[path]
+    for attr in path.split('__'):
+        obj = getattr(obj, attr)
+    return obj
+
+
+def _after(ordering: list, values: list, reverse: bool) -> Q:
+    '''
+    Лексикографическое условие "строго после" граничной записи: (a > x) OR (a = x AND b > y) OR ...
+    Дополнительное a >= x не меняет результат, но дает планировщику диапазон по индексу первого поля:
+    без него OR разбирается на несколько поисков, и строки приходится сортировать заново.
+    '''
+    condition = Q()
+    equal = {}
+    for name, value in zip(ordering, values):
+        descending = name.startswith('-')
+        field_name = name.lstrip('-')
+        lookup = 'lt' if descending != reverse else 'gt'
+        condition |= Q(**equal, **{f'{field_name}__{lookup}': value})
+        equal[field_name] = value
+    if len(ordering) > 1 and values[0] is not None:
+        first = ordering[0]
+        condition &= Q(**{f"{first.lstrip('-')}__{'lte' if first.startswith('-') != reverse else 'gte'}": values[0]})
+    return condition
+
+
+@dataclass
+class KeysetPage:
+    object_list: list
+    next_cursor: str = None
+    previous_cursor: str = None
+    page_size: int = PAGE_SIZE
+    ordering: list = field(default_factory=list)
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def _ordered_by_annotation(queryset) -> bool:
+    return any(str(name).lstrip('-') in queryset.query.annotations for name in queryset.query.order_by)
+
+
+def page_query(queryset, ordering, cursor: str = None, page_size: int = PAGE_SIZE) -> tuple:
+    '''
+    Запрос одной страницы (срез queryset на page_size + 1 строк) и состояние для build_page.
+    Если queryset уже отсортирован по вычисляемому полю (релевантность поиска search_rank),
+    keyset невозможен и используется курсор со смещением.
+    '''
+    ordering = stable_ordering(ordering)
+    payload = decode_cursor(cursor, queryset.model, ordering) if cursor else {'v': None, 'r': 0}
+    if _ordered_by_annotation(queryset) or 'o' in payload:
+        offset = payload.get('o', 0)
+        return queryset[offset:offset + page_size + 1], {'offset': offset, 'page_size': page_size}
+
+    values, reverse = payload['v'], bool(payload.get('r'))
+
+    page_ordering = [name[1:] if name.startswith('-') else '-' + name for name in ordering] if reverse else ordering
+    rows = queryset.order_by(*page_ordering)
+    if values is not None:
+        rows = rows.filter(_after(ordering, values, reverse))
+    state = {'ordering': ordering, 'values': values, 'reverse': reverse, 'page_size': page_size}
+    return rows[:page_size + 1], state
+
+
+def build_page(rows: list, state: dict) -> KeysetPage:
+    '''
+    Страница и курсоры соседних страниц по выбранным строкам запроса из page_query
+    '''
+    page_size = state['page_size']
+    if 'offset' in state:
+        return _offset_page(rows, state['offset'], page_size)
+
+    ordering, values, reverse = state['ordering'], state['values'], state['reverse']
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if reverse:
+        rows.reverse()
+
+    boundary = lambda obj: [_value(obj, name.lstrip('-')) for name in ordering]
+    next_cursor = previous_cursor = None
+    if rows:
+        if has_more or reverse:
+            next_cursor = encode_cursor(boundary(rows[-1]))
+        if values is not None and (has_more or not reverse):
+            previous_cursor = encode_cursor(boundary(rows[0]), reverse=True)
+    return KeysetPage(rows, next_cursor, previous_cursor, page_size, ordering)
+
+
+def cursor_after(obj, ordering) -> str:
+    '''
+    Курсор страницы, начинающейся сразу после obj (при сортировке ordering)
+    '''
+    return encode_cursor([_value(obj, name.lstrip('-')) for name in stable_ordering(ordering)])
+
+
+def paginate(queryset, ordering, cursor: str = None, page_size: int = PAGE_SIZE) -> KeysetPage:
+    rows, state = page_query(queryset, ordering, cursor, page_size)
+    return build_page(list(rows), state)
+
+
+def _offset_page(rows: list, offset: int, page_size: int) -> KeysetPage:
+    next_cursor = encode_cursor(None, offset=offset + page_size) if len(rows) > page_size else None
+    previous_cursor = encode_cursor(None, offset=max(offset - page_size, 0)) if offset > 0 else None
+    return KeysetPage(rows[:page_size], next_cursor, previous_cursor, page_size)
+
+
+def page_link(params, cursor, param: str = 'cursor'):
+    '''
+    Строка запроса страницы: текущие параметры (request.GET) с замененным курсором; None - страницы нет
+    '''
+    if cursor is None:
+        return None
+    params = params.copy()
+    params[param] = cursor
+    return urlencode(params, doseq=True)
+
+
+def page_size_from(params, default: int = PAGE_SIZE) -> int:
+    try:
+        size = int(params.get('page_size', default))
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def default_ordering(queryset) -> list:
+    return list(queryset.query.order_by or queryset.model._meta.ordering or ['pk'])
+
+
+class KeysetListMixin:
+    '''
+    Примесь для ListView: keyset-пагинация вместо Paginator (без COUNT и OFFSET)
+    '''
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, page_size):
+        try:
+            page = paginate(
+                queryset,
+                self.get_ordering() or default_ordering(queryset),
+                self.request.GET.get(self.cursor_query_param),
+                page_size_from(self.request.GET, page_size),
+            )
+        except InvalidCursor:
+            raise Http404('Invalid cursor')
+        return None, page, page.object_list, page.has_next or page.has_previous
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        page = context.get('page_obj')
+        if isinstance(page, KeysetPage):
+            context['is_paginated'] = False
+            context['cursor_page'] = page
+            context['next_page_query'] = page_link(self.request.GET, page.next_cursor, self.cursor_query_param)
+            context['previous_page_query'] = page_link(self.request.GET, page.previous_cursor, self.cursor_query_param)
+        return context
+
+
+class KeysetPagination(BasePagination):
+    '''
+    Keyset-пагинация для DRF. Сортировка берется из OrderingFilter (если он подключен к view),
+    иначе из сортировки queryset или модели.
+    '''
+    cursor_query_param = 'cursor'
+    page_size = PAGE_SIZE
+
+    def get_ordering(self, queryset, request, view=None) -> list:
+        '''
+        Сортировка страницы с pk в конце; для строк .values() эти поля должны быть выбраны
+        '''
+        ordering = None
+        for backend in getattr(view, 'filter_backends', []):
+            if issubclass(backend, OrderingFilter):
+                ordering = backend().get_ordering(request, queryset, view)
+                break
+        return stable_ordering(ordering or default_ordering(queryset))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        try:
+            self.page = paginate(
+                queryset,
+                self.get_ordering(queryset, request, view),
+                request.query_params.get(self.cursor_query_param),
+                page_size_from(request.query_params, self.page_size),
+            )
+        except InvalidCursor:
+            raise NotFound('Invalid cursor')
+        return self.page.object_list
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_link(self.page.next_cursor),
+            'previous': self.get_link(self.page.previous_cursor),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
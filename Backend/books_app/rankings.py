@@ -0,0 +1,109 @@
+'''
+Рейтинги книг, которые поддерживаются по мере поступления оценок и комментариев, а не считаются GROUP BY
+на каждый запрос:
+- лучшие книги - по Book.rating_score (байесовское среднее, обновляется вместе с агрегатами оценок,
+  см. BookRate.apply_votes);
+- обсуждаемые - по Book.comments_recent, числу комментариев за последние RANKING_DISCUSSED_DAYS дней.
+  Комментарии считаются по дням в CommentDay; новый комментарий увеличивает счетчики дня и книги,
+  а задача rankings.expire раз в сутки вычитает дни, вышедшие из окна.
+Оба поля проиндексированы, поэтому страница рейтинга - проход по индексу без сортировки и агрегации.
+'''
+import datetime
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from books_app import response_cache
+from books_app.models import Book, Comment, CommentDay
+
+DISCUSSED_DAYS = getattr(settings, 'RANKING_DISCUSSED_DAYS', 7)
+
+TOP_RATED_ORDERING = ['-rating_score', '-pk']
+DISCUSSED_ORDERING = ['-comments_recent', '-pk']
+
+
+def top_rated():
+    return Book.custom.all().filter(rating_score__gt=0).order_by(*TOP_RATED_ORDERING)
+
+
+def most_discussed():
+    return Book.custom.all().filter(comments_recent__gt=0).order_by(*DISCUSSED_ORDERING)
+
+
+def window_start(today: datetime.date = None) -> datetime.date:
+    '''
+    Первый день окна обсуждаемых книг (окно включает сегодняшний день)
+    '''
+    return (today or timezone.localdate()) - datetime.timedelta(days=DISCUSSED_DAYS - 1)
+
+
+def _recent_total(start: datetime.date, day_model=CommentDay):
+    '''
+    Подзапрос: сумма комментариев книги по дням окна, начиная со start (для UPDATE книг)
+    '''
+    days = day_model.objects.filter(book_id=OuterRef('pk'), day__gte=start) \
+        .values('book_id').annotate(total=Sum('comments')).values('total')
+    return Coalesce(Subquery(days), 0)
+
+
+def comment_added(book_id, published_at) -> None:
+    day = timezone.localdate(published_at)
+    if day < window_start():
+        return
+    table = CommentDay._meta.db_table
+    with transaction.atomic():
+        # Один атомарный upsert: конкурентные комментарии к одной книге не теряют приращения
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} (book_id, day, comments) VALUES (%s, %s, 1) '
+                f'ON CONFLICT (book_id, day) DO UPDATE SET comments = {table}.comments + 1',
+                [book_id, day],
+            )
+        Book.custom.filter(pk=book_id).update(comments_recent=F('comments_recent') + 1)
+    transaction.on_commit(response_cache.invalidate_discussions)
+
+
+def comment_removed(book_id, published_at) -> None:
+    day = timezone.localdate(published_at)
+    with transaction.atomic():
+        if CommentDay.objects.filter(book_id=book_id, day=day, day__gte=window_start(), comments__gt=0) \
+                .update(comments=F('comments') - 1):
+            Book.custom.filter(pk=book_id, comments_recent__gt=0).update(comments_recent=F('comments_recent') - 1)
+            transaction.on_commit(response_cache.invalidate_discussions)
+
+
+def expire_discussions(today: datetime.date = None) -> int:
+    '''
+    Вычитание дней, вышедших из окна: счетчики затронутых книг пересчитываются по оставшимся дням,
+    старые дни удаляются. Возвращает число обновленных книг.
+    '''
+    start = window_start(today)
+    expired = CommentDay.objects.filter(day__lt=start)
+    with transaction.atomic():
+        updated = Book.custom.filter(pk__in=expired.values('book_id')).update(comments_recent=_recent_total(start))
+        expired.delete()
+    if updated:
+        response_cache.invalidate_discussions()
+    return updated
+
+
+def rebuild_discussions(book_model=Book, comment_model=Comment, day_model=CommentDay) -> int:
+    '''
+    Полный пересчет CommentDay и Book.comments_recent по таблице комментариев (после импорта,
+    смены RANKING_DISCUSSED_DAYS или расхождений). Возвращает число дней с комментариями в окне.
+    Миграции передают исторические модели.
+    '''
+    start = window_start()
+    since = timezone.make_aware(datetime.datetime.combine(start, datetime.time.min))
+    rows = comment_model.objects.filter(published_at__gte=since) \
+        .annotate(day=TruncDate('published_at')).values('book_id', 'day').annotate(comments=Count('pk')) \
+        .order_by()
+    with transaction.atomic():
+        day_model.objects.all().delete()
+        days = day_model.objects.bulk_create([day_model(**row) for row in rows], batch_size=1000)
+        book_model._default_manager.update(comments_recent=_recent_total(start, day_model))
+    response_cache.invalidate_discussions()
+    return len(days)
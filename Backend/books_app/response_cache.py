@@ -0,0 +1,234 @@
+'''
+Кеширование готовых ответов страниц и API книг и авторов.
+Ключ ответа содержит версии объектов, от которых он зависит (книга, автор, каталог целиком).
+При изменении моделей (см. books_app.signals) версия увеличивается, и старые ключи перестают читаться -
+ничего не нужно искать и удалять, старые записи просто вытесняются по таймауту.
+Вместе с версией хранится время ее смены: из них строятся ETag и Last-Modified, и повторный запрос
+с If-None-Match / If-Modified-Since получает 304 без обращения к БД и без отрисовки.
+'''
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+CACHE_ALIAS = getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')
+CACHE_TIMEOUT = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 60 * 10)
+CACHED_HEADERS = ('Content-Type', 'Allow', 'Vary')
+
+HITS_KEY = 'resp:stats:hits'
+MISSES_KEY = 'resp:stats:misses'
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def book_token(book_id) -> str:
+    return f'book:{book_id}'
+
+
+def author_token(author_id) -> str:
+    return f'author:{author_id}'
+
+
+CATALOGUE = 'catalogue'
+# Рейтинг обсуждаемых книг: меняется от комментариев, которые не затрагивают каталог
+DISCUSSIONS = 'discussions'
+GLOBAL = 'global'
+
+
+def versions(*tokens) -> list:
+    '''
+    Текущие версии набора объектов одним обращением к кешу (отсутствующая версия = 1)
+    '''
+    return state(*tokens)[0]
+
+
+def state(*tokens) -> tuple:
+    '''
+    Версии набора объектов и время последнего изменения любого из них (unix time) одним обращением к кешу.
+    Время еще не менявшегося объекта запоминается при первом обращении.
+    '''
+    tokens = (GLOBAL,) + tokens
+    version_keys = [f'resp:ver:{token}' for token in tokens]
+    stamp_keys = [f'resp:ts:{token}' for token in tokens]
+    cache = get_cache()
+    stored = cache.get_many(version_keys + stamp_keys)
+    now = int(time.time())
+    for key in stamp_keys:
+        if key not in stored:
+            cache.add(key, now, None)
+            stored[key] = now
+    return [stored.get(key, 1) for key in version_keys], max(stored[key] for key in stamp_keys)
+
+
+def bump(*tokens) -> None:
+    cache = get_cache()
+    for token in tokens:
+        key = f'resp:ver:{token}'
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 2, None)
+    cache.set_many({f'resp:ts:{token}': int(time.time()) for token in tokens}, None)
+
+
+def invalidate_book(book_id, catalogue: bool = True) -> None:
+    '''
+    Сброс ответов книги; catalogue=False - изменение не видно в списках (комментарии, изображения)
+    '''
+    bump(book_token(book_id), *([CATALOGUE] if catalogue else []))
+
+
+def invalidate_books(book_ids) -> None:
+    '''
+    Сброс ответов нескольких книг и списков одной серией (пакетные изменения в обход сигналов)
+    '''
+    bump(*[book_token(book_id) for book_id in book_ids], CATALOGUE)
+
+
+def invalidate_discussions() -> None:
+    bump(DISCUSSIONS)
+
+
+def invalidate_author(author_id, book_ids=()) -> None:
+    bump(author_token(author_id), CATALOGUE, *[book_token(book_id) for book_id in book_ids])
+
+
+def invalidate_all() -> None:
+    '''
+    Сброс всех ответов (после массовых изменений в обход сигналов: bulk_create, update)
+    '''
+    bump(GLOBAL)
+
+
+def _count(key) -> None:
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, None) or cache.incr(key)
+
+
+def stats() -> dict:
+    cache = get_cache()
+    counters = cache.get_many([HITS_KEY, MISSES_KEY])
+    return {'hits': counters.get(HITS_KEY, 0), 'misses': counters.get(MISSES_KEY, 0)}
+
+
+def reset_stats() -> None:
+    get_cache().delete_many([HITS_KEY, MISSES_KEY])
+
+
+def response_key(request, name: str, version_values) -> str:
+    version = '.'.join(str(v) for v in version_values)
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    accept = hashlib.md5(request.headers.get('Accept', '').encode()).hexdigest()[:8]
+    return f'resp:{name}:{version}:{path}:{accept}'
+
+
+def lookup(request, name: str, tokens) -> tuple:
+    '''
+    Ключ ответа, валидаторы (ETag, Last-Modified) и готовый ответ: 304 для совпавших валидаторов,
+    ответ из кеша или None при промахе
+    '''
+    version_values, modified = state(*tokens)
+    key = response_key(request, name, version_values)
+    validators = {'etag': '"%s"' % hashlib.md5(key.encode()).hexdigest(), 'last_modified': modified}
+    not_modified = get_conditional_response(request, **validators)
+    if not_modified is not None:
+        _count(HITS_KEY)
+        return key, validators, not_modified
+    stored = get_cache().get(key)
+    if stored is None:
+        _count(MISSES_KEY)
+        return key, validators, None
+    _count(HITS_KEY)
+    status, content, headers = stored
+    response = HttpResponse(content, status=status)
+    for header, value in headers.items():
+        response[header] = value
+    response['X-Cache'] = 'HIT'
+    return key, validators, response
+
+
+def with_validators(response, validators: dict):
+    '''
+    ETag и Last-Modified для успешного ответа; no-cache - браузер каждый раз переспрашивает (дешевый 304)
+    '''
+    if response.status_code in (200, 304):
+        response['ETag'] = validators['etag']
+        response['Last-Modified'] = http_date(validators['last_modified'])
+        response['Cache-Control'] = 'no-cache'
+    return response
+
+
+def remember(key: str, response):
+    '''
+    Сохранение успешного ответа (для TemplateResponse - после отрисовки)
+    '''
+    if response.status_code != 200:
+        return response
+
+    def store(rendered):
+        headers = {header: rendered[header] for header in CACHED_HEADERS if rendered.has_header(header)}
+        get_cache().set(key, (rendered.status_code, rendered.content, headers), CACHE_TIMEOUT)
+
+    if hasattr(response, 'render') and not response.is_rendered:
+        response.add_post_render_callback(store)
+    else:
+        store(response)
+    response['X-Cache'] = 'MISS'
+    return response
+
+
+def cached_response(request, name: str, tokens, build):
+    '''
+    Ответ из кеша или построенный функцией build
+    '''
+    key, validators, response = lookup(request, name, tokens)
+    if response is None:
+        response = remember(key, build())
+    return with_validators(response, validators)
+
+
+async def acached_response(request, name: str, tokens, build):
+    '''
+    То же для асинхронных view: build - корутинная функция.
+    Обращения к кешу синхронные - для locmem и файлового кеша они не ходят в БД и быстрые.
+    '''
+    key, validators, response = lookup(request, name, tokens)
+    if response is None:
+        response = remember(key, await build())
+    return with_validators(response, validators)
+
+
+class CachedResponseMixin:
+    '''
+    Примесь для View: GET-ответы кешируются с ключом по версиям из get_cache_tokens().
+    HTML-страницы кешируются только для анонимных посетителей (в них нет CSRF-токена и данных пользователя).
+    '''
+    cache_anonymous_only = True
+
+    def get_cache_tokens(self) -> tuple:
+        return (CATALOGUE,)
+
+    def get_cache_name(self) -> str:
+        return type(self).__name__
+
+    def should_cache(self, request) -> bool:
+        return request.method == 'GET' and not (self.cache_anonymous_only and request.user.is_authenticated)
+
+    def dispatch(self, request, *args, **kwargs):
+        parent = super().dispatch
+        if not self.should_cache(request):
+            return parent(request, *args, **kwargs)
+        self.kwargs = kwargs
+        return cached_response(
+            request, self.get_cache_name(), self.get_cache_tokens(),
+            lambda: parent(request, *args, **kwargs),
+        )
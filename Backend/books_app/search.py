@@ -0,0 +1,159 @@
+'''
+Полнотекстовый поиск по книгам.
+На SQLite используется отдельная виртуальная таблица FTS5 (rowid = pk книги),
+на остальных СУБД - запасной путь через icontains с ранжированием по полю совпадения.
+
+Поиск через FTS5 находит слова по началу, а не подстроки, как прежний icontains: "толст" находит
+"Толстой", но "стой" - нет; слова запроса разбиваются по буквам и цифрам ("Жизнь-и" - это "жизнь" и "и"),
+регистр и диакритика не учитываются (в том числе для кириллицы, чего SQLite LIKE не делает).
+Результаты сортируются по релевантности (bm25, совпадение в названии весит больше), а не по pk.
+'''
+import re
+
+from django.db import connection, transaction
+from django.db.models import BooleanField, Case, FloatField, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+
+from books_app.models import Book, BookSearchEntry
+
+FTS_TABLE = BookSearchEntry._meta.db_table
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def is_fts_available() -> bool:
+    return connection.vendor == 'sqlite'
+
+
+def create_index() -> None:
+    '''
+    Создание таблицы индекса (если ее еще нет)
+    '''
+    if not is_fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            f"USING fts5(name, author, description, year, tokenize='unicode61 remove_diacritics 2')"
+        )
+
+
+def _book_row(book: Book) -> list:
+    return [book.pk, book.name, str(book.author), book.description, str(book.year)]
+
+
+def index_books(books, replace: bool = True) -> None:
+    '''
+    Добавление (или замена) записей индекса для переданных книг одной транзакцией
+    (в режиме autocommit каждая строка фиксировалась бы отдельно)
+    '''
+    if not is_fts_available():
+        return
+    rows = [_book_row(book) for book in books]
+    if not rows:
+        return
+    with transaction.atomic(), connection.cursor() as cursor:
+        if replace:
+            cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [[row[0]] for row in rows])
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, author, description, year) VALUES (%s, %s, %s, %s, %s)",
+            rows,
+        )
+
+
+def remove_book(book_id) -> None:
+    if not is_fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [book_id])
+
+
+def reindex_author(author_id) -> None:
+    '''
+    Переиндексация всех книг автора (после изменения имени или фамилии)
+    '''
+    index_books(Book.custom.filter(author_id=author_id).select_related('author').iterator(chunk_size=1000))
+
+
+def rebuild_index(batch_size: int = 1000) -> int:
+    '''
+    Полное перестроение индекса. Возвращает количество проиндексированных книг.
+    '''
+    if not is_fts_available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    create_index()
+    total = 0
+    batch = []
+    for book in Book.custom.select_related('author').iterator(chunk_size=batch_size):
+        batch.append(book)
+        if len(batch) >= batch_size:
+            index_books(batch, replace=False)
+            total += len(batch)
+            batch = []
+    index_books(batch, replace=False)
+    total += len(batch)
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    return total
+
+
+def _match_expression(query: str) -> str:
+    '''
+    Каждое слово запроса ищется как префикс, все слова обязательны
+    '''
+    return ' '.join('"%s"*' % token for token in _TOKEN_RE.findall(query))
+
+
+def icontains_filter(query: str) -> Q:
+    '''
+    Прежний путь поиска: цепочка icontains по названию, автору и описанию
+    '''
+    condition = Q()
+    for token in (query or '').split():
+        condition &= (
+            Q(name__icontains=token) |
+            Q(author__name__icontains=token) |
+            Q(author__surname__icontains=token) |
+            Q(description__icontains=token)
+        )
+    return condition
+
+
+def search_books(queryset, query: str):
+    '''
+    Отбор книг из queryset по поисковой строке с сортировкой по релевантности
+    '''
+    if not (query or '').strip():
+        return queryset
+    if is_fts_available():
+        expression = _match_expression(query)
+        if not expression:
+            return queryset.none()
+        # Соединение с индексом по rowid (BookSearchEntry): FTS5 отдает совпадения, книги читаются по pk
+        return queryset.filter(
+            search_entry__isnull=False,
+        ).filter(
+            RawSQL(f'{FTS_TABLE} MATCH %s', [expression], output_field=BooleanField()),
+        ).annotate(
+            search_rank=RawSQL(f'bm25({FTS_TABLE}, 10.0, 5.0, 1.0, 1.0)', [], output_field=FloatField()),
+        ).order_by('search_rank', 'pk')
+
+    rank = Case(
+        When(name__icontains=query, then=Value(0)),
+        When(Q(author__name__icontains=query) | Q(author__surname__icontains=query), then=Value(1)),
+        default=Value(2),
+        output_field=IntegerField(),
+    )
+    return queryset.filter(icontains_filter(query)).annotate(search_rank=rank).order_by('search_rank', 'pk')
+
+
+class BookSearchFilter(SearchFilter):
+    '''
+    Фильтр поиска DRF для книг, работающий через поисковый индекс
+    '''
+    def filter_queryset(self, request, queryset, view):
+        query = ' '.join(self.get_search_terms(request))
+        return search_books(queryset, query)
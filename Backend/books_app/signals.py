@@ -0,0 +1,141 @@
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from books_app import auth, comments, jobs, rankings, response_cache, search, tasks
+from books_app.models import Author, Book, BookRate, Comment, Images, Visitor
+
+
+def create_search_index(sender, **kwargs):
+    '''
+    Таблица поискового индекса не описывается моделью, поэтому создается после миграций
+    '''
+    search.create_index()
+
+
+@receiver(post_save, sender=Book)
+def index_book(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_books([instance])
+    response_cache.invalidate_book(instance.pk)
+
+
+def _deleted_with_book(instance, origin) -> bool:
+    '''
+    Строка удаляется каскадом вместе с книгой, счетчики которой уже вычел uncount_book_dependents
+    '''
+    return isinstance(origin, Book) and origin.pk == instance.book_id and getattr(origin, '_dependents_uncounted', False)
+
+
+@receiver(pre_delete, sender=Book)
+def uncount_book_dependents(sender, instance, origin=None, **kwargs):
+    '''
+    Удаление книги: счетчики посетителей по ее оценкам и комментариям вычитаются по двум агрегатам
+    (UPDATE на группу посетителей с одинаковыми изменениями), обработчики строк, удаляемых каскадом, их пропускают.
+    Рейтинг книги не пересчитывается, дни обсуждения удаляются каскадом.
+    '''
+    if origin is not instance:
+        return
+    deltas = defaultdict(lambda: defaultdict(int))
+    for row in BookRate.objects.filter(book_id=instance.pk).values('visitor_id', 'rate').annotate(votes=Count('pk')):
+        deltas[row['visitor_id']]['ratings_count'] -= row['votes']
+        deltas[row['visitor_id']][f'rates_{row["rate"]}'] -= row['votes']
+    for row in Comment.objects.filter(book_id=instance.pk).values('visitor_id').annotate(count=Count('pk')):
+        deltas[row['visitor_id']]['comments_count'] -= row['count']
+    Visitor.change_stats_bulk(deltas)
+    comments.invalidate_thread(instance.pk)
+    if instance.comments_recent:
+        transaction.on_commit(response_cache.invalidate_discussions)
+    instance._dependents_uncounted = True
+
+
+@receiver(post_delete, sender=Book)
+def unindex_book(sender, instance, **kwargs):
+    search.remove_book(instance.pk)
+    response_cache.invalidate_book(instance.pk)
+
+
+@receiver(post_save, sender=Author)
+def reindex_author_books(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created:
+        search.reindex_author(instance.pk)
+    book_ids = [] if created else Book.custom.filter(author_id=instance.pk).values_list('pk', flat=True)
+    response_cache.invalidate_author(instance.pk, book_ids)
+
+
+@receiver(post_delete, sender=Author)
+def invalidate_author(sender, instance, **kwargs):
+    response_cache.invalidate_author(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=BookRate)
+def invalidate_book_rating(sender, instance, origin=None, **kwargs):
+    if not _deleted_with_book(instance, origin):
+        response_cache.invalidate_book(instance.book_id)
+
+
+@receiver(post_delete, sender=BookRate)
+def uncount_rating(sender, instance, origin=None, **kwargs):
+    '''
+    Оценки, удаленные в обход BookRate.apply_votes: из админки или каскадом при удалении посетителя, пользователя
+    (голоса через apply_votes сигналов не вызывают и сами меняют счетчики; оценки удаляемой книги вычитает
+    uncount_book_dependents)
+    '''
+    if _deleted_with_book(instance, origin):
+        return
+    Visitor.change_stats(instance.visitor_id, ratings_count=-1, **{f'rates_{instance.rate}': -1})
+    Book.refresh_ratings([instance.book_id])
+
+
+@receiver([post_save, post_delete], sender=Images)
+def invalidate_book_images(sender, instance, origin=None, **kwargs):
+    if not _deleted_with_book(instance, origin):
+        response_cache.invalidate_book(instance.book_id, catalogue=False)
+
+
+@receiver(post_save, sender=Images)
+def schedule_thumbnails(sender, instance, raw=False, **kwargs):
+    if not raw and instance.image:
+        tasks.schedule_thumbnails(instance.pk)
+
+
+@receiver(post_delete, sender=Images)
+def schedule_image_cleanup(sender, instance, **kwargs):
+    if instance.image:
+        jobs.enqueue('images.delete_files', {'name': instance.image.name, 'content_hash': instance.content_hash})
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, origin=None, **kwargs):
+    if _deleted_with_book(instance, origin):
+        return
+    rankings.comment_removed(instance.book_id, instance.published_at)
+    Visitor.change_stats(instance.visitor_id, comments_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        rankings.comment_added(instance.book_id, instance.published_at)
+        Visitor.change_stats(instance.visitor_id, comments_count=1)
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def invalidate_book_comments(sender, instance, origin=None, **kwargs):
+    if _deleted_with_book(instance, origin):
+        return
+    comments.invalidate_thread(instance.book_id)
+    response_cache.invalidate_book(instance.book_id, catalogue=False)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    auth.invalidate_user(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Visitor)
+def invalidate_cached_visitor(sender, instance, **kwargs):
+    auth.invalidate_visitor(instance.user_id)
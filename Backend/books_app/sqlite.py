@@ -0,0 +1,26 @@
+'''
+Настройка соединений SQLite. PRAGMA из settings.SQLITE_PRAGMAS выполняются для каждого нового
+соединения (сигнал connection_created), так что их получают все воркеры gunicorn и фоновой очереди.
+Постоянные PRAGMA (journal_mode) не выполняются на соединениях только для чтения (mode=ro).
+'''
+from django.conf import settings
+
+
+def is_read_only(connection) -> bool:
+    return 'mode=ro' in str(connection.settings_dict['NAME'])
+
+
+def apply_pragmas(cursor, pragmas: dict, read_only: bool = False) -> None:
+    for name, value in pragmas.items():
+        if read_only and name == 'journal_mode':
+            continue
+        cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def configure_connection(sender, connection, **kwargs) -> None:
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if pragmas:
+        with connection.cursor() as cursor:
+            apply_pragmas(cursor, pragmas, is_read_only(connection))
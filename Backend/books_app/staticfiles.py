@@ -0,0 +1,184 @@
+'''
+Статика для продакшена без отдельного веб-сервера (settings.STATIC_PIPELINE).
+collectstatic через CompressedManifestStaticFilesStorage пишет файлы с хешем содержимого в имени
+(ratings.3f2a9c1b7e04.js) и рядом сжатые копии .gz и .br (brotli - если установлен пакет Brotli).
+StaticFilesIndex один раз при старте обходит STATIC_ROOT, а StaticFilesMiddleware отдает файлы из него:
+вариант сжатия выбирается по Accept-Encoding, файлы с хешем в имени отдаются с Cache-Control immutable
+на год (новая версия файла - новое имя), остальные - с коротким сроком и ETag.
+'''
+import gzip
+import json
+import mimetypes
+import os
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.map', '.svg', '.json', '.txt', '.html', '.xml')
+# Меньше этого размера сжатие не окупает заголовок Content-Encoding
+MIN_COMPRESS_SIZE = 256
+# Сжатая копия сохраняется, только если она заметно меньше оригинала
+MAX_COMPRESS_RATIO = 0.95
+# Расширение файла -> Content-Encoding, в порядке предпочтения
+ENCODINGS = {'.br': 'br', '.gz': 'gzip'}
+
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+
+def compressors() -> dict:
+    '''
+    Доступные алгоритмы сжатия: {расширение копии: функция}
+    '''
+    result = {'.gz': lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        result['.br'] = lambda data: brotli.compress(data, quality=11)
+    return result
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    '''
+    ManifestStaticFilesStorage, который после подстановки хешей сохраняет сжатые копии текстовых файлов
+    '''
+    def post_process(self, paths, dry_run=False, **options):
+        names = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            yield name, hashed_name, processed
+            if hashed_name and not isinstance(processed, Exception):
+                names.update((name, hashed_name))
+        if dry_run:
+            return
+        for name in sorted(names):
+            for compressed in self.compress(name):
+                yield name, compressed, True
+
+    def compress(self, name: str) -> list:
+        if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+            return []
+        with self.open(name) as source:
+            data = source.read()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return []
+        created = []
+        for extension, compress in compressors().items():
+            compressed = compress(data)
+            if len(compressed) > len(data) * MAX_COMPRESS_RATIO:
+                continue
+            target = name + extension
+            if self.exists(target):
+                self.delete(target)
+            self._save(target, ContentFile(compressed))
+            created.append(target)
+        return created
+
+
+@dataclass
+class StaticFile:
+    path: str
+    size: int
+    mtime: float
+    content_type: str
+    immutable: bool
+    # Content-Encoding -> (путь, размер)
+    variants: dict = field(default_factory=dict)
+
+    @property
+    def etag(self) -> str:
+        return f'"{int(self.mtime):x}-{self.size:x}"'
+
+
+def accepted_encodings(header: str) -> set:
+    '''
+    Кодировки из Accept-Encoding, кроме явно запрещенных (q=0)
+    '''
+    result = set()
+    for item in header.split(','):
+        token, _, params = item.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if token:
+            result.add(token.strip().lower())
+    return result
+
+
+class StaticFilesIndex:
+    '''
+    Файлы STATIC_ROOT по URL: {путь относительно STATIC_URL: StaticFile}.
+    Строится при старте процесса: после collectstatic процесс нужно перезапустить (как и после деплоя кода).
+    '''
+    def __init__(self, root: str):
+        self.files = {}
+        hashed = self.hashed_names(root)
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                if os.path.splitext(filename)[1] in ENCODINGS:
+                    continue
+                name = os.path.relpath(path, root).replace(os.sep, '/')
+                stat = os.stat(path)
+                content_type, _ = mimetypes.guess_type(filename)
+                static_file = StaticFile(path, stat.st_size, stat.st_mtime,
+                                         content_type or 'application/octet-stream', name in hashed)
+                for extension, encoding in ENCODINGS.items():
+                    if os.path.exists(path + extension):
+                        static_file.variants[encoding] = (path + extension, os.path.getsize(path + extension))
+                self.files[name] = static_file
+
+    @staticmethod
+    def hashed_names(root: str) -> set:
+        manifest = os.path.join(root, ManifestStaticFilesStorage.manifest_name)
+        try:
+            with open(manifest, encoding='utf-8') as stream:
+                return set(json.load(stream).get('paths', {}).values())
+        except (OSError, ValueError):
+            return set()
+
+    def response(self, request, name: str):
+        '''
+        Ответ с файлом или None, если такого файла нет
+        '''
+        static_file = self.files.get(name)
+        if static_file is None:
+            return None
+        path, size, encoding = static_file.path, static_file.size, None
+        accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        for candidate in ENCODINGS.values():
+            if candidate in static_file.variants and candidate in accepted:
+                (path, size), encoding = static_file.variants[candidate], candidate
+                break
+        etag = static_file.etag if encoding is None else f'{static_file.etag[:-1]}-{encoding}"'
+
+        response = get_conditional_response(request, etag=etag, last_modified=int(static_file.mtime))
+        if response is None:
+            if request.method == 'HEAD':
+                response = HttpResponse(content_type=static_file.content_type)
+            else:
+                response = FileResponse(open(path, 'rb'), content_type=static_file.content_type)
+                # Имя сжатой копии (.gz, .br) в Content-Disposition не нужно
+                response.headers.pop('Content-Disposition', None)
+            response['Content-Length'] = size
+            if encoding is not None:
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(static_file.mtime)
+        if static_file.variants:
+            response['Vary'] = 'Accept-Encoding'
+        if static_file.immutable:
+            response['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+        else:
+            response['Cache-Control'] = f'public, max-age={settings.STATIC_MAX_AGE}'
+        return response
@@ -0,0 +1,156 @@
+'''
+Хранилище изображений книг с адресацией по содержимому.
+Загружаемый файл при записи на диск хешируется (SHA-256) и сохраняется один раз под именем
+book_images/<первые 2 символа хеша>/<хеш>.<расширение>: одна и та же обложка, загруженная для нескольких
+изданий или повторно через форму редактирования, занимает место один раз.
+Ссылки на файл - записи Images с этим именем (и тем же content_hash), файл удаляется, когда их не остается
+(задача images.delete_files, команда reclaim_images).
+'''
+import hashlib
+import os
+import re
+import tempfile
+import time
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+DIRECTORY = 'book_images'
+CONTENT_NAME_RE = re.compile(rf'^{DIRECTORY}/[0-9a-f]{{2}}/([0-9a-f]{{64}})\.\w+$')
+EXTENSION_ALIASES = {'jpeg': 'jpg'}
+# Файлы без ссылок, записанные недавно, не удаляются: запись Images загрузки с тем же содержимым
+# может еще не быть сохранена (ContentAddressedStorage._save только обновляет время изменения файла)
+ORPHAN_GRACE_SECONDS = 60 * 60
+
+
+def content_name(content_hash: str, filename: str) -> str:
+    extension = os.path.splitext(filename)[1].lstrip('.').lower()
+    extension = EXTENSION_ALIASES.get(extension, extension) or 'bin'
+    return f'{DIRECTORY}/{content_hash[:2]}/{content_hash}.{extension}'
+
+
+def content_hash(name: str) -> str:
+    '''
+    Хеш содержимого из имени файла хранилища ('' для файлов, сохраненных до адресации по содержимому)
+    '''
+    match = CONTENT_NAME_RE.match(name or '')
+    return match.group(1) if match else ''
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    '''
+    FileSystemStorage, в котором имя файла определяется его содержимым (имя из upload_to дает только расширение)
+    '''
+    def get_available_name(self, name, max_length=None):
+        # Одинаковое содержимое - одно и то же имя, суффиксы против совпадений не нужны
+        return name
+
+    def _save(self, name, content):
+        directory = self.path(DIRECTORY)
+        os.makedirs(directory, exist_ok=True)
+        digest = hashlib.sha256()
+        descriptor, temporary = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        try:
+            with os.fdopen(descriptor, 'wb') as stream:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    stream.write(chunk)
+            final_name = content_name(digest.hexdigest(), name)
+            final_path = self.path(final_name)
+            if os.path.exists(final_path):
+                # Такой файл уже есть: время изменения обновляется, чтобы reclaim_images не удалил его,
+                # пока новая запись Images еще не сохранена
+                os.utime(final_path)
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(temporary, self.file_permissions_mode)
+                os.replace(temporary, final_path)
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+        return final_name
+
+
+image_storage = ContentAddressedStorage()
+
+
+def recently_written(name: str, grace_seconds: int = ORPHAN_GRACE_SECONDS) -> bool:
+    try:
+        return image_storage.get_modified_time(name).timestamp() > time.time() - grace_seconds
+    except OSError:
+        return False
+
+
+def _walk(root: str):
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            yield os.path.join(directory, filename)
+
+
+def deduplicate_legacy(dry_run: bool = False) -> dict:
+    '''
+    Перенос файлов, сохраненных до адресации по содержимому (book_images/<книга>-<имя>), в хранилище по хешу:
+    дубликаты сливаются в один файл, записи Images переключаются на него, старые файлы удаляются.
+    Хеш совпадает с прежним content_hash (тот же SHA-256), поэтому готовые уменьшенные копии остаются в силе.
+    '''
+    from books_app.models import Images
+
+    field = Images._meta.get_field('image')
+    result = {'moved': 0, 'merged': 0, 'missing': 0, 'freed_bytes': 0}
+    targets = set()
+    legacy = Images.objects.exclude(image='').exclude(image=None).exclude(image__regex=CONTENT_NAME_RE.pattern) \
+        .values_list('image', flat=True).distinct()
+    for name in list(legacy):
+        if not field.storage.exists(name):
+            result['missing'] += 1
+            continue
+        digest = hashlib.sha256()
+        with field.storage.open(name) as file:
+            for chunk in file.chunks():
+                digest.update(chunk)
+            target = content_name(digest.hexdigest(), name)
+            duplicate = target in targets or field.storage.exists(target)
+            targets.add(target)
+            if not dry_run and not duplicate:
+                field.storage.save(target, file)
+        result['merged' if duplicate else 'moved'] += 1
+        if duplicate:
+            result['freed_bytes'] += field.storage.size(name)
+        if not dry_run:
+            Images.objects.filter(image=name).update(image=target, content_hash=digest.hexdigest())
+            field.storage.delete(name)
+    return result
+
+
+def remove_orphans(grace_seconds: int = ORPHAN_GRACE_SECONDS, dry_run: bool = False) -> dict:
+    '''
+    Удаление файлов изображений и уменьшенных копий, на которые не ссылается ни одна запись Images.
+    Файлы, измененные меньше grace_seconds назад, не трогаются: их запись Images может еще сохраняться.
+    '''
+    from books_app.models import Images
+    from books_app.thumbnails import DIRECTORY as THUMBNAILS_DIRECTORY
+
+    field = Images._meta.get_field('image')
+    root = field.storage.location
+    names = set(Images.objects.exclude(image='').values_list('image', flat=True))
+    hashes = set(Images.objects.exclude(content_hash='').values_list('content_hash', flat=True))
+    deadline = time.time() - grace_seconds
+    result = {'images': 0, 'thumbnails': 0, 'freed_bytes': 0}
+
+    def remove(path: str, kind: str) -> None:
+        result[kind] += 1
+        result['freed_bytes'] += os.path.getsize(path)
+        if not dry_run:
+            os.remove(path)
+
+    for path in _walk(os.path.join(root, DIRECTORY)):
+        name = os.path.relpath(path, root).replace(os.sep, '/')
+        if name not in names and os.path.getmtime(path) < deadline:
+            remove(path, 'images')
+    for path in _walk(os.path.join(root, THUMBNAILS_DIRECTORY)):
+        rendition_hash = os.path.basename(path).split('-', 1)[0]
+        if rendition_hash not in hashes and os.path.getmtime(path) < deadline:
+            remove(path, 'thumbnails')
+    return result
@@ -0,0 +1,55 @@
+'''
+Обработчики фоновых задач (регистрируются в очереди books_app.jobs при загрузке приложения)
+'''
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+from books_app import jobs, rankings, storage, thumbnails
+from books_app.models import Images, Job
+
+
+@jobs.register('thumbnails.build')
+def build_thumbnails(image_id):
+    thumbnails.process(image_id)
+
+
+@jobs.register('images.delete_files')
+def delete_image_files(name, content_hash=''):
+    '''
+    Удаление файла изображения и его копий, если на них больше не ссылается ни одна запись Images
+    (файлы с адресацией по содержимому общие у записей с одинаковыми изображениями).
+    Недавно записанный файл мог только что понадобиться новой загрузке, чья запись еще не сохранена:
+    тогда проверка откладывается на storage.ORPHAN_GRACE_SECONDS (в режиме JOBS_EAGER файл остается
+    до reclaim_images)
+    '''
+    if name and not Images.objects.filter(image=name).exists():
+        if storage.recently_written(name):
+            if not jobs.EAGER:
+                jobs.enqueue('images.delete_files', {'name': name, 'content_hash': content_hash},
+                             delay=storage.ORPHAN_GRACE_SECONDS)
+            return
+        Images._meta.get_field('image').storage.delete(name)
+    if content_hash and not Images.objects.filter(content_hash=content_hash).exists():
+        thumbnails.delete_renditions(content_hash)
+
+
+def schedule_thumbnails(image_id):
+    jobs.enqueue('thumbnails.build', {'image_id': image_id})
+
+
+@jobs.register('rankings.expire')
+def expire_rankings():
+    rankings.expire_discussions()
+    schedule_rankings_expiry()
+
+
+def schedule_rankings_expiry():
+    '''
+    Устаревание окна обсуждаемых книг - в начале следующих суток; в очереди держится одна такая задача.
+    В режиме JOBS_EAGER не планируется (задача выполнилась бы сразу): там окно сдвигает rebuild_rankings.
+    '''
+    if jobs.EAGER or Job.objects.filter(name='rankings.expire', status=Job.QUEUED).exists():
+        return
+    midnight = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), time.min))
+    jobs.enqueue('rankings.expire', delay=(midnight - timezone.now()).total_seconds())
@@ -0,0 +1,105 @@
+'''
+Помощники для тестов. QueryBudgetMixin проверяет, что view укладывается в объявленный бюджет SQL-запросов
+(атрибут query_budget, см. books_app.metrics.query_budget); запросы считаются по всем соединениям,
+включая реплики, как это делает RequestMetricsMiddleware.
+QueryPlanMixin проверяет планы (EXPLAIN QUERY PLAN в SQLite) всех SELECT, которые выполняет view.
+async_urlconf - URLconf с асинхронными view для тестов под AsyncClient.
+'''
+import importlib.util
+import re
+from contextlib import ExitStack
+from types import ModuleType
+from urllib.parse import urlsplit
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import override_settings
+from django.urls import include, path, resolve
+
+from books_app import metrics
+
+
+class QueryBudgetMixin:
+    def assertWithinQueryBudget(self, url: str, method: str = 'get', client=None, **kwargs):
+        '''
+        Выполняет запрос тестовым клиентом и падает, если view не объявила бюджет или превысила его.
+        Возвращает ответ.
+        '''
+        match = resolve(urlsplit(url).path)
+        budget = metrics.query_budget(match.func, method)
+        if budget is None:
+            self.fail(f'{match.view_name} declares no query budget')
+
+        statements = []
+
+        def capture(execute, sql, params, many, context):
+            if not metrics.is_transaction_control(sql):
+                statements.append(sql)
+            return execute(sql, params, many, context)
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(capture))
+            stack.enter_context(self.assertLogs('books_app.requests', 'INFO'))
+            response = getattr(client or self.client, method)(url, **kwargs)
+
+        if len(statements) > budget:
+            queries = '\n'.join(f'{number}. {sql}' for number, sql in enumerate(statements, 1))
+            self.fail(f'{match.view_name} issued {len(statements)} queries, budget is {budget}:\n{queries}')
+        return response
+
+
+# Полный проход по таблице: "SCAN books_app_book" без USING INDEX (проход по индексу под LIMIT допустим,
+# проход по виртуальной таблице FTS - это поиск по ее индексу)
+FULL_SCAN = re.compile(r'SCAN (\S+)( AS \S+)?$')
+SORT = 'USE TEMP B-TREE FOR ORDER BY'
+
+
+class QueryPlanMixin:
+    def query_plans(self, url: str, method: str = 'get', client=None, **kwargs) -> list:
+        '''
+        [(sql, [строки плана])] для всех SELECT, выполненных запросом к url
+        '''
+        database = connections[DEFAULT_DB_ALIAS]
+        if database.vendor != 'sqlite':
+            self.skipTest('Query plans are checked on SQLite only')
+        statements = []
+
+        def capture(execute, sql, params, many, context):
+            if sql.lstrip().upper().startswith('SELECT'):
+                statements.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with database.execute_wrapper(capture), self.assertLogs('books_app.requests', 'INFO'):
+            response = getattr(client or self.client, method)(url, **kwargs)
+        self.assertLess(response.status_code, 400, url)
+
+        plans = []
+        with database.cursor() as cursor:
+            for sql, params in statements:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                plans.append((sql, [row[3] for row in cursor.fetchall()]))
+        return plans
+
+    def assertIndexedPlans(self, url: str, method: str = 'get', ordered: bool = False, **kwargs):
+        '''
+        Падает, если какой-либо запрос view проходит таблицу целиком; ordered=True - еще и если строки
+        сортируются отдельно, а не читаются из индекса в нужном порядке (страницы списков)
+        '''
+        for sql, plan in self.query_plans(url, method, **kwargs):
+            problems = [step for step in plan if FULL_SCAN.match(step) or (ordered and step == SORT)]
+            if problems:
+                self.fail(f'{url}: {", ".join(problems)}\n{sql}\n' + '\n'.join(plan))
+
+
+def async_urlconf():
+    '''
+    Корневой URLconf (для override_settings(ROOT_URLCONF=...)) с view из books_app.async_views, как при
+    settings.ASYNC_VIEWS: books_app.urls выполняется заново отдельным модулем, рабочий URLconf не меняется
+    '''
+    spec = importlib.util.find_spec('books_app.urls')
+    urls = importlib.util.module_from_spec(spec)
+    with override_settings(ASYNC_VIEWS=True):
+        spec.loader.exec_module(urls)
+    urlconf = ModuleType('books_app.async_urlconf')
+    urlconf.urlpatterns = [path('books/', include(urls))]
+    return urlconf
@@ -1,3 +1,1305 @@
-from django.test import TestCase
+import base64
+import datetime
+import hashlib
+import io
+import json
+import os
+import pickle
+import re
+import shutil
+import tempfile
+import time
+from unittest import mock
+from urllib.parse import quote
 
-# Create your tests here.
+import PIL.Image
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections, router
+from django.test import Client, TestCase, override_settings
+from django.templatetags.static import static
+from django.urls import resolve
+from django.utils import timezone
+
+from books_app import (
+    async_views, auth, benchmark, comments, exporter, jobs, rankings, search, storage, tasks, thumbnails,
+)
+from books_app.dataset import DatasetGenerator, DatasetSize
+from books_app.db_routers import primary_written, replica_reads
+from books_app.importer import CatalogueImporter, RatingsImporter, read_records
+from books_app.models import Author, Book, BookRate, Comment, CommentDay, Images, Job, Visitor
+from books_app.middleware import PIN_COOKIE
+from books_app.pagination import cursor_after
+from books_app.testing import QueryBudgetMixin, QueryPlanMixin, async_urlconf
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    '''
+    Число SQL-запросов основных страниц и API не растет с количеством книг и комментариев
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        authors = [Author.objects.create(name=f'Имя {i}', surname=f'Фамилия {i}', year_of_birth=1900 + i)
+                   for i in range(3)]
+        cls.books = [Book.custom.create(name=f'Книга {i}', author=authors[i % 3], year=2000 + i, description='Описание')
+                     for i in range(10)]
+        cls.user = User.objects.create_user('reader', password='password')
+        cls.visitor = Visitor.objects.create(user=cls.user, name='Читатель')
+        book = cls.books[0]
+        for i in range(5):
+            parent = Comment.objects.create(book=book, visitor=cls.visitor, comment=f'Комментарий {i}')
+            Comment.objects.create(book=book, visitor=cls.visitor, comment='Ответ', parent=parent)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_pages(self):
+        book = self.books[0]
+        for url in ('/books/', f'/books/{book.pk}/', '/books/search/?do=Книга', f'/books/{book.pk}/comments/window/',
+                    f'/books/{book.pk}/images/', '/books/top/', '/books/discussed/'):
+            with self.subTest(url=url):
+                response = self.assertWithinQueryBudget(url)
+                self.assertEqual(response.status_code, 200)
+
+    def test_api(self):
+        for url in ('/books/api/books/', f'/books/api/books/{self.books[0].pk}/', '/books/api/authors/',
+                    '/books/api/books/top/', '/books/api/books/discussed/'):
+            with self.subTest(url=url):
+                response = self.assertWithinQueryBudget(url)
+                self.assertEqual(response.status_code, 200)
+
+    def test_writes(self):
+        book = self.books[1]
+        response = self.assertWithinQueryBudget('/books/rating/', 'post', data={'book_id': book.pk, 'rate': 4})
+        self.assertEqual(response.json()['status'], 'created')
+        response = self.assertWithinQueryBudget(f'/books/{book.pk}/comments/', 'post', data={'comment': 'Новый'},
+                                                HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 200)
+
+    def test_rating_batch(self):
+        books = self.books[2:7]
+        votes = [{'book_id': book.pk, 'rate': 5} for book in books]
+        response = self.assertWithinQueryBudget('/books/rating/batch/', 'post', data={'votes': votes},
+                                                content_type='application/json')
+        self.assertEqual({vote['status'] for vote in response.json()['votes']}, {'created'})
+        self.assertEqual({book['rating_count'] for book in response.json()['books']}, {1})
+
+    def test_book_delete(self):
+        # Оценки и комментарии удаляемой книги вычитаются из счетчиков посетителей агрегатами, а не по строке
+        book = self.books[9]
+        visitors = [Visitor.objects.create(user=User.objects.create_user(f'voter{i}'), name='Читатель') for i in range(50)]
+        BookRate.apply_votes([(visitor.pk, book.pk, 1 + i % 5) for i, visitor in enumerate(visitors)])
+        BookRate.apply_votes([(visitor.pk, self.books[8].pk, 5) for visitor in visitors[:10]])
+        for i in range(100):
+            Comment.objects.create(book=book, visitor=visitors[i % 10], comment=f'Комментарий {i}')
+        response = self.assertWithinQueryBudget(f'/books/{book.pk}/delete/', 'post')
+        self.assertRedirects(response, '/books/', fetch_redirect_response=False)
+        self.assertFalse(Book.custom.filter(pk=book.pk).exists())
+        self.assertEqual(Visitor.rebuild_stats(), 0)
+        self.assertEqual(Visitor.objects.get(pk=visitors[0].pk).ratings_count, 1)
+
+    @override_settings(METRICS_TOKEN='secret', METRICS_ALLOWED_IPS=[])
+    def test_metrics_access(self):
+        self.client.logout()
+        self.client.get('/books/')
+        self.assertEqual(self.client.get('/books/metrics/').status_code, 302)
+        self.assertEqual(self.client.get('/books/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 302)
+        response = self.client.get('/books/metrics/', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('books_requests_total{view="books_app:books_list"}', response.content.decode())
+
+
+class KeysetPaginationTests(TestCase):
+    '''
+    Проход по страницам курсорами в обе стороны; испорченный курсор - 404, а не ошибка сервера
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(name='Имя', surname='Фамилия', year_of_birth=1900)
+        Book.custom.bulk_create([Book(name=f'Книга {i}', author=author, year=2000 + i % 3, description='')
+                                 for i in range(8)])
+        cls.names = list(Book.custom.order_by('name', 'pk').values_list('name', flat=True))
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, url: str, direction: str) -> list:
+        pages = []
+        while url:
+            data = self.client.get(url).json()
+            pages.append([book['name'] for book in data['results']])
+            url = data[direction]
+        return pages
+
+    def test_api_walk_both_ways(self):
+        forward = self.walk('/books/api/books/?page_size=3', 'next')
+        self.assertEqual([len(page) for page in forward], [3, 3, 2])
+        self.assertEqual(sum(forward, []), self.names)
+
+        last = self.client.get('/books/api/books/?page_size=3').json()
+        while last['next']:
+            last = self.client.get(last['next']).json()
+        backward = self.walk(last['previous'], 'previous')
+        self.assertEqual(sum(reversed(backward), []), self.names[:6])
+
+        by_year = sum(self.walk('/books/api/books/?page_size=3&ordering=-year', 'next'), [])
+        self.assertEqual(by_year, list(Book.custom.order_by('-year', '-pk').values_list('name', flat=True)))
+
+    def test_html_walk(self):
+        names, query = [], ''
+        while query is not None:
+            response = self.client.get(f'/books/?{query}')
+            names += [book.name for book in response.context['object_list']]
+            query = response.context['next_page_query']
+        self.assertEqual(names, self.names)
+
+    def test_invalid_cursor(self):
+        def cursor(payload):
+            return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+        for url in (f"/books/?cursor={cursor({'v': ['x', 'y']})}",
+                    f"/books/api/books/?ordering=year&cursor={cursor({'v': ['a', 'b']})}",
+                    f"/books/api/books/?cursor={cursor({'v': [None, 1]})}",
+                    f"/books/api/books/?cursor={cursor({'v': ['Книга', 1, 2]})}",
+                    f"/books/api/books/?cursor={cursor({'o': -3})}",
+                    '/books/api/books/?cursor=%%%', '/books/?cursor=bm90IGpzb24'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class ApiReadTests(TestCase):
+    '''
+    Чтение API через values(): выбранные поля и 404 для несуществующих и нечисловых ключей
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(name='Имя', surname='Фамилия', year_of_birth=1900)
+        cls.book = Book.custom.create(name='Книга', author=cls.author, year=2000, description='Описание')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_retrieve(self):
+        response = self.client.get(f'/books/api/books/{self.book.pk}/?fields=name,year')
+        self.assertEqual(response.json(), {'name': 'Книга', 'year': 2000})
+        response = self.client.get(f'/books/api/authors/{self.author.pk}/')
+        self.assertEqual(response.json()['surname'], 'Фамилия')
+
+    def test_retrieve_not_found(self):
+        for url in ('/books/api/books/abc/', '/books/api/authors/abc/', f'/books/api/books/{self.book.pk + 1}/',
+                    f'/books/api/books/{self.book.pk}/?name=Другая'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class AuthorLookupTests(QueryBudgetMixin, TestCase):
+    '''
+    Поле автора в формах книги заполняется подсказками: страницы форм не загружают список всех авторов
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        cls.tolstoy = Author.objects.create(name='Лев', surname='Толстой', year_of_birth=1828)
+        cls.alexey = Author.objects.create(name='Алексей', surname='Толстой', year_of_birth=1883)
+        cls.turgenev = Author.objects.create(name='Иван', surname='Тургенев', year_of_birth=1818)
+        cls.bunin = Author.objects.create(name='Иван', surname='Бунин', year_of_birth=1870)
+        cls.book = Book.custom.create(name='Война и мир', author=cls.tolstoy, year=1869, description='Роман')
+        cls.user = User.objects.create_user('reader')
+        Visitor.objects.create(user=cls.user, name='Читатель')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def lookup(self, text: str) -> list:
+        response = self.assertWithinQueryBudget(f'/books/authors/lookup/?q={text}')
+        return [author['text'] for author in response.json()['results']]
+
+    def test_prefix(self):
+        self.assertEqual(self.lookup('тол'), ['Алексей Толстой (1883)', 'Лев Толстой (1828)'])
+        self.assertEqual(self.lookup('Иван'), ['Иван Бунин (1870)', 'Иван Тургенев (1818)'])
+        self.assertEqual(self.lookup('лев толстой'), ['Лев Толстой (1828)'])
+        self.assertEqual(self.lookup('толстой Ал'), ['Алексей Толстой (1883)'])
+        self.assertEqual(self.lookup('Т'), ['Алексей Толстой (1883)', 'Лев Толстой (1828)', 'Иван Тургенев (1818)'])
+        self.assertEqual(self.lookup(''), [])
+
+    def test_case_and_unusual_input(self):
+        Author.objects.create(name='ГЕРБЕРТ', surname='УЭЛЛС', year_of_birth=1866)
+        Author.objects.create(name='Cormac', surname='McCarthy', year_of_birth=1933)
+        self.assertEqual(self.lookup('ТОЛСТ'), ['Алексей Толстой (1883)', 'Лев Толстой (1828)'])
+        self.assertEqual(self.lookup('уэл'), ['ГЕРБЕРТ УЭЛЛС (1866)'])
+        self.assertEqual(self.lookup('герберт уэллс'), ['ГЕРБЕРТ УЭЛЛС (1866)'])
+        self.assertEqual(self.lookup('McC'), ['Cormac McCarthy (1933)'])
+        for text in ('\U0010ffff', 'Т\U0010ffff', '\ud7ff'):
+            with self.subTest(text=text):
+                self.assertEqual(self.lookup(quote(text)), [])
+
+    def test_forms_do_not_load_authors(self):
+        Author.objects.bulk_create(Author(name=f'Имя {i}', surname=f'Фамилия {i}', year_of_birth=1900)
+                                   for i in range(50))
+        response = self.assertWithinQueryBudget('/books/create/')
+        self.assertNotContains(response, 'Фамилия 1')
+        self.assertContains(response, 'custom/js/author_lookup.js')
+        response = self.assertWithinQueryBudget(f'/books/{self.book.pk}/update/')
+        self.assertContains(response, 'value="Лев Толстой (1828)"')
+        self.assertNotContains(response, 'Фамилия 1')
+
+    def test_create_validates_author(self):
+        data = {'name': 'Отцы и дети', 'description': 'Роман', 'year': 1862}
+        response = self.client.post('/books/create/', {**data, 'author': 0})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].errors['author'])
+        response = self.client.post('/books/create/', {**data, 'author': self.turgenev.pk})
+        self.assertRedirects(response, '/books/', fetch_redirect_response=False)
+        self.assertEqual(Book.custom.get(name='Отцы и дети').author, self.turgenev)
+
+
+class BookFragmentTests(TestCase):
+    '''
+    Страница книги не зависит от размера обсуждения, фрагменты кешируются для всех посетителей
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(name='Имя', surname='Фамилия', year_of_birth=1900)
+        cls.book = Book.custom.create(name='Книга', author=author, year=2000, description='')
+        cls.user = User.objects.create_user('reader')
+        cls.visitor = Visitor.objects.create(user=cls.user, name='Читатель')
+        for i in range(5):
+            Comment.objects.create(book=cls.book, visitor=cls.visitor, comment=f'Комментарий {i}')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_shell_without_comments(self):
+        response = self.client.get(f'/books/{self.book.pk}/')
+        self.assertNotContains(response, 'Комментарий 0')
+        self.assertContains(response, f'/books/{self.book.pk}/comments/window/')
+        self.assertContains(response, f'/books/{self.book.pk}/images/')
+
+    def test_fragments_cached_for_visitors(self):
+        self.client.force_login(self.user)
+        url = f'/books/{self.book.pk}/comments/window/'
+        first = self.client.get(url)
+        self.assertContains(first, 'Комментарий 0')
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        self.client.post(f'/books/{self.book.pk}/comments/', {'comment': 'Свежий'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertContains(self.client.get(url), 'Свежий')
+
+    def test_window_pages_newest_first(self):
+        url = f'/books/{self.book.pk}/comments/window/'
+        with mock.patch.object(comments, 'ROOTS_PER_WINDOW', 2):
+            first = self.client.get(url).content.decode()
+            self.assertLess(first.index('Комментарий 4'), first.index('Комментарий 3'))
+            self.assertNotIn('Комментарий 2', first)
+            # Новая корневая ветка другой книги не сдвигает курсор
+            other = Book.custom.create(name='Другая', author=self.book.author, year=2000, description='')
+            Comment.objects.create(book=other, visitor=self.visitor, comment='Чужой')
+            second = self.client.get(url + re.search(r'\?after=\d+', first).group()).content.decode()
+        self.assertIn('Комментарий 2', second)
+        self.assertIn('Комментарий 1', second)
+        self.assertNotIn('Комментарий 3', second)
+
+class CachedIdentityTests(TestCase):
+    '''
+    Сессия, пользователь и посетитель берутся из кеша: запись оценки и комментария - только запросы к данным
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(name='Имя', surname='Фамилия', year_of_birth=1900)
+        cls.books = [Book.custom.create(name=f'Книга {i}', author=author, year=2000, description='') for i in range(3)]
+        cls.user = User.objects.create_user('reader', password='password')
+        cls.visitor = Visitor.objects.create(user=cls.user, name='Читатель')
+
+    def setUp(self):
+        cache.clear()
+        self.client.login(username='reader', password='password')
+        self.client.get('/books/top/')
+
+    def test_writes_without_identity_queries(self):
+        # Блокировка и чтение книги, чтение оценок, вставка, счетчики посетителя и книги (+ точка сохранения)
+        with self.assertNumQueries(8):
+            response = self.client.post('/books/rating/', {'book_id': self.books[0].pk, 'rate': 4})
+        self.assertEqual(response.json()['status'], 'created')
+        # Следующий tree_id, вставка, счетчики обсуждаемых книг, книги и посетителя (+ точка сохранения)
+        with self.assertNumQueries(7):
+            response = self.client.post(f'/books/{self.books[0].pk}/comments/', {'comment': 'Новый'})
+        self.assertRedirects(response, f'/books/{self.books[0].pk}/', fetch_redirect_response=False)
+
+    def test_comment_form_errors(self):
+        response = self.client.post(f'/books/{self.books[0].pk}/comments/', {'comment': ''})
+        self.assertContains(response, 'errorlist', status_code=400)
+        self.assertContains(response, self.books[0].name, status_code=400)
+
+    def test_visitor_update_invalidates(self):
+        self.assertContains(self.client.get('/books/top/'), 'Имя: Читатель')
+        self.client.post(f'/books/users/{self.visitor.pk}/update/', {'name': 'Новое имя', 'surname': 'Фамилия', 'bio': ''})
+        self.assertContains(self.client.get('/books/top/'), 'Имя: Новое имя')
+
+    def test_cached_user_without_password_hash(self):
+        cached = cache.get(f'auth:user:{self.user.pk}')
+        self.assertIsNotNone(cached)
+        self.assertNotIn(self.user.password.encode(), pickle.dumps(cached))
+        # Сессия проверяется без чтения пользователя (единственный запрос - данные страницы)
+        with self.assertNumQueries(1):
+            self.assertContains(self.client.get('/books/top/'), 'Имя: Читатель')
+        # Пользователь из кеша не затирает пароль при сохранении
+        user = auth.CachedModelBackend().get_user(self.user.pk)
+        user.first_name = 'Имя'
+        user.save()
+        self.assertTrue(User.objects.get(pk=self.user.pk).check_password('password'))
+
+    def test_password_change_and_deactivation_end_sessions(self):
+        self.user.set_password('changed')
+        self.user.save()
+        self.assertNotContains(self.client.get('/books/top/'), 'Имя: Читатель')
+
+        self.client.login(username='reader', password='changed')
+        self.assertContains(self.client.get('/books/top/'), 'Имя: Читатель')
+        self.user.is_active = False
+        self.user.save(update_fields=['is_active'])
+        self.assertNotContains(self.client.get('/books/top/'), 'Имя: Читатель')
+
+
+class RatingBatchTests(TestCase):
+    '''
+    Пакетные оценки сохраняют семантику переключения и согласованы с агрегатами книг
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(name='Имя', surname='Фамилия', year_of_birth=1900)
+        cls.books = [Book.custom.create(name=f'Книга {i}', author=author, year=2000, description='') for i in range(3)]
+        cls.visitors = [Visitor.objects.create(user=User.objects.create_user(f'reader{i}'), name='Читатель')
+                        for i in range(2)]
+
+    def test_toggle(self):
+        first, second = self.visitors
+        book = self.books[0]
+        statuses, aggregates = BookRate.apply_votes([(first.pk, book.pk, 4), (second.pk, book.pk, 2)])
+        self.assertEqual(set(statuses.values()), {'created'})
+        self.assertEqual(aggregates[book.pk], (2, 3.0))
+        self.assertEqual(BookRate.toggle(first, book.pk, 5), ('updated', 3.5))
+        self.assertEqual(BookRate.toggle(first, book.pk, 5), ('deleted', 2.0))
+        statuses, aggregates = BookRate.apply_votes([(second.pk, book.pk, 1), (second.pk, book.pk, 2)])
+        self.assertEqual(statuses[second.pk, book.pk], 'unchanged')
+        self.assertEqual(aggregates[book.pk], (1, 2.0))
+
+    def test_set_is_idempotent(self):
+        visitor = self.visitors[0]
+        votes = [(visitor.pk, book.pk, rate) for book, rate in zip(self.books, (1, 3, 5))] + [(visitor.pk, 0, 5)]
+        statuses, _ = BookRate.apply_votes(votes, 'set')
+        self.assertEqual(statuses[visitor.pk, 0], 'not_found')
+        statuses, _ = BookRate.apply_votes(votes, 'set')
+        self.assertEqual(set(statuses.values()) - {'not_found'}, {'unchanged'})
+        statuses, aggregates = BookRate.apply_votes([(visitor.pk, self.books[0].pk, 0)], 'set')
+        self.assertEqual(statuses[visitor.pk, self.books[0].pk], 'deleted')
+        self.assertEqual(aggregates[self.books[0].pk], (0, 0))
+        # Агрегаты совпадают с полным пересчетом
+        self.assertEqual(Book.rebuild_ratings(), 0)
+
+    def test_delete_outside_votes(self):
+        first, second = self.visitors
+        book = self.books[0]
+        BookRate.apply_votes([(first.pk, book.pk, 4), (second.pk, book.pk, 2), (first.pk, self.books[1].pk, 5)])
+        # Удаление из админки
+        BookRate.objects.get(visitor=second, book=book).delete()
+        book.refresh_from_db()
+        self.assertEqual((book.rating_count, book.rating_sum, book.rating_avg), (1, 4, 4.0))
+        self.assertEqual(Visitor.objects.get(pk=second.pk).ratings_count, 0)
+        # Каскад при удалении пользователя
+        first.user.delete()
+        book.refresh_from_db()
+        self.assertEqual((book.rating_count, book.rating_sum, book.rating_avg, book.rating_score), (0, 0, 0, 0))
+        self.assertEqual(Book.rebuild_ratings(), 0)
+        self.assertEqual(Visitor.rebuild_stats(), 0)
+
+    def test_counters_do_not_go_negative(self):
+        visitor = self.visitors[0]
+        # Счетчики базы, где они не были заполнены
+        BookRate.objects.bulk_create([BookRate(visitor=visitor, book=self.books[0], rate=3)])
+        BookRate.objects.get(visitor=visitor).delete()
+        visitor.refresh_from_db()
+        self.assertEqual((visitor.ratings_count, visitor.rates_3), (0, 0))
+
+    def test_rating_view_rejects_bad_input(self):
+        self.client.force_login(self.visitors[0].user)
+        book = self.books[0]
+        for data in ({}, {'book_id': book.pk}, {'book_id': 'книга', 'rate': 4}, {'book_id': book.pk, 'rate': 'пять'},
+                     {'book_id': book.pk, 'rate': 0}, {'book_id': book.pk, 'rate': 6}):
+            with self.subTest(data=data):
+                response = self.client.post('/books/rating/', data)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+        self.assertFalse(BookRate.objects.exists())
+
+
+class RankingTests(TestCase):
+    '''
+    Рейтинги лучших и обсуждаемых книг поддерживаются при оценках и комментариях
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(name='Имя', surname='Фамилия', year_of_birth=1900)
+        cls.books = [Book.custom.create(name=f'Книга {i}', author=author, year=2000, description='') for i in range(3)]
+        cls.visitors = [Visitor.objects.create(user=User.objects.create_user(f'reader{i}'), name='Читатель')
+                        for i in range(6)]
+
+    def test_top_rated(self):
+        few, many, unrated = self.books
+        votes = [(visitor.pk, few.pk, 5) for visitor in self.visitors[:3]]
+        votes += [(visitor.pk, many.pk, 5) for visitor in self.visitors]
+        votes += [(self.visitors[0].pk, unrated.pk, 5)]
+        BookRate.apply_votes(votes)
+        # Шесть пятерок надежнее трех; книга с одной оценкой в рейтинг не входит
+        self.assertEqual(list(rankings.top_rated().values_list('pk', flat=True)), [many.pk, few.pk])
+        with self.assertLogs('books_app.requests', 'INFO'):
+            response = self.client.get('/books/api/books/top/?fields=pk,rating_score')
+        self.assertEqual([row['pk'] for row in response.json()['results']], [many.pk, few.pk])
+
+    def test_discussed(self):
+        first, second, _ = self.books
+        for _ in range(2):
+            Comment.objects.create(book=first, visitor=self.visitors[0], comment='Комментарий')
+        reply = Comment.objects.create(book=second, visitor=self.visitors[0], comment='Комментарий')
+        self.assertEqual(list(rankings.most_discussed().values_list('pk', 'comments_recent')),
+                         [(first.pk, 2), (second.pk, 1)])
+        reply.delete()
+        self.assertEqual(list(rankings.most_discussed().values_list('pk', flat=True)), [first.pk])
+
+        # Через неделю дни выходят из окна
+        later = timezone.localdate() + datetime.timedelta(days=rankings.DISCUSSED_DAYS)
+        self.assertEqual(rankings.expire_discussions(later), 2)
+        self.assertFalse(CommentDay.objects.exists())
+        self.assertEqual(Book.custom.get(pk=first.pk).comments_recent, 0)
+
+        self.assertEqual(rankings.rebuild_discussions(), 1)
+        self.assertEqual(Book.custom.get(pk=first.pk).comments_recent, 2)
+
+
+class VisitorStatsTests(QueryBudgetMixin, TestCase):
+    '''
+    Счетчики посетителя обновляются при записи, страница посетителя укладывается в бюджет запросов
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(name='Имя', surname='Фамилия', year_of_birth=1900)
+        cls.books = [Book.custom.create(name=f'Книга {i}', author=author, year=2000, description='') for i in range(15)]
+        cls.user = User.objects.create_user('reader')
+        cls.visitor = Visitor.objects.create(user=cls.user, name='Читатель')
+
+    def test_counters(self):
+        visitor = self.visitor
+        BookRate.apply_votes([(visitor.pk, book.pk, 1 + i % 5) for i, book in enumerate(self.books)])
+        BookRate.toggle(visitor, self.books[0].pk, 1)
+        BookRate.toggle(visitor, self.books[1].pk, 5)
+        comment = Comment.objects.create(book=self.books[0], visitor=visitor, comment='Комментарий')
+        Comment.objects.create(book=self.books[0], visitor=visitor, comment='Ответ', parent=comment)
+        self.books[2].delete()
+        visitor.refresh_from_db()
+        self.assertEqual((visitor.ratings_count, visitor.comments_count), (13, 2))
+        self.assertEqual([count for _, count, _ in visitor.rating_histogram], [4, 3, 2, 2, 2])
+        self.assertEqual(Visitor.rebuild_stats(), 0)
+
+    def test_page(self):
+        BookRate.apply_votes([(self.visitor.pk, book.pk, 4) for book in self.books])
+        for book in self.books:
+            Comment.objects.create(book=book, visitor=self.visitor, comment='Комментарий')
+        self.client.force_login(self.user)
+        response = self.assertWithinQueryBudget(f'/books/users/{self.visitor.pk}/')
+        self.assertEqual(len(response.context['ratings_page']), 10)
+        self.assertEqual(len(response.context['comments_page']), 10)
+        response = self.assertWithinQueryBudget(f'/books/users/{self.visitor.pk}/?{response.context["ratings_next"]}')
+        self.assertEqual(len(response.context['ratings_page']), 5)
+
+
+class QueryPlanTests(QueryPlanMixin, TestCase):
+    '''
+    Горячие запросы страниц и API идут по индексам (EXPLAIN QUERY PLAN), страницы списков - без сортировки
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(name='Имя', surname='Фамилия', year_of_birth=1900)
+        cls.books = [Book.custom.create(name=f'Книга {i}', author=cls.author, year=2000 + i % 3, description='')
+                     for i in range(6)]
+        cls.user = User.objects.create_user('reader')
+        cls.visitor = Visitor.objects.create(user=cls.user, name='Читатель')
+        cls.root = Comment.objects.create(book=cls.books[0], visitor=cls.visitor, comment='Комментарий')
+        Comment.objects.create(book=cls.books[0], visitor=cls.visitor, comment='Ответ', parent=cls.root)
+        BookRate.apply_votes([(cls.visitor.pk, book.pk, 5) for book in cls.books])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_lists(self):
+        book = self.books[0]
+        cursor = cursor_after(book, ['name'])
+        year_cursor = cursor_after(book, ['-year'])
+        for url in ('/books/', f'/books/?cursor={cursor}', '/books/top/', '/books/discussed/',
+                    '/books/api/books/', f'/books/api/books/?cursor={cursor}', '/books/api/books/?ordering=-year',
+                    f'/books/api/books/?ordering=-year&cursor={year_cursor}', '/books/api/books/top/',
+                    '/books/api/books/discussed/', '/books/api/authors/', '/books/api/authors/?ordering=name',
+                    '/books/api/authors/?ordering=-year_of_birth'):
+            with self.subTest(url=url):
+                self.assertIndexedPlans(url, ordered=True)
+
+    def test_lookups(self):
+        book, author = self.books[0], self.author
+        for url in (f'/books/{book.pk}/', f'/books/{book.pk}/comments/window/',
+                    f'/books/{book.pk}/comments/window/?after={self.root.pk}', f'/books/{book.pk}/images/',
+                    '/books/search/?do=Книга',
+                    f'/books/api/books/{book.pk}/', f'/books/api/books/?name={book.name}',
+                    f'/books/api/books/?year={book.year}', f'/books/api/books/?author={author.pk}',
+                    '/books/api/books/?search=Книга', '/books/api/books/?ordering=author__surname',
+                    f'/books/api/authors/{author.pk}/', '/books/authors/lookup/?q=Фам',
+                    '/books/authors/lookup/?q=Имя Фамилия', f'/books/api/authors/?surname={author.surname}',
+                    f'/books/api/authors/?name={author.name}', '/books/api/authors/?year_of_birth=1900'):
+            with self.subTest(url=url):
+                self.assertIndexedPlans(url)
+
+    def test_visitor_pages(self):
+        self.client.force_login(self.user)
+        self.assertIndexedPlans(f'/books/users/{self.visitor.pk}/', ordered=True)
+        self.assertIndexedPlans('/books/rating/', 'post', data={'book_id': self.books[1].pk, 'rate': 4})
+
+
+class StaticPipelineTests(TestCase):
+    '''
+    collectstatic пишет файлы с хешем и сжатые копии, приложение отдает их с учетом Accept-Encoding
+    '''
+    @classmethod
+    def setUpClass(cls):
+        cls.root = tempfile.mkdtemp()
+        cls.settings_override = override_settings(
+            STATIC_PIPELINE=True,
+            STATIC_ROOT=cls.root,
+            STATICFILES_DIRS=[('custom', f'{settings.BASE_DIR}/templates/src/custom')],
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+            STORAGES={
+                'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                'staticfiles': {'BACKEND': 'books_app.staticfiles.CompressedManifestStaticFilesStorage'},
+            },
+        )
+        cls.settings_override.enable()
+        super().setUpClass()
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.settings_override.disable()
+        shutil.rmtree(cls.root)
+
+    def test_hashed_and_compressed(self):
+        url = static('custom/js/comments.js')
+        self.assertRegex(url, r'^/static/custom/js/comments\.[0-9a-f]{12}\.js$')
+        plain = self.client.get(url, HTTP_ACCEPT_ENCODING='identity')
+        self.assertIsNone(plain.get('Content-Encoding'))
+        self.assertEqual(plain['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(plain['Vary'], 'Accept-Encoding')
+
+        compressed = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertLess(int(compressed['Content-Length']), int(plain['Content-Length']))
+        self.assertNotEqual(compressed['ETag'], plain['ETag'])
+        not_modified = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=compressed['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_unhashed_and_missing(self):
+        response = self.client.get('/static/custom/js/comments.js')
+        self.assertEqual(response['Cache-Control'], f'public, max-age={settings.STATIC_MAX_AGE}')
+        self.assertEqual(self.client.get('/static/custom/js/missing.js').status_code, 404)
+
+
+class MediaServingTests(TestCase):
+    '''
+    Файлы MEDIA: условные запросы, Range и передача файла веб-серверу
+    '''
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.root = tempfile.mkdtemp()
+        cls.data = bytes(range(256)) * 40
+        with open(f'{cls.root}/cover.jpg', 'wb') as stream:
+            stream.write(cls.data)
+        cls.settings_override = override_settings(MEDIA_ROOT=cls.root, MEDIA_ACCEL='')
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        shutil.rmtree(cls.root)
+        super().tearDownClass()
+
+    def test_full_and_conditional(self):
+        response = self.client.get('/media/cover.jpg')
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Cache-Control'], f'public, max-age={settings.MEDIA_MAX_AGE}')
+        self.assertEqual(self.client.get('/media/cover.jpg', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get('/media/cover.jpg', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+                         .status_code, 304)
+
+    def test_ranges(self):
+        response = self.client.get('/media/cover.jpg', HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.data)}')
+        self.assertEqual(b''.join(response.streaming_content), self.data[100:200])
+
+        response = self.client.get('/media/cover.jpg', HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), self.data[-10:])
+        response = self.client.get('/media/cover.jpg', HTTP_RANGE=f'bytes={len(self.data)}-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, f'bytes */{len(self.data)}'))
+        response = self.client.get('/media/cover.jpg', HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_accel_and_traversal(self):
+        with self.settings(MEDIA_ACCEL='x-accel', MEDIA_ACCEL_PREFIX='/protected-media/'):
+            response = self.client.get('/media/cover.jpg')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/cover.jpg')
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+        self.assertEqual(self.client.get('/media/missing.jpg').status_code, 404)
+
+
+class ImageStorageTests(TestCase):
+    '''
+    Одинаковые изображения хранятся одним файлом, файл удаляется вместе с последней ссылкой
+    '''
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.root)
+        self.settings_override.enable()
+        author = Author.objects.create(name='Имя', surname='Фамилия', year_of_birth=1900)
+        self.books = [Book.custom.create(name=f'Издание {i}', author=author, year=2000, description='') for i in range(2)]
+        self.data = b'cover' * 100
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.root)
+
+    def age(self, name: str) -> None:
+        '''Файл записан раньше окна ORPHAN_GRACE_SECONDS'''
+        past = time.time() - storage.ORPHAN_GRACE_SECONDS - 60
+        os.utime(os.path.join(self.root, name), (past, past))
+
+    def files(self) -> list:
+        return sorted(os.path.relpath(os.path.join(directory, name), self.root)
+                      for directory, _, names in os.walk(self.root) for name in names)
+
+    def test_deduplicated_uploads(self):
+        first = Images.objects.create(book=self.books[0], image=SimpleUploadedFile('cover.jpg', self.data))
+        second = Images.objects.create(book=self.books[1], image=SimpleUploadedFile('Copy.JPEG', self.data))
+        digest = hashlib.sha256(self.data).hexdigest()
+        self.assertEqual(first.image.name, f'book_images/{digest[:2]}/{digest}.jpg')
+        self.assertEqual((second.image.name, second.content_hash), (first.image.name, digest))
+        self.assertEqual(self.files(), [first.image.name])
+
+        first.delete()
+        tasks.delete_image_files(first.image.name, digest)
+        self.assertEqual(self.files(), [first.image.name])
+        second.delete()
+        self.age(second.image.name)
+        tasks.delete_image_files(second.image.name, digest)
+        self.assertEqual(self.files(), [])
+
+    def test_delete_keeps_file_of_pending_upload(self):
+        first = Images.objects.create(book=self.books[0], image=SimpleUploadedFile('cover.jpg', self.data))
+        self.age(first.image.name)
+        with mock.patch.object(jobs, 'EAGER', False):
+            first.delete()
+            # Та же обложка загружается снова до задачи удаления: файл уже есть, запись Images еще не сохранена
+            pending = Images(book=self.books[1], image=SimpleUploadedFile('cover.jpg', self.data))
+            pending.image.save(pending.image.name, pending.image.file, save=False)
+            jobs.run_pending(['images.delete_files'])
+            self.assertEqual(self.files(), [first.image.name])
+            retry = Job.objects.get(name='images.delete_files', status=Job.QUEUED)
+            self.assertGreater(retry.run_after, timezone.now() + datetime.timedelta(minutes=30))
+
+            pending.save()
+            Job.objects.filter(pk=retry.pk).update(run_after=timezone.now())
+            self.age(first.image.name)
+            jobs.run_pending(['images.delete_files'])
+        self.assertEqual(self.files(), [first.image.name])
+
+    def test_reclaim_legacy_and_orphans(self):
+        os.makedirs(f'{self.root}/book_images')
+        for name in ('a-cover.jpg', 'b-cover_x1Yz.jpg', 'stray.jpg'):
+            with open(f'{self.root}/book_images/{name}', 'wb') as stream:
+                stream.write(self.data if name != 'stray.jpg' else b'stray')
+        for book, name in zip(self.books, ('a-cover.jpg', 'b-cover_x1Yz.jpg')):
+            Images.objects.bulk_create([Images(book=book, image=f'book_images/{name}')])
+
+        result = storage.deduplicate_legacy()
+        self.assertEqual((result['moved'], result['merged']), (1, 1))
+        self.assertEqual(Images.objects.values('image').distinct().count(), 1)
+        self.assertEqual(storage.remove_orphans(grace_seconds=0)['images'], 1)
+        self.assertEqual(self.files(), [Images.objects.first().image.name])
+
+
+calls = []
+
+
+@jobs.register('tests.flaky')
+def flaky_job(fail_times: int):
+    calls.append(fail_times)
+    if len(calls) <= fail_times:
+        raise RuntimeError(f'failure {len(calls)}')
+
+
+class JobQueueTests(TestCase):
+    '''
+    Очередь задач: повтор с экспоненциальной задержкой, FAILED после max_attempts, захват одним воркером
+    '''
+    def setUp(self):
+        calls.clear()
+
+    def run_due(self, job) -> Job:
+        '''Задача становится готовой (как по прошествии задержки) и выполняется'''
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        with mock.patch.object(jobs.logger, 'exception'):
+            self.assertEqual(jobs.run_pending(['tests.flaky']), 1)
+        return Job.objects.get(pk=job.pk)
+
+    def test_retry_backoff_and_failure(self):
+        job = jobs.enqueue('tests.flaky', {'fail_times': 5}, max_attempts=3)
+        delays = []
+        for attempt in (1, 2):
+            started = timezone.now()
+            job = self.run_due(job)
+            self.assertEqual((job.status, job.attempts), (Job.QUEUED, attempt))
+            self.assertIn(f'failure {attempt}', job.last_error)
+            delays.append((job.run_after - started).total_seconds())
+            # До истечения задержки задача не выполняется
+            self.assertEqual(jobs.run_pending(['tests.flaky']), 0)
+        base = jobs.RETRY_BASE_SECONDS
+        self.assertAlmostEqual(delays[0], base, delta=1)
+        self.assertAlmostEqual(delays[1], base * 2, delta=1)
+
+        job = self.run_due(job)
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 3))
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(jobs.run_pending(['tests.flaky']), 0)
+        self.assertEqual(jobs.metrics()['tests.flaky']['failed'], 1)
+
+    def test_success_after_retry(self):
+        job = jobs.enqueue('tests.flaky', {'fail_times': 1})
+        self.assertEqual(self.run_due(job).status, Job.QUEUED)
+        job = self.run_due(job)
+        self.assertEqual((job.status, job.attempts, calls), (Job.DONE, 2, [1, 1]))
+
+    def test_claim_once(self):
+        job = jobs.enqueue('tests.flaky', {'fail_times': 0})
+        claimed = jobs.claim_next(['tests.flaky'])
+        self.assertEqual((claimed.pk, claimed.status), (job.pk, Job.RUNNING))
+        self.assertIsNone(jobs.claim_next(['tests.flaky']))
+        self.assertFalse(jobs.run_job(job.pk))
+        Job.objects.filter(pk=job.pk).update(started_at=timezone.now() - datetime.timedelta(hours=1))
+        self.assertEqual(jobs.requeue_stale(), 1)
+        self.assertTrue(jobs.run_job(job.pk))
+        self.assertEqual(calls, [0])
+
+    def test_eager_runs_on_commit(self):
+        with mock.patch.object(jobs, 'EAGER', True), self.captureOnCommitCallbacks(execute=True):
+            job = jobs.enqueue('tests.flaky', {'fail_times': 0})
+            self.assertEqual(calls, [])
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.DONE)
+        with self.assertRaises(KeyError):
+            jobs.enqueue('tests.unknown')
+
+class ThumbnailTests(TestCase):
+    '''
+    Копии изображений строятся задачей очереди: WebP и JPEG всех ширин меньше оригинала, один раз на содержимое
+    '''
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.root)
+        self.settings_override.enable()
+        author = Author.objects.create(name='Имя', surname='Фамилия', year_of_birth=1900)
+        self.books = [Book.custom.create(name=f'Издание {i}', author=author, year=2000, description='') for i in range(2)]
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.root)
+
+    @staticmethod
+    def upload(book, width: int, height: int, name: str = 'cover.png') -> Images:
+        output = io.BytesIO()
+        PIL.Image.new('RGBA', (width, height), (200, 40, 40, 255)).save(output, 'PNG')
+        return Images.objects.create(book=book, image=SimpleUploadedFile(name, output.getvalue()))
+
+    def test_renditions(self):
+        image = self.upload(self.books[0], 700, 350)
+        self.assertEqual(Job.objects.filter(name='thumbnails.build', status=Job.QUEUED).count(), 1)
+        self.assertEqual(image.webp_srcset, '')
+        self.assertEqual(jobs.run_pending(['thumbnails.build']), 1)
+
+        image.refresh_from_db()
+        self.assertEqual(image.image_width, 700)
+        self.assertEqual(image.webp_srcset.count('w, '), len(thumbnails.WIDTHS) - 1)
+        for width in thumbnails.WIDTHS:
+            for fmt in thumbnails.FORMATS:
+                name = thumbnails.rendition_name(image.content_hash, width, fmt)
+                self.assertIn(f'{name} {width}w', image.webp_srcset if fmt == 'webp' else image.jpeg_srcset)
+                with PIL.Image.open(os.path.join(self.root, name)) as rendition:
+                    self.assertEqual((rendition.format, rendition.size), (fmt.upper(), (width, width // 2)))
+
+        # Та же обложка у другой книги: файл и копии общие, повторно не строятся
+        with mock.patch.object(thumbnails, 'render') as render:
+            copy = self.upload(self.books[1], 700, 350, 'copy.png')
+            jobs.run_pending(['thumbnails.build'])
+        render.assert_not_called()
+        copy.refresh_from_db()
+        self.assertEqual(copy.webp_srcset, image.webp_srcset)
+
+    def test_small_image(self):
+        image = self.upload(self.books[0], 100, 80)
+        jobs.run_pending(['thumbnails.build'])
+        image.refresh_from_db()
+        self.assertEqual((image.image_width, image.webp_srcset), (100, ''))
+        self.assertFalse(os.path.exists(os.path.join(self.root, thumbnails.DIRECTORY)))
+
+    def test_renditions_removed_with_last_image(self):
+        image = self.upload(self.books[0], 400, 400)
+        jobs.run_pending(['thumbnails.build'])
+        image.refresh_from_db()
+        renditions = os.path.join(self.root, os.path.dirname(thumbnails.rendition_name(image.content_hash, 160, 'webp')))
+        self.assertEqual(len(os.listdir(renditions)), 4)
+        image.delete()
+        past = time.time() - storage.ORPHAN_GRACE_SECONDS - 60
+        os.utime(os.path.join(self.root, image.image.name), (past, past))
+        jobs.run_pending(['images.delete_files'])
+        self.assertEqual(os.listdir(renditions), [])
+
+class ExportImportTests(TestCase):
+    '''
+    Выгрузка каталога читается обратно импортом без потерь
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(name='Имя', surname='Фамилия', year_of_birth=1900)
+        cls.books = [Book.custom.create(name=f'Книга {i}', author=author, year=2000 + i, description='Описание')
+                     for i in range(3)]
+        cls.visitors = [Visitor.objects.create(user=User.objects.create_user(f'reader{i}'), name=f'Читатель {i}')
+                        for i in range(2)]
+        rated_at = datetime.datetime(2024, 3, 1, 12, 30, 15, 250000, tzinfo=datetime.timezone.utc)
+        for i, book in enumerate(cls.books):
+            for j, visitor in enumerate(cls.visitors):
+                BookRate.apply_votes([(visitor.pk, book.pk, 1 + (i + j) % 5)])
+                BookRate.objects.filter(book=book, visitor=visitor).update(
+                    rated_at=rated_at - datetime.timedelta(days=i, hours=j))
+
+    def snapshot(self):
+        return (
+            set(BookRate.objects.values_list('book_id', 'visitor_id', 'rate', 'rated_at')),
+            list(Book.custom.order_by('pk').values_list('rating_count', 'rating_sum', 'rating_score')),
+            list(Visitor.objects.order_by('pk').values_list(*Visitor.STATS_FIELDS)),
+        )
+
+    def test_ratings_round_trip(self):
+        expected = self.snapshot()
+        for fmt in exporter.FORMATS:
+            with self.subTest(format=fmt):
+                data = ''.join(exporter.export('ratings', fmt))
+                BookRate.objects.all().delete()
+                self.assertEqual(Book.custom.filter(rating_count__gt=0).count(), 0)
+                stats = RatingsImporter().run(read_records(io.StringIO(data), fmt))
+                self.assertEqual((stats.ratings, stats.errors), (6, []))
+                self.assertEqual(self.snapshot(), expected)
+
+    def test_ratings_import_command(self):
+        expected = self.snapshot()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'ratings.jsonl')
+            call_command('export_catalogue', 'ratings', output=path)
+            BookRate.objects.all().delete()
+            with open(path, 'a', encoding='utf-8') as output:
+                output.write(json.dumps({'book_id': 0, 'visitor_id': self.visitors[0].pk, 'rate': 5}) + '\n')
+                output.write(json.dumps({'book_id': self.books[0].pk, 'visitor_id': self.visitors[0].pk,
+                                         'rate': 5, 'rated_at': 'вчера'}) + '\n')
+            stdout, stderr = io.StringIO(), io.StringIO()
+            call_command('import_books', path, dataset='ratings', stdout=stdout, stderr=stderr)
+        self.assertIn('Imported 6 ratings', stdout.getvalue())
+        self.assertIn('unknown book_id 0', stderr.getvalue())
+        self.assertIn('invalid rated_at', stderr.getvalue())
+        self.assertEqual(self.snapshot(), expected)
+
+    def test_books_round_trip(self):
+        data = ''.join(exporter.export('books', 'csv'))
+        Book.custom.all().delete()
+        Author.objects.all().delete()
+        stats = CatalogueImporter().run(read_records(io.StringIO(data), 'csv'))
+        self.assertEqual((stats.books, stats.authors, stats.errors), (3, 1, []))
+        self.assertEqual(
+            list(Book.custom.order_by('year').values_list('name', 'year', 'description', 'author__surname')),
+            [(f'Книга {i}', 2000 + i, 'Описание', 'Фамилия') for i in range(3)],
+        )
+
+
+class SearchTests(TestCase):
+    '''
+    Поиск по индексу: слова ищутся по началу, все слова обязательны, совпадение в названии выше
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        tolstoy = Author.objects.create(name='Лев', surname='Толстой', year_of_birth=1828)
+        chekhov = Author.objects.create(name='Антон', surname='Чехов', year_of_birth=1860)
+        Book.custom.create(name='Рассказы', author=chekhov, year=1890, description='Рассказ о море и степи')
+        Book.custom.create(name='Война и мир', author=tolstoy, year=1869, description='Роман-эпопея')
+        Book.custom.create(name='Море', author=tolstoy, year=1870, description='')
+        for i in range(5):
+            Book.custom.create(name=f'Сборник {i}', author=chekhov, year=1880 + i, description='Морские рассказы')
+
+    def names(self, query):
+        return [book.name for book in search.search_books(Book.custom.all(), query)]
+
+    def test_word_prefixes(self):
+        self.assertEqual(sorted(self.names('толст')), ['Война и мир', 'Море'])
+        self.assertEqual(sorted(self.names('ВОЙН')), ['Война и мир'])
+        self.assertEqual(self.names('война толстой'), ['Война и мир'])
+        self.assertEqual(self.names('война чехов'), [])
+        # В отличие от icontains, середина слова не находится
+        self.assertEqual(self.names('олстой'), [])
+        self.assertEqual(self.names('!!!'), [])
+
+    def test_name_match_ranks_first(self):
+        names = self.names('мор')
+        self.assertEqual(names[0], 'Море')
+        self.assertEqual(set(names[1:]), {'Рассказы'} | {f'Сборник {i}' for i in range(5)})
+
+    def test_pages_keep_relevance_order(self):
+        expected = self.names('мор')
+        names, query = [], 'do=мор'
+        while query is not None:
+            response = self.client.get(f'/books/search/?{query}')
+            names += [book.name for book in response.context['object_list']]
+            query = response.context['next_page_query']
+        self.assertEqual(names, expected)
+
+        response = self.client.get('/books/api/books/', {'search': 'мор', 'page_size': 2})
+        names = [book['name'] for book in response.json()['results']]
+        while response.json()['next']:
+            response = self.client.get(response.json()['next'])
+            names += [book['name'] for book in response.json()['results']]
+        self.assertEqual(names, expected)
+
+
+class AsyncViewTests(TestCase):
+    '''
+    Асинхронные view (settings.ASYNC_VIEWS) под AsyncClient отвечают так же, как синхронные
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(name='Имя', surname='Фамилия', year_of_birth=1900)
+        cls.books = [Book.custom.create(name=f'Книга {i}', author=author, year=2000 + i, description='Описание')
+                     for i in range(4)]
+        cls.user = User.objects.create_user('reader', password='password')
+        cls.visitor = Visitor.objects.create(user=cls.user, name='Читатель')
+
+    def setUp(self):
+        cache.clear()
+        urlconf = override_settings(ROOT_URLCONF=async_urlconf())
+        urlconf.enable()
+        self.addCleanup(urlconf.disable)
+
+    async def login(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+
+    async def test_list_and_details(self):
+        self.assertIs(resolve('/books/').func.view_class, async_views.AsyncBookListView)
+        names, query = [], ''
+        while query is not None:
+            response = await self.async_client.get(f'/books/?{query}')
+            self.assertEqual(response.status_code, 200)
+            names += [book.name for book in response.context['object_list']]
+            query = response.context['next_page_query']
+        self.assertEqual(sorted(names), sorted(book.name for book in self.books))
+
+        book = self.books[0]
+        response = await self.async_client.get(f'/books/{book.pk}/')
+        self.assertContains(response, book.name)
+        self.assertEqual((await self.async_client.get('/books/0/')).status_code, 404)
+        self.assertEqual((await self.async_client.get('/books/?cursor=bad')).status_code, 404)
+
+    async def test_comment_post(self):
+        url = f'/books/{self.books[0].pk}/comments/'
+        response = await self.async_client.post(url, {'comment': 'Без входа'})
+        self.assertEqual(response.status_code, 400)
+
+        await self.login()
+        response = await self.async_client.post(url, {'comment': 'Новый'}, headers={'X-Requested-With': 'XMLHttpRequest'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['comment'], 'Новый')
+        response = await self.async_client.post(url, {'comment': 'Второй'})
+        self.assertRedirects(response, f'/books/{self.books[0].pk}/', fetch_redirect_response=False)
+        self.assertEqual(await Comment.objects.filter(book=self.books[0]).acount(), 2)
+
+        response = await self.async_client.post(url, {'comment': ''}, headers={'X-Requested-With': 'XMLHttpRequest'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('comment', response.json()['error'])
+        # Без AJAX неверная форма показывается на странице книги с ошибками, а не теряется при редиректе
+        response = await self.async_client.post(url, {'comment': ''})
+        self.assertContains(response, 'errorlist', status_code=400)
+        self.assertContains(response, self.books[0].name, status_code=400)
+
+    async def test_rating_post(self):
+        await self.login()
+        book = self.books[0]
+        response = await self.async_client.post('/books/rating/', {'book_id': book.pk, 'rate': 4})
+        self.assertEqual(response.json()['status'], 'created')
+        for data in ({}, {'book_id': 'книга', 'rate': 4}, {'book_id': book.pk, 'rate': 'пять'}, {'book_id': book.pk, 'rate': 6}):
+            with self.subTest(data=data):
+                response = await self.async_client.post('/books/rating/', data)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+        self.assertEqual((await self.async_client.post('/books/rating/', {'book_id': 10 ** 6, 'rate': 4})).status_code, 404)
+
+
+class ResponseCacheTests(TestCase):
+    '''
+    Кешированные ответы сбрасываются сигналами при сохранении книг, авторов и комментариев
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(name='Имя', surname='Фамилия', year_of_birth=1900)
+        cls.book, cls.other = [Book.custom.create(name=f'Книга {i}', author=cls.author, year=2000, description='')
+                               for i in range(2)]
+        cls.visitor = Visitor.objects.create(user=User.objects.create_user('reader'), name='Читатель')
+
+    def setUp(self):
+        cache.clear()
+
+    def assertCached(self, url, text):
+        self.assertContains(self.client.get(url), text)
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(url), text)
+
+    def test_book_save(self):
+        detail, api = f'/books/{self.book.pk}/', f'/books/api/books/{self.book.pk}/'
+        for url in (detail, api, '/books/'):
+            self.assertCached(url, 'Книга 0')
+        self.assertCached(f'/books/{self.other.pk}/', 'Книга 1')
+
+        self.book.name = 'Новое название'
+        self.book.save()
+        for url in (detail, api, '/books/'):
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), 'Новое название')
+        # Страница другой книги от этого изменения не зависит
+        with self.assertNumQueries(0):
+            self.client.get(f'/books/{self.other.pk}/')
+
+    def test_comment_save(self):
+        window = f'/books/{self.book.pk}/comments/window/'
+        self.assertCached(window, '')
+        self.assertCached('/books/', 'Книга 0')
+        comment = Comment.objects.create(book=self.book, visitor=self.visitor, comment='Первый комментарий')
+        self.assertContains(self.client.get(window), 'Первый комментарий')
+        comment.comment = 'Исправленный комментарий'
+        comment.save()
+        self.assertContains(self.client.get(window), 'Исправленный комментарий')
+        # Комментарии не меняют список книг
+        with self.assertNumQueries(0):
+            self.client.get('/books/')
+
+    def test_author_save(self):
+        self.assertCached(f'/books/{self.book.pk}/', 'Имя Фамилия')
+        self.assertCached(f'/books/api/authors/{self.author.pk}/', 'Фамилия')
+        self.author.surname = 'Другая'
+        self.author.save()
+        self.assertContains(self.client.get(f'/books/{self.book.pk}/'), 'Имя Другая')
+        self.assertContains(self.client.get(f'/books/api/authors/{self.author.pk}/'), 'Другая')
+
+    def test_conditional_get(self):
+        url = f'/books/{self.book.pk}/'
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.book.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class CatalogueImportTests(TestCase):
+    '''
+    Массовый импорт книг: авторы без повторов, пачки, ошибки записей, поисковый индекс
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(name='Лев', surname='Толстой', year_of_birth=1828)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_authors_and_batches(self):
+        records = [
+            {'name': 'Война и мир', 'year': 1869, 'author_name': 'лев', 'author_surname': 'ТОЛСТОЙ'},
+            {'name': 'Анна Каренина', 'year': '1877', 'author_id': self.author.pk},
+            {'name': 'Палата № 6', 'year': 1892, 'author_name': 'Антон', 'author_surname': 'Чехов'},
+            {'name': 'Чайка', 'year': 1896, 'author_name': 'Антон', 'author_surname': 'Чехов',
+             'author_year_of_birth': 1860},
+            {'name': '', 'year': 1900, 'author_id': self.author.pk},
+            {'name': 'Без года', 'author_id': self.author.pk},
+            {'name': 'Будущее', 'year': 3000, 'author_id': self.author.pk},
+            {'name': 'Без автора', 'year': 1900},
+            {'_error': 'line 9: invalid JSON'},
+        ]
+        batches = []
+        stats = CatalogueImporter(batch_size=2, progress=lambda stats: batches.append(stats.books)).run(records)
+        self.assertEqual((stats.books, stats.authors, len(stats.errors)), (4, 1, 5))
+        self.assertEqual(batches, [2, 4])
+        self.assertEqual(Author.objects.filter(surname='Чехов').count(), 1)
+        self.assertEqual(Book.custom.filter(author=self.author).count(), 2)
+        self.assertEqual(sorted(book.name for book in search.search_books(Book.custom.all(), 'чехов')),
+                         ['Палата № 6', 'Чайка'])
+        self.assertEqual([error.split(':')[0] for error in stats.errors],
+                         [f'record {number}' for number in range(5, 10)])
+
+    def test_jsonl_lines(self):
+        lines = ['{"name": "Книга", "year": 1900, "author_id": %d}\n' % self.author.pk, '\n', 'не JSON\n']
+        stats = CatalogueImporter().run(read_records(iter(lines), 'jsonl'))
+        self.assertEqual((stats.books, stats.errors), (1, ['record 2: line 3: invalid JSON']))
+
+    def test_api_endpoint(self):
+        body = 'name,year,author_name,author_surname\nВоскресение,1899,Лев,Толстой\n'
+        admin = Client()
+        admin.force_login(User.objects.create_user('reader'))
+        self.assertEqual(admin.post('/books/api/books/bulk/', body, content_type='text/csv').status_code, 403)
+        admin.force_login(User.objects.create_user('admin', is_staff=True))
+        self.assertNotContains(self.client.get('/books/'), 'Воскресение')
+        response = admin.post('/books/api/books/bulk/', body, content_type='text/csv')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.json()['books'], response.json()['authors']), (1, 0))
+        # Импорт идет в обход сигналов, но кешированный список для анонимных посетителей сбрасывается
+        self.assertContains(self.client.get('/books/'), 'Воскресение')
+        response = admin.post('/books/api/books/bulk/', 'name,year\n,1\n', content_type='text/csv')
+        self.assertEqual(response.status_code, 400)
+        # Тело не в UTF-8 - ошибка импорта, а не 500
+        response = admin.post('/books/api/books/bulk/', 'name,year\nКнига,1900\n'.encode('cp1251'), content_type='text/csv')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual((response.json()['books'], response.json()['error_count']), (0, 1))
+        self.assertIn('UTF-8', response.json()['errors'][0])
+
+
+class ReplicaRoutingTests(TestCase):
+    '''
+    Чтения разрешенных view идут на реплику, записи и чтения в транзакциях - в default,
+    после записи сессия закрепляется за default
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(name='Имя', surname='Фамилия', year_of_birth=1900)
+        cls.book = Book.custom.create(name='Книга', author=author, year=2000, description='')
+        cls.user = User.objects.create_user('reader', password='password')
+        Visitor.objects.create(user=cls.user, name='Читатель')
+
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(DATABASE_REPLICAS=['replica1'])
+    def test_router(self):
+        # Транзакция, в которую TestCase оборачивает тест, сама отправила бы все чтения в default
+        outside_transaction = mock.patch.object(connections['default'], 'in_atomic_block', False)
+        with outside_transaction:
+            self.assertEqual(Book.custom.all().db, 'default')
+        token = replica_reads.set(True)
+        try:
+            with outside_transaction:
+                self.assertEqual(Book.custom.all().db, 'replica1')
+                self.assertEqual(router.db_for_write(Book), 'default')
+                self.assertTrue(primary_written.get())
+                with override_settings(DATABASE_REPLICAS=[]):
+                    self.assertEqual(Book.custom.all().db, 'default')
+            # Внутри транзакции чтения видят свои записи только в default
+            self.assertEqual(Book.custom.all().db, 'default')
+        finally:
+            replica_reads.reset(token)
+            primary_written.set(False)
+
+    def reads(self, method: str, url: str, **kwargs) -> tuple:
+        '''
+        Значение replica_reads при каждом SELECT запроса и ответ
+        '''
+        seen = []
+
+        def record(execute, sql, params, many, context):
+            if sql.lstrip().upper().startswith('SELECT'):
+                seen.append(replica_reads.get())
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            response = getattr(self.client, method)(url, **kwargs)
+        self.assertFalse(replica_reads.get())
+        return set(seen), response
+
+    def test_request_scope(self):
+        self.assertEqual(self.reads('get', '/books/')[0], {True})
+        self.assertEqual(self.reads('get', '/books/api/books/')[0], {True})
+
+        self.client.login(username='reader', password='password')
+        self.assertEqual(self.reads('get', f'/books/{self.book.pk}/update/')[0], {False})
+        seen, response = self.reads('post', '/books/rating/', data={'book_id': self.book.pk, 'rate': 5})
+        self.assertEqual((seen, response.json()['status']), ({False}, 'created'))
+        self.assertIn(PIN_COOKIE, response.cookies)
+        # Read-your-writes: пока жива cookie, разрешенные view тоже читают из default
+        self.assertEqual(self.reads('get', '/books/')[0], {False})
+        del self.client.cookies[PIN_COOKIE]
+        self.assertEqual(self.reads('get', '/books/')[0], {True})
+
+
+class DatasetBenchmarkTests(TestCase):
+    '''
+    Синтетический каталог согласован (деревья MPTT, агрегаты, индекс), а сценарии бенчмарка на нем отвечают 200
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        size = DatasetSize(authors=5, books=40, visitors=10, ratings_per_book=3, comment_trees_per_book=2,
+                           comment_depth=4, comment_branching=2, commented_books=0.25)
+        cls.counts = DatasetGenerator(size, seed=7, batch_size=16).run()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_counts_and_aggregates(self):
+        self.assertEqual({label: self.counts[label] for label in ('authors', 'books', 'users', 'visitors')},
+                         {'authors': 5, 'books': 40, 'users': 10, 'visitors': 10})
+        self.assertEqual(self.counts['ratings'], BookRate.objects.count())
+        self.assertEqual(Book.rebuild_ratings(), 0)
+        self.assertEqual(Visitor.rebuild_stats(), 0)
+        word = Book.custom.first().name.split()[0]
+        self.assertTrue(search.search_books(Book.custom.all(), word).exists())
+
+    def test_comment_trees(self):
+        self.assertEqual(Comment.objects.filter(level=0).count(), 10 * 2)
+        nodes = {node.pk: node for node in Comment.objects.all()}
+        self.assertEqual(len(nodes), self.counts['comments'])
+        for node in nodes.values():
+            if node.parent_id is None:
+                self.assertEqual((node.level, node.lft), (0, 1))
+                continue
+            parent = nodes[node.parent_id]
+            self.assertEqual((node.tree_id, node.book_id, node.level), (parent.tree_id, parent.book_id, parent.level + 1))
+            self.assertTrue(parent.lft < node.lft < node.rght < parent.rght)
+        for root in (node for node in nodes.values() if node.level == 0):
+            tree = [node for node in nodes.values() if node.tree_id == root.tree_id]
+            self.assertEqual(root.rght, 2 * len(tree))
+
+    def test_scenarios(self):
+        suite = benchmark.scenarios(sample=3, seed=1)
+        self.assertIn('html.comment_window', suite)
+        for name, paths in suite.items():
+            for path in paths:
+                with self.subTest(scenario=name, path=path):
+                    self.assertEqual(self.client.get(path).status_code, 200)
+
+    def test_compare(self):
+        baseline = {'api.books_list': {'rps': 100, 'p50_ms': 10, 'p95_ms': 20, 'errors': 0}}
+        current = {'api.books_list': {'rps': 85, 'p50_ms': 10.5, 'p95_ms': 20, 'errors': 2}}
+        rows = benchmark.compare(baseline, current, threshold=0.1)
+        self.assertEqual([(row['metric'], row['regression']) for row in rows],
+                         [('rps', True), ('p50_ms', False), ('p95_ms', False), ('errors', True)])
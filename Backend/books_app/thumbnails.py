@@ -0,0 +1,103 @@
+'''
+Уменьшенные копии изображений книг (WebP и JPEG нескольких фиксированных ширин).
+Копии строятся фоновой задачей "thumbnails.build" (books_app.tasks), поэтому запрос не ждет обработки.
+Файлы копий именуются по хешу содержимого оригинала - одинаковые обложки обрабатываются один раз,
+а уже построенные копии повторно не пересчитываются.
+'''
+import hashlib
+import io
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from books_app import storage
+
+WIDTHS = tuple(getattr(settings, 'THUMBNAIL_WIDTHS', (160, 320, 640)))
+FORMATS = {'webp': ('WEBP', {'quality': 80, 'method': 4}), 'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True})}
+DIRECTORY = 'thumbnails'
+
+
+def rendition_name(content_hash: str, width: int, fmt: str) -> str:
+    ext = 'jpg' if fmt == 'jpeg' else fmt
+    return f'{DIRECTORY}/{content_hash[:2]}/{content_hash}-{width}.{ext}'
+
+
+def available_widths(image_width: int) -> list:
+    '''
+    Ширины копий для оригинала заданной ширины (копии не бывают больше оригинала)
+    '''
+    return [width for width in WIDTHS if width < image_width] if image_width else []
+
+
+def srcset(content_hash: str, image_width: int, fmt: str) -> str:
+    return ', '.join(
+        f'{default_storage.url(rendition_name(content_hash, width, fmt))} {width}w'
+        for width in available_widths(image_width)
+    )
+
+
+def file_hash(field_file) -> str:
+    digest = hashlib.sha256()
+    field_file.open('rb')
+    try:
+        for chunk in field_file.chunks():
+            digest.update(chunk)
+    finally:
+        field_file.close()
+    return digest.hexdigest()
+
+
+def render(original: Image.Image, width: int, fmt: str) -> bytes:
+    height = max(1, round(original.height * width / original.width))
+    resized = original.resize((width, height), Image.LANCZOS)
+    if fmt == 'jpeg' and resized.mode != 'RGB':
+        resized = resized.convert('RGB')
+    elif fmt == 'webp' and resized.mode not in ('RGB', 'RGBA'):
+        resized = resized.convert('RGBA')
+    pil_format, options = FORMATS[fmt]
+    output = io.BytesIO()
+    resized.save(output, pil_format, **options)
+    return output.getvalue()
+
+
+def build_renditions(image) -> tuple:
+    '''
+    Построение недостающих копий для экземпляра Images. Возвращает (хеш, ширина оригинала).
+    Хеш файлов из хранилища с адресацией по содержимому берется из имени, остальные файлы читаются целиком.
+    '''
+    content_hash = storage.content_hash(image.image.name) or file_hash(image.image)
+    image.image.open('rb')
+    try:
+        original = ImageOps.exif_transpose(Image.open(image.image))
+        original.load()
+    finally:
+        image.image.close()
+    for width in available_widths(original.width):
+        for fmt in FORMATS:
+            name = rendition_name(content_hash, width, fmt)
+            if not default_storage.exists(name):
+                default_storage.save(name, ContentFile(render(original, width, fmt)))
+    return content_hash, original.width
+
+
+def process(image_id) -> None:
+    '''
+    Построение копий для Images и запись хеша; ошибки пробрасываются, чтобы очередь повторила задачу
+    '''
+    from books_app import response_cache
+    from books_app.models import Images
+
+    image = Images.objects.filter(pk=image_id).first()
+    if image is None or not image.image:
+        return
+    content_hash, width = build_renditions(image)
+    Images.objects.filter(pk=image_id, image=image.image.name).update(content_hash=content_hash, image_width=width)
+    response_cache.invalidate_book(image.book_id, catalogue=False)
+
+
+def delete_renditions(content_hash: str) -> None:
+    for width in WIDTHS:
+        for fmt in FORMATS:
+            default_storage.delete(rendition_name(content_hash, width, fmt))
@@ -9,19 +9,44 @@ from .views import (
     VisitorUpdateView,
     MyLogoutView,
     BookListView,
+    TopRatedView,
+    DiscussedView,
     BookDetailsView,
+    BookImagesView,
     BookCreateView,
+    AuthorLookupView,
     BookUpdateView,
     BookDeleteView,
     CommentCreateView,
+    CommentWindowView,
+    CommentSubtreeView,
     RatingCreateView,
+    RatingBatchView,
     SearchResultsView,
+    ExportView,
+    MetricsView,
     BookViewSet,
     AuthorViewSet,
 )
+from .async_views import (
+    AsyncBookListView,
+    AsyncBookDetailsView,
+    AsyncSearchResultsView,
+    AsyncRatingCreateView,
+    AsyncCommentCreateView,
+    AsyncCommentWindowView,
+)
 
 app_name = "books_app"
 
+# Под ASGI нагруженные на чтение страницы и AJAX-запросы обслуживают асинхронные view
+BookList = AsyncBookListView if settings.ASYNC_VIEWS else BookListView
+BookDetails = AsyncBookDetailsView if settings.ASYNC_VIEWS else BookDetailsView
+SearchResults = AsyncSearchResultsView if settings.ASYNC_VIEWS else SearchResultsView
+RatingCreate = AsyncRatingCreateView if settings.ASYNC_VIEWS else RatingCreateView
+CommentCreate = AsyncCommentCreateView if settings.ASYNC_VIEWS else CommentCreateView
+CommentWindow = AsyncCommentWindowView if settings.ASYNC_VIEWS else CommentWindowView
+
 router = DefaultRouter()
 router.register("books", BookViewSet)
 router.register("authors", AuthorViewSet)
@@ -32,14 +57,23 @@ urlpatterns = [
     path('logout/', MyLogoutView.as_view(), name='logout'),
     path('users/<int:pk>/', VisitorDetailsView.as_view(), name='visitor_details'),
     path('users/<int:pk>/update/', VisitorUpdateView.as_view(), name='visitor_update'),
-    path('', BookListView.as_view(), name='books_list'),
-    path('<int:pk>/', BookDetailsView.as_view(), name='book_details'),
+    path('', BookList.as_view(), name='books_list'),
+    path('top/', TopRatedView.as_view(), name='top_rated'),
+    path('discussed/', DiscussedView.as_view(), name='discussed'),
+    path('<int:pk>/', BookDetails.as_view(), name='book_details'),
+    path('<int:pk>/images/', BookImagesView.as_view(), name='book_images'),
     path('create/', BookCreateView.as_view(), name='book_add'),
+    path('authors/lookup/', AuthorLookupView.as_view(), name='author_lookup'),
     path('<int:pk>/update/', BookUpdateView.as_view(), name='book_update'),
     path('<int:pk>/delete/', BookDeleteView.as_view(), name='book_delete'),
-    path('<int:pk>/comments/', CommentCreateView.as_view(), name='comment_create'),
-    path('rating/', RatingCreateView.as_view(), name='rating'),
-    path('search/', SearchResultsView.as_view(), name='search'),
+    path('<int:pk>/comments/', CommentCreate.as_view(), name='comment_create'),
+    path('<int:pk>/comments/window/', CommentWindow.as_view(), name='comment_window'),
+    path('<int:pk>/comments/<int:comment_pk>/', CommentSubtreeView.as_view(), name='comment_subtree'),
+    path('rating/', RatingCreate.as_view(), name='rating'),
+    path('rating/batch/', RatingBatchView.as_view(), name='rating_batch'),
+    path('search/', SearchResults.as_view(), name='search'),
+    path('api/export/<str:dataset>/', ExportView.as_view(), name='export'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('api/', include(router.urls)),
 ]
 
@@ -1,20 +1,33 @@
+import json
+
+from django.conf import settings
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.mixins import UserPassesTestMixin, LoginRequiredMixin
 from django.contrib.auth.views import LogoutView
-from django.http import HttpRequest, HttpResponse, JsonResponse
-from django.shortcuts import render, redirect
+from django.core.exceptions import ValidationError
+from django.http import Http404, HttpRequest, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render, redirect
 from django.urls import reverse_lazy, reverse
+from django.utils.crypto import constant_time_compare
 from django.views import View
 from django.views.generic import CreateView, DetailView, UpdateView, ListView, DeleteView
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
-from books_app.forms import BookWithFileForm, VisitorUpdateForm, BookUpdateForm, CommentCreateForm
+from books_app import comments, exporter, jobs, metrics, rankings, response_cache
+from books_app.forms import BookWithFileForm, VisitorUpdateForm, BookUpdateForm, CommentCreateForm, RatingForm
 from books_app.models import Author, Book, Visitor, Images, Comment, BookRate
+from books_app.importer import CatalogueImporter, decode_lines, read_records
+from books_app.pagination import InvalidCursor, KeysetListMixin, page_link, paginate
+from books_app.response_cache import CachedResponseMixin
+from books_app.search import BookSearchFilter, search_books
 from books_app.serializers import AuthorSerializer, BookSerializer
 from extra_views import UpdateWithInlinesView, InlineFormSetFactory
-from django.db.models import Q
+from django.db import transaction
 
 
 class RegisterView(CreateView):
@@ -36,12 +49,42 @@ class RegisterView(CreateView):
 
 class VisitorDetailsView(DetailView):
     '''
-    Класс для детальной информации о пользователе
+    Класс для детальной информации о пользователе: счетчики активности, гистограмма оценок
+    и последние оценки и комментарии. Итоги берутся из счетчиков посетителя, а списки - по индексам
+    (visitor, rated_at) и (visitor, published_at) с keyset-пагинацией, у каждого списка свой курсор,
+    поэтому страница активного читателя открывается так же быстро, как страница нового.
     '''
     template_name = 'books_app/visitor_details.html'
     model = Visitor
     context_object_name = 'visitor'
     queryset = model.objects.all().select_related('user')
+    activity_page_size = 10
+    query_budget = 6
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        visitor = self.object
+        activity = {
+            'ratings': (visitor.ratings_count, ['-rated_at', '-pk'],
+                        BookRate.objects.filter(visitor=visitor).select_related('book')
+                        .only('rate', 'rated_at', 'book__name')),
+            'comments': (visitor.comments_count, ['-published_at', '-pk'],
+                         Comment.objects.filter(visitor=visitor).select_related('book')
+                         .only('comment', 'published_at', 'book__name')),
+        }
+        for name, (total, ordering, queryset) in activity.items():
+            # По счетчику: у посетителя без оценок или комментариев список не запрашивается
+            if not total:
+                continue
+            param = f'{name}_cursor'
+            try:
+                page = paginate(queryset, ordering, self.request.GET.get(param), self.activity_page_size)
+            except InvalidCursor:
+                raise Http404('Invalid cursor')
+            context[f'{name}_page'] = page
+            context[f'{name}_next'] = page_link(self.request.GET, page.next_cursor, param)
+            context[f'{name}_previous'] = page_link(self.request.GET, page.previous_cursor, param)
+        return context
 
 
 class VisitorUpdateView(UserPassesTestMixin, UpdateView):
@@ -66,35 +109,86 @@ class MyLogoutView(LogoutView):
     next_page = reverse_lazy('books_app:login')
 
 
-class BookDetailsView(DetailView):
+class BookDetailsView(CachedResponseMixin, DetailView):
     '''
-    Класс для детальной информации о книге
+    Класс для детальной информации о книге (для анонимных посетителей ответ кешируется по версии книги).
+    Страница - только книга, автор и рейтинг; изображения и комментарии подгружаются фрагментами
+    (BookImagesView, CommentWindowView), поэтому время ответа не зависит от размера обсуждения.
     '''
     model = Book
     template_name = 'books_app/book_details.html'
     context_object_name = 'book'
     queryset = model.custom.detail()
+    replica_reads = True
+    query_budget = 4
+
+    def get_cache_tokens(self):
+        return (response_cache.book_token(self.kwargs['pk']),)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['images'] = Images.objects.filter(book=self.object.pk)
         context['form'] = CommentCreateForm
         return context
 
 
-class BookListView(ListView):
+class BookImagesView(CachedResponseMixin, View):
     '''
-    Класс для вывода списка книг по 3шт на странице
+    HTML-фрагмент с галереей изображений книги
+    '''
+    cache_anonymous_only = False
+    replica_reads = True
+    query_budget = 1
+
+    def get_cache_tokens(self):
+        return (response_cache.book_token(self.kwargs['pk']),)
+
+    def get(self, request: HttpRequest, pk: int) -> HttpResponse:
+        images = Images.objects.filter(book=pk).select_related('book')
+        return render(request, 'books_app/book_images.html', {'images': images})
+
+
+class BookListView(CachedResponseMixin, KeysetListMixin, ListView):
+    '''
+    Класс для вывода списка книг с keyset-пагинацией (размер страницы - settings.BOOKS_PAGE_SIZE)
     '''
     template_name = 'books_app/books_list.html'
     context_object_name = 'object_list'
     model = Book
     queryset = Book.custom.all()
-    paginate_by = 3
+    paginate_by = settings.BOOKS_PAGE_SIZE
+    replica_reads = True
+    query_budget = 4
+    title = 'Главная страница'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['title'] = 'Главная страница'
+        context['title'] = self.title
+        return context
+
+
+class TopRatedView(BookListView):
+    '''
+    Лучшие книги по байесовской оценке (см. books_app.rankings)
+    '''
+    queryset = rankings.top_rated()
+    ordering = rankings.TOP_RATED_ORDERING
+    title = 'Лучшие книги'
+
+
+class DiscussedView(BookListView):
+    '''
+    Книги, которые больше всего комментировали за последние RANKING_DISCUSSED_DAYS дней
+    '''
+    queryset = rankings.most_discussed()
+    ordering = rankings.DISCUSSED_ORDERING
+    title = 'Обсуждаемые книги'
+
+    def get_cache_tokens(self):
+        return (response_cache.CATALOGUE, response_cache.DISCUSSIONS)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['discussed_days'] = rankings.DISCUSSED_DAYS
         return context
 
 
@@ -102,6 +196,7 @@ class BookCreateView(LoginRequiredMixin, View):
     '''
     Класс для создания книги
     '''
+    query_budget = 4
     def get(self, request: HttpRequest) -> HttpResponse:
         form = BookWithFileForm()
         context = {"form": form}
@@ -109,23 +204,41 @@ class BookCreateView(LoginRequiredMixin, View):
 
     def post(self, request: HttpRequest):
         form = BookWithFileForm(request.POST, request.FILES)
-        if form.is_valid():
-            author = Author.objects.get(pk=request.POST["author"])
+        if not form.is_valid():
+            return render(request, 'books_app/book_add.html', context={"form": form})
+        with transaction.atomic():
             book = Book.custom.create(
-                name=request.POST["name"],
-                author=author,
-                description=request.POST["description"],
-                year=request.POST["year"],
+                name=form.cleaned_data["name"],
+                author=form.cleaned_data["author"],
+                description=form.cleaned_data["description"],
+                year=form.cleaned_data["year"],
             )
-            book.save()
 
+            # Файлы только сохраняются, уменьшенные копии строит фоновая задача после коммита
             images = request.FILES.getlist("images")
             for image in images:
-                added_photo = Images.objects.create(image=image, book=book)
-                added_photo.save()
+                Images.objects.create(image=image, book=book)
+
+        url = reverse('books_app:books_list')
+        return redirect(url)
+
+
+class AuthorLookupView(CachedResponseMixin, View):
+    '''
+    Подсказка авторов для поля "Автор" форм книги: ?q=начало фамилии или имени (см. Author.prefix_lookup).
+    Регистр учитывается частично: ищутся введенное, с заглавной буквы и прописными, поэтому "mcc"
+    не находит McCarthy
+    '''
+    cache_anonymous_only = False
+    replica_reads = True
+    query_budget = 2
+    limit = 10
 
-            url = reverse('books_app:books_list')
-            return redirect(url)
+    def get(self, request: HttpRequest) -> JsonResponse:
+        authors = Author.prefix_lookup(request.GET.get('q', '')[:50], self.limit)
+        return JsonResponse({'results': [
+            {'id': author.pk, 'text': author.lookup_label} for author in authors
+        ]})
 
 
 class ImageInline(InlineFormSetFactory):
@@ -144,6 +257,7 @@ class BookUpdateView(LoginRequiredMixin, UpdateWithInlinesView):
     form_class = BookUpdateForm
     inlines = [ImageInline]
     template_name_suffix = '_update_form'
+    query_budget = 5
 
     def get_success_url(self):
         return reverse(
@@ -160,6 +274,7 @@ class BookDeleteView(LoginRequiredMixin, DeleteView):
     success_url = reverse_lazy('books_app:books_list')
     context_object_name = 'book'
     template_name = 'books_app/book_delete.html'
+    query_budget = 14
 
 
 class CommentCreateView(LoginRequiredMixin, CreateView):
@@ -168,6 +283,7 @@ class CommentCreateView(LoginRequiredMixin, CreateView):
     '''
     model = Comment
     form_class = CommentCreateForm
+    query_budget = 8
 
     def is_ajax(self):
         return self.request.headers.get('X-Requested-With') == 'XMLHttpRequest'
@@ -175,92 +291,262 @@ class CommentCreateView(LoginRequiredMixin, CreateView):
     def form_invalid(self, form):
         if self.is_ajax():
             return JsonResponse({'error': form.errors}, status=400)
-        return super().form_invalid(form)
+        # Своего шаблона у формы нет: страница книги отрисовывается заново с ошибками формы
+        book = get_object_or_404(Book.custom.detail(), pk=self.kwargs['pk'])
+        return render(self.request, 'books_app/book_details.html', {'book': book, 'object': book, 'form': form},
+                      status=400)
 
     def form_valid(self, form):
         comment = form.save(commit=False)
         comment.book_id = self.kwargs.get('pk')
-        comment.visitor = Visitor.objects.get(user_id=self.request.user.id)
+        if not self.request.visitor:
+            raise Http404('No visitor profile')
+        comment.visitor = self.request.visitor
         comment.parent_id = form.cleaned_data.get('parent')
         comment.save()
 
         if self.is_ajax():
-            return JsonResponse({
-                'is_child': comment.is_child_node(),
-                'id': comment.id,
-                'visitor': comment.visitor.name,
-                'parent_id': comment.parent_id,
-                'published_at': comment.published_at.strftime('%Y-%b-%d %H:%M:%S'),
-                'comment': comment.comment,
-            }, status=200)
+            return JsonResponse(comments.as_json(comment), status=200)
 
-        return redirect(comment.book.get_success_url())
+        return redirect('books_app:book_details', pk=comment.book_id)
 
     def handle_no_permission(self):
         return JsonResponse({'error': 'Необходимо авторизоваться для добавления комментариев'}, status=400)
 
 
+class CommentFragmentMixin(CachedResponseMixin):
+    '''
+    Фрагменты комментариев одинаковы для всех посетителей: кешируются по версии книги
+    (новый или удаленный комментарий ее меняет) и отдаются с ETag
+    '''
+    cache_anonymous_only = False
+    replica_reads = True
+
+    def get_cache_tokens(self):
+        return (response_cache.book_token(self.kwargs['pk']),)
+
+
+class CommentWindowView(CommentFragmentMixin, View):
+    '''
+    HTML-фрагмент со следующим окном корневых веток комментариев книги
+    '''
+    query_budget = 3
+
+    def get(self, request: HttpRequest, pk: int) -> HttpResponse:
+        try:
+            after = int(request.GET.get('after', 0))
+        except ValueError:
+            after = 0
+        return HttpResponse(comments.render_window(pk, after))
+
+
+class CommentSubtreeView(CommentFragmentMixin, View):
+    '''
+    HTML-фрагмент с глубокими ответами на комментарий
+    '''
+    def get(self, request: HttpRequest, pk: int, comment_pk: int) -> HttpResponse:
+        comment = get_object_or_404(Comment, pk=comment_pk, book_id=pk)
+        return HttpResponse(comments.render_subtree(comment))
+
+
 class RatingCreateView(LoginRequiredMixin, View):
     '''
     Класс для выставления оценки для книги, с отрисовкой результата на странице.
     Если повторно выбрать эту оценку - она удалится, если выбрать другую - она изменится на новое значение.
+    Агрегаты рейтинга книги меняются в той же транзакции, что и сама оценка.
     '''
     model = BookRate
-    def post(self, request, *args, **kwargs):
-        book_id = request.POST.get('book_id')
-        rate = int(request.POST.get('rate'))
-        visitor = Visitor.objects.get(user_id=self.request.user.id)
-
-        rating, created = self.model.objects.get_or_create(
-            book_id=book_id,
-            visitor=visitor,
-            defaults={'rate': rate},
-        )
+    query_budget = 9
 
-        if not created:
-            if rating.rate == rate:
-                rating.delete()
-                return JsonResponse({'status': 'deleted',
-                                     'rating_sum': rating.book.get_sum_rating(),
-                                     })
-            else:
-                rating.rate = rate
-                rating.visitor = visitor
-                rating.save()
-                return JsonResponse({'status': 'updated',
-                                     'rating_sum': rating.book.get_sum_rating(),
-                                     })
-        return JsonResponse({'status': 'created',
-                             'rating_sum': rating.book.get_sum_rating(),
+    def post(self, request, *args, **kwargs):
+        form = RatingForm(request.POST)
+        if not form.is_valid():
+            return JsonResponse({'error': form.error_message}, status=400)
+        book_id, rate = form.cleaned_data['book_id'], form.cleaned_data['rate']
+        if not request.visitor:
+            raise Http404('No visitor profile')
+
+        try:
+            status, rating_avg = self.model.toggle(request.visitor.pk, book_id, rate)
+        except Book.DoesNotExist:
+            raise Http404('No such book')
+        return JsonResponse({'status': status,
+                             'rating_sum': rating_avg,
                              })
 
 
-class SearchResultsView(ListView):
+class RatingBatchView(LoginRequiredMixin, View):
+    '''
+    Пакет оценок одним запросом (JSON): {"mode": "toggle"|"set", "votes": [{"book_id": 1, "rate": 5}, ...]}.
+    Все голоса применяются в одной транзакции (см. BookRate.apply_votes), в ответе - статус каждого голоса
+    и новые агрегаты затронутых книг. Сотрудники могут указать в голосе "visitor" (импорт чужих оценок).
     '''
-    Класс для поиска экземпляров книг по полям "Название" и "Автор"
+    model = BookRate
+    query_budget = 11
+
+    def post(self, request, *args, **kwargs):
+        try:
+            payload = json.loads(request.body)
+            mode = payload.get('mode', 'toggle')
+            votes = [(None if vote.get('visitor') is None else int(vote['visitor']), int(vote['book_id']), int(vote['rate']))
+                     for vote in payload['votes']]
+        except (ValueError, TypeError, KeyError, AttributeError):
+            return JsonResponse({'error': 'Ожидается JSON {"votes": [{"book_id": ..., "rate": ...}]}'}, status=400)
+        if len(votes) > settings.RATING_BATCH_LIMIT:
+            return JsonResponse({'error': f'Не больше {settings.RATING_BATCH_LIMIT} оценок за запрос'}, status=400)
+
+        if not request.visitor:
+            raise Http404('No visitor profile')
+        own = request.visitor.pk
+        foreign = {visitor for visitor, _, _ in votes if visitor is not None and visitor != own}
+        if foreign and not request.user.is_staff:
+            return JsonResponse({'error': 'Оценки за других посетителей может выставлять только персонал'}, status=403)
+        if foreign and len(foreign) != Visitor.objects.filter(pk__in=foreign).count():
+            return JsonResponse({'error': 'Неизвестный посетитель'}, status=400)
+        votes = [(own if visitor is None else visitor, book_id, rate) for visitor, book_id, rate in votes]
+
+        try:
+            statuses, aggregates = self.model.apply_votes(votes, mode)
+        except ValueError as error:
+            return JsonResponse({'error': str(error)}, status=400)
+        return JsonResponse({
+            'votes': [{'visitor': visitor, 'book_id': book_id, 'status': status}
+                      for (visitor, book_id), status in statuses.items()],
+            'books': [{'book_id': book_id, 'rating_count': count, 'rating_avg': avg}
+                      for book_id, (count, avg) in aggregates.items()],
+        })
+
+
+class SearchResultsView(KeysetListMixin, ListView):
+    '''
+    Класс для поиска экземпляров книг по названию, автору и описанию (через поисковый индекс, по релевантности).
+    Результаты выводятся страницами по settings.BOOKS_PAGE_SIZE (курсор со смещением, порядок - по релевантности)
     '''
     model = Book
     template_name = 'books_app/books_list.html'
+    paginate_by = settings.BOOKS_PAGE_SIZE
+    replica_reads = True
+    query_budget = 4
 
     def get_queryset(self):
-        query = self.request.GET.get('do')
-        object_list = Book.custom.filter(
-            Q(name__icontains=query) |
-            Q(author__name__icontains=query) |
-            Q(author__surname__icontains=query)
+        query = self.request.GET.get('do', '')
+        return search_books(Book.custom.all(), query)
+
+
+class CachedViewSetMixin(CachedResponseMixin):
+    '''
+    Кеширование list/retrieve для API: JSON-ответы не зависят от пользователя,
+    а browsable API для авторизованных (имя пользователя, CSRF-токен) не кешируется
+    '''
+    cache_anonymous_only = False
+    object_token = None
+    # Версии для списков из дополнительных действий: {действие: токены}; по умолчанию - каталог
+    action_cache_tokens = {}
+
+    def should_cache(self, request):
+        browsable = 'text/html' in request.headers.get('Accept', '') or request.GET.get('format') == 'api'
+        return super().should_cache(request) and not (browsable and request.user.is_authenticated)
+
+    def get_cache_tokens(self):
+        if 'pk' in self.kwargs:
+            return (self.object_token(self.kwargs['pk']),)
+        return self.action_cache_tokens.get(self.action_map.get('get'), (response_cache.CATALOGUE,))
+
+
+class ValuesReadMixin:
+    '''
+    Быстрые list/retrieve для ModelViewSet: строки выбираются через .values() и превращаются в словари
+    представлением сериализатора (SparseFieldsMixin.representation) без создания моделей.
+    Поддерживаются ?fields= и ?expand=; остальные действия работают через обычный сериализатор.
+    '''
+    def list(self, request, *args, **kwargs):
+        return self.values_list_response(request, self.filter_queryset(self.get_queryset()))
+
+    def values_list_response(self, request, queryset):
+        representation = self.get_serializer_class().representation(request)
+        paths = list(representation.paths)
+        if self.paginator is not None:
+            paths += [name.lstrip('-') for name in self.paginator.get_ordering(queryset, request, self)]
+        rows = queryset.values(*dict.fromkeys(paths), *queryset.query.extra_select)
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response([representation(row) for row in rows])
+        return self.get_paginated_response([representation(row) for row in page])
+
+    def retrieve(self, request, *args, **kwargs):
+        representation = self.get_serializer_class().representation(request)
+        lookup = {self.lookup_field: kwargs[self.lookup_url_kwarg or self.lookup_field]}
+        queryset = self.filter_queryset(self.get_queryset())
+        try:
+            row = queryset.filter(**lookup).values(*dict.fromkeys(representation.paths)).first()
+        except (TypeError, ValueError, ValidationError):
+            # Как get_object_or_404 в DRF: нечисловой pk в адресе - 404, а не ошибка сервера
+            row = None
+        if row is None:
+            raise Http404('Not found')
+        return Response(representation(row))
+
+
+class ExportView(UserPassesTestMixin, View):
+    '''
+    Потоковая выгрузка таблицы каталога (только для сотрудников): ?format=jsonl|csv, ?gzip=1
+    '''
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request: HttpRequest, dataset: str) -> StreamingHttpResponse:
+        fmt = request.GET.get('format', 'jsonl')
+        compress = request.GET.get('gzip') == '1'
+        if dataset not in exporter.DATASETS or fmt not in exporter.FORMATS:
+            raise Http404('Unknown dataset or format')
+        response = StreamingHttpResponse(
+            exporter.export(dataset, fmt, compress),
+            content_type='application/gzip' if compress else exporter.content_type(fmt),
         )
-        return object_list
+        filename = f'{dataset}.{fmt}' + ('.gz' if compress else '')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
 
 
-class BookViewSet(ModelViewSet):
+class MetricsView(UserPassesTestMixin, View):
+    '''
+    Метрики запросов по view, кеша ответов и фоновой очереди в текстовом формате Prometheus
+    (для сотрудников, сборщика с токеном settings.METRICS_TOKEN и адресов из settings.METRICS_ALLOWED_IPS)
+    '''
+    def test_func(self):
+        if self.request.user.is_staff or self.request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS:
+            return True
+        scheme, _, token = self.request.headers.get('Authorization', '').partition(' ')
+        return bool(settings.METRICS_TOKEN) and scheme.lower() == 'bearer' \
+            and constant_time_compare(token.strip(), settings.METRICS_TOKEN)
+
+    def get(self, request: HttpRequest) -> HttpResponse:
+        cache_stats = response_cache.stats()
+        queue = jobs.metrics()
+        text = metrics.render_text({
+            'books_response_cache_hits': ('Response cache hits', cache_stats['hits']),
+            'books_response_cache_misses': ('Response cache misses', cache_stats['misses']),
+            'books_jobs_queued': ('Queued background jobs',
+                                  {f'job="{name}"': stats['depth'] for name, stats in queue.items()}),
+            'books_jobs_failed': ('Failed background jobs',
+                                  {f'job="{name}"': stats['failed'] for name, stats in queue.items()}),
+        })
+        return HttpResponse(text, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class BookViewSet(CachedViewSetMixin, ValuesReadMixin, ModelViewSet):
     '''
     Класс для создания API по книгам с различными фильтрами и поисками
     '''
     serializer_class = BookSerializer
     queryset = Book.custom.all()
+    object_token = staticmethod(response_cache.book_token)
+    action_cache_tokens = {'discussed': (response_cache.CATALOGUE, response_cache.DISCUSSIONS)}
+    replica_actions = ('list', 'retrieve', 'top', 'discussed')
+    query_budget = {'list': 3, 'retrieve': 3, 'top': 3, 'discussed': 3}
 
     filter_backends = [
-        SearchFilter,
+        BookSearchFilter,
         DjangoFilterBackend,
         OrderingFilter
     ]
@@ -268,12 +554,50 @@ class BookViewSet(ModelViewSet):
     filterset_fields = ["name", "author", "year", "description"]
     ordering_fields = ["name", "author__name", "author__surname", "year"]
 
-class AuthorViewSet(ModelViewSet):
+    @action(detail=False, filter_backends=[])
+    def top(self, request):
+        '''
+        Лучшие книги по байесовской оценке (сортировка фиксирована, фильтры не применяются)
+        '''
+        return self.values_list_response(request, rankings.top_rated())
+
+    @action(detail=False, filter_backends=[])
+    def discussed(self, request):
+        '''
+        Самые комментируемые книги за последние RANKING_DISCUSSED_DAYS дней
+        '''
+        return self.values_list_response(request, rankings.most_discussed())
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser])
+    def bulk(self, request):
+        '''
+        Массовый импорт: тело запроса - CSV (text/csv) или JSON Lines (application/x-ndjson), читается потоком
+        '''
+        content_type = request.content_type.split(';')[0].strip()
+        fmt = 'csv' if content_type == 'text/csv' else 'jsonl'
+        importer = CatalogueImporter(
+            batch_size=settings.IMPORT_BATCH_SIZE,
+            images_dir=settings.IMPORT_IMAGES_DIR,
+        )
+        try:
+            stats = importer.run(read_records(decode_lines(request.stream), fmt))
+        except UnicodeDecodeError as error:
+            # Поток обрывается на первой строке не в UTF-8; пачки, записанные до нее, остаются
+            stats = importer.stats
+            stats.errors.append(f'input is not valid UTF-8: {error.reason}')
+            if stats.books or stats.authors:
+                response_cache.invalidate_all()
+            return Response(stats.as_dict(), status=400)
+        return Response(stats.as_dict(), status=201 if stats.books else 400)
+
+class AuthorViewSet(CachedViewSetMixin, ValuesReadMixin, ModelViewSet):
     '''
     Класс для создания API по авторам с различными фильтрами и поисками
     '''
     serializer_class = AuthorSerializer
     queryset = Author.objects.all()
+    object_token = staticmethod(response_cache.author_token)
+    query_budget = {'list': 3, 'retrieve': 3}
 
     filter_backends = [
         SearchFilter,
@@ -57,11 +57,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'books_app.middleware.StaticFilesMiddleware',
+    'books_app.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'books_app.auth.VisitorMiddleware',
+    'books_app.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -70,7 +74,8 @@ ROOT_URLCONF = 'mysite.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates с замером времени отрисовки для метрик запросов (books_app.metrics)
+        'BACKEND': 'books_app.metrics.InstrumentedTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -85,18 +90,129 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'mysite.wsgi.application'
+ASGI_APPLICATION = 'mysite.asgi.application'
+
+# Асинхронные версии view для чтения (books_app.async_views); включается автоматически в mysite.asgi
+ASYNC_VIEWS = getenv('DJANGO_ASYNC_VIEWS', '0') == '1'
 
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': DATABASE_DIR / 'db.sqlite3',
+# DJANGO_DB_ENGINE: "sqlite" (по умолчанию) или "postgres" (DJANGO_DB_NAME, DJANGO_DB_USER, DJANGO_DB_PASSWORD,
+# DJANGO_DB_HOST, DJANGO_DB_PORT). Реплики для чтения - DJANGO_DB_REPLICAS через запятую:
+# для postgres "host[:port][/name]", для sqlite пути к файлам. Маршрутизация - books_app.db_routers.
+
+DB_ENGINE = getenv('DJANGO_DB_ENGINE', 'sqlite')
+DB_REPLICAS = [replica.strip() for replica in getenv('DJANGO_DB_REPLICAS', '').split(',') if replica.strip()]
+
+# DJANGO_SQLITE_PROFILE: "default" (настройки SQLite по умолчанию) или "production":
+# WAL, PRAGMA на каждое соединение (books_app.sqlite), постоянные соединения
+# и отдельное соединение только для чтения к тому же файлу
+
+SQLITE_PROFILE = getenv('DJANGO_SQLITE_PROFILE', 'default')
+
+SQLITE_PROFILES = {
+    'default': {},
+    'production': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -int(getenv('DJANGO_SQLITE_CACHE_KB', '65536')),
+        'mmap_size': int(getenv('DJANGO_SQLITE_MMAP_MB', '256')) * 1024 * 1024,
+        'temp_store': 'MEMORY',
+    },
+}
+
+SQLITE_PRAGMAS = SQLITE_PROFILES[SQLITE_PROFILE] if DB_ENGINE == 'sqlite' else {}
+
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': getenv('DJANGO_DB_NAME', 'library'),
+            'USER': getenv('DJANGO_DB_USER', 'library'),
+            'PASSWORD': getenv('DJANGO_DB_PASSWORD', ''),
+            'HOST': getenv('DJANGO_DB_HOST', 'localhost'),
+            'PORT': getenv('DJANGO_DB_PORT', '5432'),
+            'CONN_MAX_AGE': int(getenv('DJANGO_CONN_MAX_AGE', '600')),
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+    for number, replica in enumerate(DB_REPLICAS, 1):
+        address, _, name = replica.partition('/')
+        host, _, port = address.partition(':')
+        DATABASES[f'replica{number}'] = {
+            **DATABASES['default'],
+            'HOST': host or DATABASES['default']['HOST'],
+            'PORT': port or DATABASES['default']['PORT'],
+            'NAME': name or DATABASES['default']['NAME'],
+            'TEST': {'MIRROR': 'default'},
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': DATABASE_DIR / 'db.sqlite3',
+            # Ожидание блокировки записи (сек) вместо немедленной ошибки "database is locked"
+            'OPTIONS': {'timeout': int(getenv('DJANGO_SQLITE_BUSY_TIMEOUT', '20'))},
+        }
     }
+    if SQLITE_PROFILE == 'production':
+        DATABASES['default']['CONN_MAX_AGE'] = int(getenv('DJANGO_CONN_MAX_AGE', '600'))
+        DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+        # Соединение только для чтения к тому же файлу - "реплика" без задержки репликации
+        DB_REPLICAS.insert(0, str(DATABASES['default']['NAME']))
+    for number, path in enumerate(DB_REPLICAS, 1):
+        DATABASES[f'replica{number}'] = {
+            **DATABASES['default'],
+            'NAME': f'file:{path}?mode=ro',
+            'OPTIONS': {**DATABASES['default']['OPTIONS'], 'uri': True},
+            'TEST': {'MIRROR': 'default'},
+        }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['books_app.db_routers.ReplicaRouter']
+
+# Сколько секунд после записи сессия читает только из основной базы
+REPLICA_PIN_SECONDS = int(getenv('DJANGO_REPLICA_PIN_SECONDS', '5'))
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# DJANGO_CACHE_BACKEND: "locmem" (по умолчанию) - кеш в памяти процесса, годится только для одного процесса
+# (runserver, тесты): сброс кеша ответов, сессий и пользователей не доходит до других воркеров и run_jobs;
+# "file" - общий каталог DJANGO_CACHE_DIR для всех процессов (docker-compose монтирует его во все сервисы)
+
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'library-lad',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': getenv('DJANGO_CACHE_DIR', str(BASE_DIR / 'cache')),
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    },
+}
+
+CACHE_BACKEND = getenv('DJANGO_CACHE_BACKEND', 'locmem')
+
+CACHES = {
+    'default': CACHE_BACKENDS[CACHE_BACKEND],
 }
 
+RESPONSE_CACHE_TIMEOUT = int(getenv('DJANGO_RESPONSE_CACHE_TIMEOUT', '600'))
+
+# DJANGO_SESSION_ENGINE: "cached_db" (по умолчанию: чтение из кеша, запись и в кеш, и в БД),
+# "cache" (только кеш - с общим кешем "file", иначе сессия видна одному воркеру) или "db"
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + getenv('DJANGO_SESSION_ENGINE', 'cached_db')
+
+# Пользователь сессии и его посетитель (request.visitor) берутся из кеша (books_app.auth), секунд.
+# С locmem сброс при смене пароля или деактивации в другом процессе не виден, поэтому запись живет недолго
+AUTHENTICATION_BACKENDS = ['books_app.auth.CachedModelBackend']
+AUTH_CACHE_TIMEOUT = int(getenv('DJANGO_AUTH_CACHE_TIMEOUT', '15' if CACHE_BACKEND == 'locmem' else '300'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -135,6 +251,18 @@ USE_TZ = True
 STATIC_ROOT = os.path.join(BASE_DIR, 'static/')
 STATIC_URL = 'static/'
 
+# DJANGO_STATIC_PIPELINE=1: collectstatic пишет файлы с хешем в имени и сжатые копии (.gz, .br),
+# приложение само отдает их из STATIC_ROOT (books_app.staticfiles); нужен collectstatic при сборке образа
+STATIC_PIPELINE = getenv('DJANGO_STATIC_PIPELINE', '0') == '1'
+# Срок кеширования в браузере для статики без хеша в имени, секунд
+STATIC_MAX_AGE = int(getenv('DJANGO_STATIC_MAX_AGE', '60'))
+
+if STATIC_PIPELINE:
+    STORAGES = {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'books_app.staticfiles.CompressedManifestStaticFilesStorage'},
+    }
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -148,12 +276,63 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'templates/src')]
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
 MEDIA_URL = '/media/'
 
+# Отдача MEDIA (books_app.media): DJANGO_MEDIA_ACCEL - пусто (файлы отдает приложение),
+# "x-accel" (nginx: X-Accel-Redirect на internal location DJANGO_MEDIA_ACCEL_PREFIX, смотрящий в MEDIA_ROOT)
+# или "x-sendfile" (Apache mod_xsendfile / lighttpd: X-Sendfile с путем к файлу)
+MEDIA_ACCEL = getenv('DJANGO_MEDIA_ACCEL', '')
+MEDIA_ACCEL_PREFIX = getenv('DJANGO_MEDIA_ACCEL_PREFIX', '/protected-media/')
+# Срок кеширования файлов MEDIA в браузере и прокси, секунд
+MEDIA_MAX_AGE = int(getenv('DJANGO_MEDIA_MAX_AGE', str(60 * 60 * 24 * 30)))
+
+THUMBNAIL_WIDTHS = (160, 320, 640)
+
+# Фоновая очередь задач (books_app.jobs): JOBS_EAGER=1 - выполнять сразу после коммита, без воркера
+JOBS_EAGER = getenv('DJANGO_JOBS_EAGER', '0') == '1'
+
+BOOKS_PAGE_SIZE = int(getenv('DJANGO_PAGE_SIZE', '3'))
+BOOKS_MAX_PAGE_SIZE = int(getenv('DJANGO_MAX_PAGE_SIZE', '100'))
+
 REST_FRAMEWORK = {
-    "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
-    "PAGE_SIZE": 3,
+    "DEFAULT_PAGINATION_CLASS": "books_app.pagination.KeysetPagination",
+    "PAGE_SIZE": BOOKS_PAGE_SIZE,
     "DEFAULT_FILTER_BACKENDS": [
         "django_filters.rest_framework.DjangoFilterBackend"
     ]
 }
 
-LOGLEVEL = getenv('DJANGO_LOGLEVEL', 'info').upper()
\ No newline at end of file
+IMPORT_BATCH_SIZE = int(getenv('DJANGO_IMPORT_BATCH_SIZE', '1000'))
+IMPORT_IMAGES_DIR = getenv('DJANGO_IMPORT_IMAGES_DIR') or None
+
+# Рейтинги (books_app.rankings): лучшие книги - байесовское среднее с априорной оценкой PRIOR_MEAN
+# весом PRIOR_VOTES голосов, в рейтинг входят книги не меньше чем с MIN_VOTES оценками;
+# обсуждаемые - по числу комментариев за последние DISCUSSED_DAYS дней
+RANKING_MIN_VOTES = int(getenv('DJANGO_RANKING_MIN_VOTES', '3'))
+RANKING_PRIOR_VOTES = int(getenv('DJANGO_RANKING_PRIOR_VOTES', '5'))
+RANKING_PRIOR_MEAN = float(getenv('DJANGO_RANKING_PRIOR_MEAN', '3.0'))
+RANKING_DISCUSSED_DAYS = int(getenv('DJANGO_RANKING_DISCUSSED_DAYS', '7'))
+
+# Максимум оценок в одном запросе /books/rating/batch/
+RATING_BATCH_LIMIT = int(getenv('DJANGO_RATING_BATCH_LIMIT', '1000'))
+
+LOGLEVEL = getenv('DJANGO_LOGLEVEL', 'info').upper()
+
+# Доступ к /books/metrics/ без входа под персоналом: токен сборщика метрик (заголовок Authorization: Bearer)
+# и его адреса. За обратным прокси REMOTE_ADDR - адрес прокси, поэтому по умолчанию список пуст.
+METRICS_TOKEN = getenv('DJANGO_METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [ip for ip in getenv('DJANGO_METRICS_ALLOWED_IPS', '').split(',') if ip]
+
+# Строка JSON на каждый запрос в лог books_app.requests (уровень INFO); по умолчанию пишутся
+# только превышения бюджета запросов
+ACCESS_LOG = getenv('DJANGO_ACCESS_LOG', '0') == '1'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'books_app': {'handlers': ['console'], 'level': LOGLEVEL},
+        'books_app.requests': {'level': 'INFO' if ACCESS_LOG else 'WARNING'},
+    },
+}
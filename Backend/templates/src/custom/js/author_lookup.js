@@ -0,0 +1,102 @@
+// Поле "Автор" в формах книги: подсказки приходят с сервера по мере ввода (books_app:author_lookup),
+// выбранный автор записывается в скрытое поле с его pk
+const LOOKUP_DELAY = 250;
+
+function authorLookup(container) {
+  const valueInput = container.querySelector('[data-lookup-value]');
+  const textInput = container.querySelector('[data-lookup-url]');
+  const results = container.querySelector('[data-lookup-results]');
+  let timer = null;
+  let controller = null;
+  let active = -1;
+
+  function close() {
+    results.classList.remove('show');
+    results.innerHTML = '';
+    active = -1;
+  }
+
+  function choose(item) {
+    valueInput.value = item.dataset.id;
+    textInput.value = item.textContent;
+    close();
+  }
+
+  function highlight(index) {
+    const items = results.querySelectorAll('.dropdown-item');
+    if (!items.length) {
+      return;
+    }
+    active = (index + items.length) % items.length;
+    items.forEach((item, position) => item.classList.toggle('active', position === active));
+  }
+
+  async function search(text) {
+    if (controller) {
+      controller.abort();
+    }
+    controller = new AbortController();
+    const url = `${textInput.dataset.lookupUrl}?q=${encodeURIComponent(text)}`;
+    try {
+      const response = await fetch(url, {signal: controller.signal, headers: {'X-Requested-With': 'XMLHttpRequest'}});
+      const data = await response.json();
+      results.innerHTML = '';
+      data.results.forEach(author => {
+        const item = document.createElement('li');
+        item.className = 'dropdown-item';
+        item.dataset.id = author.id;
+        item.textContent = author.text;
+        results.append(item);
+      });
+      active = -1;
+      results.classList.toggle('show', data.results.length > 0);
+    }
+    catch (error) {
+      if (error.name !== 'AbortError') {
+        console.log(error)
+      }
+    }
+  }
+
+  textInput.addEventListener('input', () => {
+    // Текст изменен - прежний выбор больше не действует, пока не выбран новый автор
+    valueInput.value = '';
+    clearTimeout(timer);
+    const text = textInput.value.trim();
+    if (!text) {
+      close();
+      return;
+    }
+    timer = setTimeout(() => search(text), LOOKUP_DELAY);
+  });
+
+  textInput.addEventListener('keydown', event => {
+    if (!results.classList.contains('show')) {
+      return;
+    }
+    if (event.key === 'ArrowDown' || event.key === 'ArrowUp') {
+      event.preventDefault();
+      highlight(active + (event.key === 'ArrowDown' ? 1 : -1));
+    }
+    else if (event.key === 'Enter' && active >= 0) {
+      event.preventDefault();
+      choose(results.querySelectorAll('.dropdown-item')[active]);
+    }
+    else if (event.key === 'Escape') {
+      close();
+    }
+  });
+
+  // mousedown срабатывает раньше blur, поэтому выбор не теряется при закрытии списка
+  results.addEventListener('mousedown', event => {
+    const item = event.target.closest('.dropdown-item');
+    if (item) {
+      event.preventDefault();
+      choose(item);
+    }
+  });
+
+  textInput.addEventListener('blur', close);
+}
+
+document.querySelectorAll('[data-author-lookup]').forEach(authorLookup);
@@ -1,22 +1,74 @@
-const commentForm = document.forms.commentForm;
-const commentFormComment = commentForm.comment;
-const commentFormParentInput = commentForm.parent;
-const commentFormSubmit = commentForm.commentSubmit;
-const commentBookId = commentForm.getAttribute('data-book-id');
+// Страница книги отдается без изображений и комментариев: фрагменты из data-fragment
+// подгружаются, когда блок приближается к видимой области
+async function loadFragment(container) {
+  try {
+    const response = await fetch(container.dataset.fragment, {headers: {'X-Requested-With': 'XMLHttpRequest'}});
+    if (response.ok) {
+      container.insertAdjacentHTML('afterbegin', await response.text());
+    }
+  }
+  catch (error) {
+    console.log(error)
+  }
+}
+
+const fragments = document.querySelectorAll('[data-fragment]');
+if ('IntersectionObserver' in window) {
+  const fragmentObserver = new IntersectionObserver(entries => {
+    entries.filter(entry => entry.isIntersecting).forEach(entry => {
+      fragmentObserver.unobserve(entry.target);
+      loadFragment(entry.target);
+    });
+  }, {rootMargin: '200px'});
+  fragments.forEach(container => fragmentObserver.observe(container));
+}
+else {
+  fragments.forEach(loadFragment);
+}
 
-commentForm.addEventListener('submit', createComment);
+// Подгрузка следующих веток и глубоких ответов по ссылкам "Показать ..."
+document.querySelector('.nested-comments').addEventListener('click', async event => {
+  const link = event.target.closest('.comments-more');
+  if (!link) {
+    return;
+  }
+  event.preventDefault();
+  link.classList.add('disabled');
+  try {
+    const response = await fetch(link.href, {headers: {'X-Requested-With': 'XMLHttpRequest'}});
+    link.insertAdjacentHTML('afterend', await response.text());
+    link.remove();
+  }
+  catch (error) {
+    link.classList.remove('disabled');
+    console.log(error)
+  }
+});
 
-replyUser()
+// Форма есть только у авторизованных посетителей
+const commentForm = document.forms.commentForm;
+const commentFormComment = commentForm && commentForm.comment;
+const commentFormParentInput = commentForm && commentForm.parent;
+const commentFormSubmit = commentForm && commentForm.commentSubmit;
+const commentBookId = commentForm && commentForm.getAttribute('data-book-id');
 
-function replyUser() {
-  document.querySelectorAll('.btn-reply').forEach(e => {
-    e.addEventListener('click', replyComment);
+if (commentForm) {
+  commentForm.addEventListener('submit', createComment);
+}
+
+// Кнопки "Ответить" всех веток (и подгруженных позже) обслуживает один обработчик на блоке комментариев
+if (commentForm) {
+  document.querySelector('.nested-comments').addEventListener('click', event => {
+    const button = event.target.closest('.btn-reply');
+    if (button) {
+      replyComment(button);
+    }
   });
 }
 
-function replyComment() {
-  const commentUsername = this.getAttribute('data-comment-username');
-  const commentMessageId = this.getAttribute('data-comment-id');
+function replyComment(button) {
+  const commentUsername = button.getAttribute('data-comment-username');
+  const commentMessageId = button.getAttribute('data-comment-id');
   commentFormComment.value = `${commentUsername}, `;
   commentFormParentInput.value = commentMessageId;
 }
@@ -54,8 +106,9 @@ async function createComment(event) {
                                     </div>
                                 </li>
                             </ul>`;
-        if (comment.is_child) {
-            document.querySelector(`#comment-thread-${comment.parent_id}`).insertAdjacentHTML("beforeend", commentTemplate);
+        const parentThread = comment.is_child && document.querySelector(`#comment-thread-${comment.parent_id}`);
+        if (parentThread) {
+            parentThread.insertAdjacentHTML("beforeend", commentTemplate);
         }
         else {
             document.querySelector('.nested-comments').insertAdjacentHTML("beforeend", commentTemplate)
@@ -64,7 +117,6 @@ async function createComment(event) {
         commentFormSubmit.disabled = false;
         commentFormSubmit.innerText = "Добавить комментарий";
         commentFormParentInput.value = null;
-        replyUser();
     }
     catch (error) {
         console.log(error)